@@ -0,0 +1,124 @@
+# analysis_worker.py
+# pool of background analysis workers: takes synthesis jobs queued by /validate-voice and runs world.experiment on them
+
+# python/third-party libraries
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+# helpers
+from scripts.jobs import JobQueue
+
+# Add the 'perception-evaluation-framework' directory to the Python search path
+framework_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(framework_path)
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# setup
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+env = 'production' # 'production' vs. 'sandbox'
+analysis_processes = 2
+job_poll_interval = 1.0
+polly_tps = 8.0
+polly_max_concurrency = 4
+polly_backend = 'aws'
+local_polly_options = {}
+f0_profiles = {}
+boot_mode = 'preload'
+synthesis_cache_report_every = 100
+f0_pool_processes = None
+
+with open("app_config.txt", "r+") as config:
+	for line in config:
+		exec(line)
+
+
+## run one analysis worker
+# claims jobs from the queue until killed; each job runs experiment.main for one worker's recording.
+# failed jobs are retried by the queue with backoff, up to the job's max_attempts.
+# polly_rate is this process's share of the account's Polly TPS quota; workers is the number of worker processes,
+# which split the CPUs between their chunked F0 pools unless f0_pool_processes sets the pool size.
+def work(db_path, poll_interval, polly_rate, workers):
+	from world import experiment, f0, polly_service, synthesis_cache, text_plan
+
+	polly_service.configure(rate=polly_rate, max_concurrency=polly_max_concurrency)
+	f0.configure_pool(f0_pool_processes, workers)
+	if polly_backend == 'local':
+		from world.local_polly import LocalPollyClient
+		polly_service.configure(client=LocalPollyClient(**local_polly_options))
+		# keep stub audio out of the real synthesis cache, which is keyed by SSML, voice and format only
+		experiment.SYNTHESIS_CACHE_DIR = experiment.STUB_SYNTHESIS_CACHE_DIR
+	text_plan.compile_responses([experiment.generate_response()])
+	queue = JobQueue(db_path)
+	print('analysis worker %d: waiting for jobs in %s' % (os.getpid(), db_path))
+	done = 0
+	while True:
+		job = queue.claim()
+		if job is None:
+			time.sleep(poll_interval)
+			continue
+
+		payload = job['payload']
+		print('analysis worker %d: job %s (attempt %d of %d)' % (os.getpid(), job['job_id'], job['attempts'], job['max_attempts']))
+		start = time.time()
+		try:
+			experiment.main(payload['save_location'], payload['env'], job['worker_id'], job['ass_id'], payload['entrainment_features'],
+				payload.get('f0_profile'), payload.get('bot_contour'), payload.get('synthesis_engine'))
+		except Exception as e:
+			traceback.print_exc()
+			status = queue.fail(job['job_id'], job['lease_id'], repr(e))
+			if status is None:
+				print('analysis worker %d: job %s failed after its lease was lost; error dropped' % (os.getpid(), job['job_id']))
+			else:
+				print('analysis worker %d: job %s failed, now %s' % (os.getpid(), job['job_id'], status))
+		else:
+			if not queue.complete(job['job_id'], job['lease_id']):
+				# the job was re-enqueued or handed to another worker meanwhile; that run's result counts
+				print('analysis worker %d: job %s lost its lease after %.2fs; result dropped' % (os.getpid(), job['job_id'], time.time() - start))
+				continue
+			print('analysis worker %d: job %s done in %.2fs' % (os.getpid(), job['job_id'], time.time() - start))
+			done += 1
+			cache = synthesis_cache.get_cache(os.path.join(payload['save_location'], payload['env'], experiment.SYNTHESIS_CACHE_DIR))
+			# stats() scans every shard of the shared cache, so only the in-process counters are logged per job
+			if synthesis_cache_report_every and done % synthesis_cache_report_every == 0:
+				print('analysis worker %d: synthesis cache %s' % (os.getpid(), cache.stats()))
+			else:
+				print('analysis worker %d: synthesis cache %s' % (os.getpid(), cache.counters()))
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# main
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run the background analysis/synthesis workers.')
+	parser.add_argument('--processes', type=int, default=analysis_processes, help='Number of analysis worker processes.')
+	args = parser.parse_args()
+
+	db_path = os.path.join(save_location, env, 'jobs.sqlite3')
+	workers = [None] * args.processes
+
+	# import and warm the analysis stack once here; the forked workers share it copy-on-write
+	if boot_mode == 'preload':
+		from world import warmup
+		timings = warmup.preload(sorted(set(f0_profiles.values()) | {None}, key=str))
+		print('analysis workers: preloaded in %.2fs' % sum(timings.values()))
+
+	# workers are not daemonic (chunked F0 extraction gives them their own process pools), so stop them explicitly
+	def shutdown(signum, frame):
+		for worker in workers:
+			if worker is not None:
+				worker.terminate()
+		sys.exit(0)
+	signal.signal(signal.SIGTERM, shutdown)
+	signal.signal(signal.SIGINT, shutdown)
+
+	while True:
+		# (re)start any worker process that has died
+		for i, worker in enumerate(workers):
+			if worker is None or not worker.is_alive():
+				workers[i] = multiprocessing.Process(target=work, args=(db_path, job_poll_interval, polly_tps / args.processes, args.processes))
+				workers[i].start()
+		time.sleep(5)
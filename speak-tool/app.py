@@ -2,33 +2,45 @@
 # flask app
 
 # flask libraries
-from flask import Flask, request, render_template, redirect, session, send_from_directory, Response, abort
+from flask import Flask, request, render_template, redirect, session, send_from_directory, Response, abort, jsonify
 # python/third-party libraries
 import os
 import urllib
 import time
 import werkzeug
 import geoip2.database
-import boto3
 import re
 import pickle
 import uuid
+import json
 # helpers
 import scripts
-from ast import literal_eval
 import sys
 
 # Add the 'perception-evaluation-framework' directory to the Python search path
 framework_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(framework_path)
 
-# Import the 'experiment' module from 'world'
-from world import experiment
+# worker recordings are decoded once and shared by every validation step
+from world.audio import AudioAsset
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # setup
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 env = 'production' # 'production' vs. 'sandbox'
+job_max_attempts = 3
+job_status_max_wait = 20
+f0_profiles = {}
+bot_contour = 'harvest'
+synthesis_engine = 'polly'
+boot_mode = 'preload'
+allocation_backend = 'local'
+allocation_lease_timeout = 900
+sqs_queue_url = 'https://sqs.us-east-1.amazonaws.com/180367849334/percept_eval_deployment_queue'
+state_journal_mode = 'wal'
+max_upload_bytes = 16 * 1024 * 1024
+vad_threshold_db = -45.0
+min_voiced_seconds = 2.0
 
 with open("app_config.txt", "r+") as config:
 	for line in config:
@@ -40,8 +52,13 @@ print("\n\n----- NEW SESSION %s, ENVIRONMENT: %s ---------------------------" %
 app = Flask(__name__)
 app.config.update(SESSION_COOKIE_SAMESITE="None", SESSION_COOKIE_SECURE=True)
 app_dir = os.path.abspath(os.path.dirname(__file__))					# global directory var to make code more readable
+app.config['MAX_CONTENT_LENGTH'] = max_upload_bytes					# larger request bodies are refused (413) before they are read
 app.secret_key = 'SooperDooperSecret'							# secret key used for session cookies
 iplocator = geoip2.database.Reader(app_dir+'/scripts/geolite2/GeoLite2-City.mmdb')	# ip address location lookup
+job_queue = scripts.JobQueue(os.path.join(save_location, env, 'jobs.sqlite3'))	# synthesis jobs, run by analysis_worker.py
+allocator = scripts.make_allocator(allocation_backend, os.path.join(save_location, env, 'allocation.sqlite3'),	# entrainment conditions
+	allocation_lease_timeout, sqs_queue_url)
+state = scripts.StateStore(os.path.join(save_location, env, 'state.sqlite3'), state_journal_mode)	# per-worker task state
 #sslify = SSLify(app)									# force SSL (to comply with MTurk)
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -63,27 +80,46 @@ def returnAudioFile(audio_file_name):
 def custom_401(error):
     return Response('You have already started to attempt this task, and it can only be assigned once per worker. Please resume the assignment you started from "Your HITs Queue". Please contact an administrator if you believe you should not be receiving this message.', 401, {})
 
-def pop_sqs_item():
-    sqs = boto3.client('sqs', region_name='us-east-1')
-    queue_url = 'https://sqs.us-east-1.amazonaws.com/180367849334/percept_eval_deployment_queue'
-    response = sqs.receive_message(
-        QueueUrl=queue_url,
-        AttributeNames=[
-            'All'
-        ],
-        MaxNumberOfMessages=1,
-    )
-    if 'Messages' in response:
-        message = response['Messages'][0]
-        receipt_handle = message['ReceiptHandle']
-        sqs.delete_message(
-            QueueUrl=queue_url,
-            ReceiptHandle=receipt_handle
-        )
-        print('Received and deleted message: %s' % message)
-    else:
-        print('No messages in queue.')
-    return message
+def enqueue_synthesis(worker_id, ass_id, entrainment_features, battery_name):
+	payload = {'save_location': save_location, 'env': env, 'entrainment_features': entrainment_features,
+		'f0_profile': f0_profiles.get(battery_name), 'bot_contour': bot_contour,
+		'synthesis_engine': synthesis_engine}
+	job_id = job_queue.enqueue(worker_id, ass_id, payload, max_attempts=job_max_attempts)
+	print('  queued synthesis job', job_id)
+	return job_id
+
+## use up a worker's entrainment condition once the recording passed validation; returns the condition's feature list
+# if the worker's lease ran out and the condition went to someone else, the worker gets (and uses up) a fresh one,
+# so no arm is synthesized for more workers than the allocator counted
+def complete_condition(worker_id, ass_id):
+	if not allocator.complete(worker_id, ass_id):
+		print('  workerId:', worker_id, 'lost the lease on its entrainment condition; allocating again')
+		entrainment_features = allocator.allocate(worker_id, ass_id)
+		if entrainment_features is None or not allocator.complete(worker_id, ass_id):
+			print('  workerId:', worker_id, 'could not complete an entrainment condition; keeping the one it recorded under')
+		else:
+			state.update(worker_id, ass_id, entrainment_features=json.loads(entrainment_features))
+	return state.get(worker_id, ass_id)['entrainment_features']
+
+## the streaming upload of a worker's recording (see scripts/ingest.py)
+def upload_session(worker_id, ass_id):
+	return scripts.UploadSession(os.path.join(save_location, env, worker_id + "_" + ass_id + "_worker_recording.wav"),
+		max_upload_bytes, vad_threshold_db)
+
+## warm up the validation path
+# decodes a second of synthetic silence and runs the local validation steps on it (val1b, val1c, val2, the speech_recognition reader),
+# and indexes the prompt files (scripts.PromptIndex), so all of it happens once in the uWSGI master (see wsgi.py)
+# instead of in every worker's first request. val1's Google speech API call needs the network and is skipped.
+def warm_up():
+	print('  %d prompts indexed' % scripts.prompt_index(app_dir).build())
+	from world.audio import pcm_to_wav
+	import speech_recognition as sr
+	recording = AudioAsset(pcm_to_wav(bytes(2 * 16000), 16000), 'warm_up.wav')
+	scripts.val1b(recording, 5)
+	scripts.val1c(recording, min_voiced_seconds, vad_threshold_db)
+	scripts.val2('warm up the transcript check', 'warm up the transcript')
+	with sr.AudioFile(recording.file_obj()) as source:
+		sr.Recognizer().record(source)
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # STEP 0: initialize test
@@ -94,17 +130,9 @@ def init_test(proctor_name, battery_name, perceptual_trait):
 		ass_id, hit_id, submit_path, worker_id, arg_string = scripts.get_args()
 
 		if (worker_id is not None):
-			trait_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_trait_config.txt")
-			with open(trait_config_filename, 'w') as trait_handle:
-				trait_handle.write(perceptual_trait)
-			worker_already_started_this_task = os.path.exists(os.path.join(save_location, env, worker_id + ".txt"))
-			worker_resuming_task = False
-			if worker_already_started_this_task:
-				with open(os.path.join(save_location, env, worker_id + ".txt"), 'r') as rf:
-					line = rf.readline().strip('\n').split('_')
-					prev_ass_id, prev_hit_id = line[0], line[1]
-					worker_resuming_task = ass_id == prev_ass_id and hit_id == prev_hit_id
-			if worker_already_started_this_task and not worker_resuming_task:
+			state.update(worker_id, ass_id, trait=perceptual_trait)
+			owner = state.worker_owner(worker_id)
+			if owner is not None and owner != (ass_id, hit_id):
 				return abort(401)
 			else:
 				nextPage = '/consent/' + proctor_name + '/' + battery_name + '/' + '0' + arg_string
@@ -118,18 +146,14 @@ def init_test(proctor_name, battery_name, perceptual_trait):
 		return redirect(nextPage)
 	elif proctor_name == 'appen':
 		ass_id, worker_id = str(uuid.uuid4()), str(uuid.uuid4())
-		trait_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_trait_config.txt")
-		with open(trait_config_filename, 'w') as trait_handle:
-			trait_handle.write(perceptual_trait)
+		state.update(worker_id, ass_id, trait=perceptual_trait)
 		arg_string = '?assignmentId=' + ass_id + '&workerId=' + worker_id
 		nextPage = '/consent/' + proctor_name + '/' + battery_name + '/' + '0' + arg_string
 		print('init: ')
 		print('ass_id: ', ass_id, ' worker_id: ', worker_id)
 		session.clear()
 		session[ass_id + "_starttime"] = time.time() # start task timer
-		pickle_file_path = os.path.join(save_location, env, worker_id + "_" + ass_id + "_starttime" ".pickle")
-		with open(pickle_file_path, "wb") as file:
-			pickle.dump(time.time(), file)
+		state.update(worker_id, ass_id, started=time.time())
 		return redirect(nextPage)
 	else:
 		return abort(404)
@@ -184,15 +208,19 @@ def record(proctor_name, battery_name, test_idx, question_idx, multiple_attempts
 
 		print('record: ')
 		print('ass_id: ', ass_id, ' hit_id: ', hit_id, ' submit_path: ', ' worker_id: ', worker_id)
-		worker_already_started_this_task = os.path.exists(os.path.join(save_location, env, worker_id + ".txt"))
-		if not worker_already_started_this_task:
-			with open(os.path.join(save_location, env, worker_id + ".txt"), 'w') as wf:
-				wf.write(ass_id + '_' + hit_id)
-			message = pop_sqs_item()
-			entrainment_features = message['Body']
-			entrainment_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_entrainment_config.txt")
-			with open(entrainment_config_filename, 'w') as entrainment_handle:
-				entrainment_handle.write(entrainment_features)
+		claim = state.claim_worker(worker_id, ass_id, hit_id)
+		if claim != scripts.TAKEN:
+			# on every visit (a resumed task, a second recording), so the worker's lease on the condition is renewed
+			entrainment_features = allocator.allocate(worker_id, ass_id)
+			if entrainment_features is None:
+				print('  no entrainment condition left to assign')
+				if claim == scripts.CLAIMED:
+					state.release_worker(worker_id, ass_id)
+				return abort(503)
+			if claim == scripts.CLAIMED:
+				state.update(worker_id, ass_id, entrainment_features=json.loads(entrainment_features), status=scripts.STARTED)
+			else:
+				state.update(worker_id, ass_id, entrainment_features=json.loads(entrainment_features))
 		if (multiple_attempts_true == '1'):
 			print('\n  ---- worker recording (failed the first time) -----')
 		else:
@@ -232,13 +260,12 @@ def record(proctor_name, battery_name, test_idx, question_idx, multiple_attempts
 	elif proctor_name == 'appen':
 		ass_id, worker_id, arg_string = scripts.get_args('appen')
 
-		with open(os.path.join(save_location, env, worker_id + ".txt"), 'w') as wf:
-			wf.write(ass_id)
-		message = pop_sqs_item()
-		entrainment_features = message['Body']
-		entrainment_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_entrainment_config.txt")
-		with open(entrainment_config_filename, 'w') as entrainment_handle:
-			entrainment_handle.write(entrainment_features)
+		state.claim_worker(worker_id, ass_id)
+		entrainment_features = allocator.allocate(worker_id, ass_id)
+		if entrainment_features is None:
+			print('  no entrainment condition left to assign')
+			return abort(503)
+		state.update(worker_id, ass_id, entrainment_features=json.loads(entrainment_features), status=scripts.STARTED)
 
 		print('record: ')
 		print('ass_id: ', ass_id, ' worker_id: ', worker_id)
@@ -279,42 +306,63 @@ def upload(proctor_name, battery_name, test_idx, question_idx):
 
 		print('upload: ')
 		print('ass_id: ', ass_id, ' hit_id: ', hit_id, ' submit_path: ', ' worker_id: ', worker_id)
-		filename = os.path.join(save_location, env, worker_id + "_" + ass_id + "_worker_recording.wav")
-		print('  workerId:', worker_id, 'recorded. uploading to file ' + filename +'...')
-		os.makedirs(os.path.dirname(filename), exist_ok=True)
-		print('  request.files:',request.files)
-		audio_data = request.files['audio_data']
-		print('  saving to',filename,'...')
-		audio_data.save(filename)			# save original file
-		#y, sr = librosa.load(filename, sr=16000)	# downsample to 16kHz
-		#os.remove(filename)				# remove original
-		#os.rename(filename, filename.rstrip('.wav') + '_original.wav')
-		#sf.write(filename, y, sr)	
-		print('  workerId:', worker_id, '...upload complete.')
-
-		return ('', 202)
 	elif proctor_name == 'appen':
 		ass_id, worker_id, arg_string = scripts.get_args('appen')
 
 		print('upload: ')
 		print('ass_id: ', ass_id, ' worker_id: ', worker_id)
-		filename = os.path.join(save_location, env, worker_id + "_" + ass_id + "_worker_recording.wav")
-		print('  workerId:', worker_id, 'recorded. uploading to file ' + filename +'...')
-		os.makedirs(os.path.dirname(filename), exist_ok=True)
-		print('  request.files:',request.files)
-		audio_data = request.files['audio_data']
-		print('  saving to',filename,'...')
-		audio_data.save(filename)			# save original file
-		#y, sr = librosa.load(filename, sr=16000)	# downsample to 16kHz
-		#os.remove(filename)				# remove original
-		#os.rename(filename, filename.rstrip('.wav') + '_original.wav')
-		#sf.write(filename, y, sr)	
-		print('  workerId:', worker_id, '...upload complete.')
-
-		return ('', 202)
 	else:
 		return abort(404)
 
+	# the whole file in one multipart request; it is measured while it is written, like a chunked upload
+	upload = upload_session(worker_id, ass_id)
+	print('  workerId:', worker_id, 'recorded. uploading to file ' + upload.path + '...')
+	print('  request.files:',request.files)
+	audio_data = request.files['audio_data']
+	audio_data.stream.seek(0, os.SEEK_END)
+	total = audio_data.stream.tell()
+	audio_data.stream.seek(0)
+	try:
+		upload.write(uuid.uuid4().hex, 0, audio_data.stream, total)
+	except scripts.UploadError as e:
+		print('  workerId:', worker_id, 'upload refused:', e)
+		return (str(e), e.status)
+	print('  workerId:', worker_id, '...upload complete.')
+
+	return ('', 202)
+
+## streaming, resumable upload
+# PUT <body> ?upload=<id>&offset=<byte offset>&total=<file size>: writes a chunk of the recording; the upload completes when total
+#	bytes arrived. a chunk resent after a lost response is accepted (the bytes already received are skipped).
+# GET ?upload=<id>: how many bytes of the upload arrived, to resume from after a dropped connection
+# both answer with the upload's status (scripts.UploadSession.status) as JSON, errors with {'error', 'received'}
+@app.route('/<proctor_name>/<battery_name>/upload-chunk/<test_idx>/<question_idx>', methods=['GET', 'PUT'])
+def upload_chunk(proctor_name, battery_name, test_idx, question_idx):
+	if proctor_name == 'turk':
+		ass_id, hit_id, submit_path, worker_id, arg_string = scripts.get_args()
+	elif proctor_name == 'appen':
+		ass_id, worker_id, arg_string = scripts.get_args('appen')
+	else:
+		return abort(404)
+
+	upload = upload_session(worker_id, ass_id)
+	upload_id = request.args.get('upload', '')
+	if request.method == 'GET':
+		return jsonify(upload.status(upload_id))
+	try:
+		offset = int(request.args.get('offset', 0))
+		total = int(request.args['total']) if 'total' in request.args else None
+	except ValueError:
+		return jsonify({'error': 'offset and total must be integers', 'received': upload.status(upload_id)['received']}), 400
+	try:
+		status = upload.write(upload_id, offset, request.stream, total)
+	except scripts.UploadError as e:
+		print('  workerId:', worker_id, 'upload chunk refused:', e)
+		return jsonify({'error': str(e), 'received': upload.status(upload_id)['received']}), e.status
+	if upload.complete:
+		print('  workerId:', worker_id, 'uploaded', status['received'], 'bytes,', status['duration'], 's,', status['voiced_duration'], 's voiced')
+	return jsonify(status)
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # STEP 3: validate user input
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -327,37 +375,45 @@ def validate(proctor_name, battery_name, test_idx, question_idx):
 		print('ass_id: ', ass_id, ' hit_id: ', hit_id, ' submit_path: ', ' worker_id: ', worker_id)
 		print('\n  workerId:', worker_id, 'validating...')
 
-		# validation 1: transcribe worker-uploaded audio file
+		# validation 1b: measure length of audio file; accept/reject based on length threshold
+		# validation 1c (silence gate): measure voiced time; accept/reject based on voiced time threshold
+		# both are read from the summary measured while the file was uploaded (decoding the file only if it has none)
 		filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_worker_recording.wav")
-		try:
-			transcript = scripts.val1(filename)
-		except FileNotFoundError:
+		recording = upload_session(worker_id, ass_id)
+		if not recording.complete:
+			try:
+				recording = AudioAsset.from_file(filename)
+			except FileNotFoundError:
+				return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
+		test_soundlength = scripts.val1b(recording, 5)
+		test_voiced = scripts.val1c(recording, min_voiced_seconds, vad_threshold_db)
+		print('    val1b (soundlength): ' + str(test_soundlength))
+		print('    val1c (voiced): ' + str(test_voiced))
+		if not (test_soundlength and test_voiced):
+			# too short or silent: no need to wait for the transcription
+			session[ass_id + "_" + question_idx] = False
+			print("    worker passes this task: False")
 			return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
+
+		# validation 1: transcribe worker-uploaded audio file
+		transcript = scripts.val1(recording if isinstance(recording, AudioAsset) else filename)
 		print('    transcript: ' + transcript)
 
 		# validation 1a: count number of words transcribed; accept/reject based on # words threshold
-		# validation 1b: measure length of audio file; accept/reject based on length threshold
-		# output True iff pass val1a and val1b
+		# output True iff pass val1a, val1b and val1c
 		# save in user's specific accept_hit gradesheet
 		test_numwords = scripts.val1a(transcript, 15)
-		test_soundlength = scripts.val1b(filename, 5)
 		print('    val1a (numwords): ' + str(test_numwords))
-		print('    val1b (soundlength): ' + str(test_soundlength))
 		#session[ass_id + "_" + question_idx] = test_numwords & test_soundlength# & (test_wer < 0.2)
-		session[ass_id + "_" + question_idx] = test_soundlength & test_numwords & test_soundlength
+		session[ass_id + "_" + question_idx] = test_soundlength & test_numwords & test_voiced
 		print("    worker passes this task:",session[ass_id + "_" + question_idx])
 
 		if not session[ass_id + "_" + question_idx]:
 			return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
 		else:
-			entrainment_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_entrainment_config.txt")
-			with open(entrainment_config_filename, 'r') as entrainment_handle:
-				entrainment_config = entrainment_handle.readlines()[0].strip('\n')
-			entrainment_config = literal_eval(entrainment_config)
-			try:
-				experiment.main(save_location, env, worker_id, ass_id, entrainment_config)
-			except Exception as e:
-				return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
+			entrainment_config = complete_condition(worker_id, ass_id)
+			state.update(worker_id, ass_id, status=scripts.RECORDED)
+			enqueue_synthesis(worker_id, ass_id, entrainment_config, battery_name)
 			print('  workerId:', worker_id, 'redirecting...')
 			return redirect('/' + proctor_name + '/' + battery_name + '/evaluate/' + test_idx + '/' + question_idx + arg_string)
 	elif proctor_name == 'appen':
@@ -367,39 +423,68 @@ def validate(proctor_name, battery_name, test_idx, question_idx):
 		print('ass_id: ', ass_id, ' worker_id: ', worker_id)
 		print('\n  workerId:', worker_id, 'validating...')
 
-		# validation 1: transcribe worker-uploaded audio file
+		# validation 1b: measure length of audio file; accept/reject based on length threshold
+		# validation 1c (silence gate): measure voiced time; accept/reject based on voiced time threshold
+		# both are read from the summary measured while the file was uploaded (decoding the file only if it has none)
 		filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_worker_recording.wav")
-		try:
-			transcript = scripts.val1(filename)
-		except FileNotFoundError:
-			return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
+		recording = upload_session(worker_id, ass_id)
+		if not recording.complete:
+			try:
+				recording = AudioAsset.from_file(filename)
+			except FileNotFoundError:
+				return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
+		test_soundlength = scripts.val1b(recording, 5)
+		test_voiced = scripts.val1c(recording, min_voiced_seconds, vad_threshold_db)
+		print('    val1b (soundlength): ' + str(test_soundlength))
+		print('    val1c (voiced): ' + str(test_voiced))
+
+		# validation 1: transcribe worker-uploaded audio file
+		transcript = scripts.val1(recording if isinstance(recording, AudioAsset) else filename)
 		print('    transcript: ' + transcript)
 
 		# validation 1a: count number of words transcribed; accept/reject based on # words threshold
-		# validation 1b: measure length of audio file; accept/reject based on length threshold
-		# output True iff pass val1a and val1b
+		# output True iff pass val1a, val1b and val1c
 		# save in user's specific accept_hit gradesheet
 		test_numwords = scripts.val1a(transcript, 15)
-		test_soundlength = scripts.val1b(filename, 5)
 		print('    val1a (numwords): ' + str(test_numwords))
-		print('    val1b (soundlength): ' + str(test_soundlength))
 		#session[ass_id + "_" + question_idx] = test_numwords & test_soundlength# & (test_wer < 0.2)
-		session[ass_id + "_" + question_idx] = test_soundlength & test_numwords & test_soundlength
+		session[ass_id + "_" + question_idx] = test_soundlength & test_numwords & test_voiced
 		print("    worker passes this task:",session[ass_id + "_" + question_idx])
 
-		entrainment_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_entrainment_config.txt")
-		with open(entrainment_config_filename, 'r') as entrainment_handle:
-			entrainment_config = entrainment_handle.readlines()[0].strip('\n')
-		entrainment_config = literal_eval(entrainment_config)
-		try:
-			experiment.main(save_location, env, worker_id, ass_id, entrainment_config)
-		except Exception as e:
-			return redirect('/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string)
+		if session[ass_id + "_" + question_idx]:
+			entrainment_config = complete_condition(worker_id, ass_id)
+			state.update(worker_id, ass_id, status=scripts.RECORDED)
+		else:
+			entrainment_config = state.get(worker_id, ass_id)['entrainment_features']
+		enqueue_synthesis(worker_id, ass_id, entrainment_config, battery_name)
 		print('  workerId:', worker_id, 'redirecting...')
 		return redirect('/' + proctor_name + '/' + battery_name + '/evaluate/' + test_idx + '/' + question_idx + arg_string)
 	else:
 		return abort(404)
 
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# STEP 3b: poll status of the synthesis job queued by validate()
+# ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+@app.route('/<proctor_name>/<battery_name>/synthesis-status/<test_idx>/<question_idx>')
+def synthesis_status(proctor_name, battery_name, test_idx, question_idx):
+	if proctor_name == 'turk':
+		ass_id, hit_id, submit_path, worker_id, arg_string = scripts.get_args()
+	elif proctor_name == 'appen':
+		ass_id, worker_id, arg_string = scripts.get_args('appen')
+	else:
+		return abort(404)
+
+	# ?wait=<seconds> long-polls until the job finishes (capped, so a uwsgi process is never pinned for long)
+	try:
+		wait = min(float(request.args.get('wait', 0)), job_status_max_wait)
+	except ValueError:
+		wait = 0
+	job_id = scripts.job_id_for(worker_id, ass_id)
+	job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.status(job_id)
+	if job is None:
+		return jsonify(status='missing'), 404
+	return jsonify(status=job['status'], attempts=job['attempts'], max_attempts=job['max_attempts'])
+
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # STEP 4: evaluate synthesized response
 # ----------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -414,12 +499,14 @@ def evaluate(proctor_name, battery_name, test_idx, question_idx):
 		audioURL = 'https://percepteval.net' + '/' + audioFile
 		print(audioURL)
 		submitEvaluation = '/' + proctor_name + '/' + battery_name + '/thanks/' + test_idx + '/' + question_idx + arg_string
-		trait_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_entrainment_config.txt")
-		with open(trait_config_filename, 'r') as trait_handle:
-			perceptualTrait = trait_handle.readlines()[0].strip('\n')
+		statusURL = '/' + proctor_name + '/' + battery_name + '/synthesis-status/' + test_idx + '/' + question_idx + arg_string
+		retryURL = '/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string
+		perceptualTrait = json.dumps(state.get(worker_id, ass_id)['entrainment_features'])
 		return render_template(evaluation_template,
 			submitEvaluation=submitEvaluation,
 			audioURL=audioURL,
+			statusURL=statusURL,
+			retryURL=retryURL,
 			perceptualTrait=perceptualTrait
 		)
 	elif proctor_name == 'appen':
@@ -431,12 +518,14 @@ def evaluate(proctor_name, battery_name, test_idx, question_idx):
 		audioURL = 'https://percepteval.net' + '/' + audioFile
 		print(audioURL)
 		submitEvaluation = '/' + proctor_name + '/' + battery_name + '/thanks/' + test_idx + '/' + question_idx + arg_string
-		trait_config_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_trait_config.txt")
-		with open(trait_config_filename, 'r') as trait_handle:
-			perceptualTrait = trait_handle.readlines()[0].strip('\n')
+		statusURL = '/' + proctor_name + '/' + battery_name + '/synthesis-status/' + test_idx + '/' + question_idx + arg_string
+		retryURL = '/' + proctor_name + '/' + battery_name + '/record-voice/' + test_idx + '/' + question_idx + '/1' + arg_string
+		perceptualTrait = state.get(worker_id, ass_id)['trait']
 		return render_template(evaluation_template,
 			submitEvaluation=submitEvaluation,
 			audioURL=audioURL,
+			statusURL=statusURL,
+			retryURL=retryURL,
 			perceptualTrait=perceptualTrait
 		)
 	else:
@@ -454,9 +543,7 @@ def complete(proctor_name, battery_name, test_idx, question_idx):
 		ass_id, hit_id, submit_path, worker_id, arg_string = scripts.get_args()
 
 
-		score_file = os.path.join(save_location, env, worker_id + "_" + "score.txt")
-		with open(score_file, 'w') as score_handle:
-			score_handle.write(selected_option + '\n')
+		state.update(worker_id, ass_id, score=selected_option, status=scripts.COMPLETED, ended=time.time())
 
 		# final thanks + instructions for worker
 		print('    workerId:', worker_id, 'done with all questions for test', test_idx,'of',battery_name + '.')	
@@ -500,9 +587,7 @@ def complete(proctor_name, battery_name, test_idx, question_idx):
 
 		ass_id, worker_id, arg_string = scripts.get_args('appen')
 
-		score_file = os.path.join(save_location, env, worker_id + "_" + "score.txt")
-		with open(score_file, 'w') as score_handle:
-			score_handle.write(selected_option + '\n')
+		state.update(worker_id, ass_id, score=selected_option, status=scripts.COMPLETED, ended=time.time())
 
 		# final thanks + instructions for worker
 		print('    workerId:', worker_id, 'done with all questions for test', test_idx,'of',battery_name + '.')	
@@ -522,9 +607,6 @@ def complete(proctor_name, battery_name, test_idx, question_idx):
 			worker_city = "N/A"
 
 		elapsed_time = time.time() - session.get(ass_id + "_starttime", 0)
-		pickle_file_path = os.path.join(save_location, env, worker_id + "_" + ass_id + "_endtime" ".pickle")
-		with open(pickle_file_path, "wb") as file:
-			pickle.dump(time.time(), file)
 		probably_not_fraud = True if (elapsed_time > 10) else False
 
 		payload = {	'assignmentId':ass_id, 'workerId':worker_id, 'environment':env,
@@ -551,9 +633,13 @@ def display_code(proctor_name, battery_name, test_idx, question_idx):
 	if proctor_name == 'appen':
 		ass_id, worker_id, arg_string = scripts.get_args('appen')
 		
-		code_pickle = os.path.join(save_location,env,"codes.pickle")
-		with open(code_pickle, 'rb') as f:
-			codes = pickle.load(f)
+		# the codes never change: read once per process (imported from codes.pickle the first time)
+		codes = state.constant('codes')
+		if codes is None:
+			code_pickle = os.path.join(save_location,env,"codes.pickle")
+			with open(code_pickle, 'rb') as f:
+				codes = pickle.load(f)
+			state.set_constant('codes', list(codes))
 		code1, code2, code3, code4, code5, code6, code7, code8 = codes
 
 		return render_template(code_template,
@@ -155,6 +155,7 @@ if __name__ == "__main__":
 
     # -------------------
     # deploy SQS queue items - author: ben ciaglo
+    # (only read by the app with allocation_backend = 'sqs'; the 'local' backend keeps its own balanced schedule)
     deploy_sqs_items()
     # -------------------
     # deploy HITs
@@ -1,3 +1,7 @@
 # __init__.py
-from .helpers import template_picker, get_args, print_row
-from .validation import val1, val1a, val1b, val2
\ No newline at end of file
+from .helpers import template_picker, get_args, print_row, PromptIndex, prompt_index
+from .validation import val1, val1a, val1b, val1c, val2
+from .jobs import JobQueue, job_id_for
+from .allocation import LocalAllocator, SqsAllocator, make_allocator
+from .state import StateStore, CLAIMED, OWNED, TAKEN, STARTED, RECORDED, COMPLETED
+from .ingest import UploadSession, UploadError
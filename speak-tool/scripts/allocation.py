@@ -0,0 +1,270 @@
+# allocation.py
+# entrainment condition assignment: hands every new worker one of the nine arms
+import collections
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+
+## the nine arms, in the order deploy_sqs_items (appen/1_create-job.py) puts them on the SQS queue
+CONDITIONS = [
+	['entrain-pitch', 'entrain-volume'],
+	['entrain-pitch', 'disentrain-volume'],
+	['entrain-pitch'],
+	['disentrain-pitch', 'entrain-volume'],
+	['disentrain-pitch', 'disentrain-volume'],
+	['disentrain-pitch'],
+	['entrain-volume'],
+	['disentrain-volume'],
+	[],
+]
+
+## assignment states
+# leased: handed to a worker who has not passed validation yet; returned to the pool when the lease runs out
+# completed: the worker's recording passed validation; the condition is used up
+LEASED, COMPLETED = 'leased', 'completed'
+
+
+## base of the allocators: a sqlite database shared by every uwsgi process on the machine
+# allocate() returns the condition as a JSON string (the same string deploy_sqs_items sends as the SQS message body),
+# or None if there is none to give out; the allocator's own database tracks the lease, and the app decodes the string
+# into the assignment's entrainment_features in state.sqlite3 (scripts/state.py)
+class Allocator:
+	def __init__(self, db_path, lease_timeout):
+		self.db_path = db_path
+		self.lease_timeout = lease_timeout
+		os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+	def _connect(self):
+		conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+		conn.row_factory = sqlite3.Row
+		conn.execute('PRAGMA journal_mode=WAL')
+		return conn
+
+
+## local condition allocator
+# a balanced schedule in sqlite: slots are added in blocks of nine, each block one shuffled copy of CONDITIONS, and every
+# new assignment takes the lowest free slot, so the arms are assigned equally often (to within one block) in a
+# counter-balanced order. allocating again for the same (worker_id, ass_id) returns the same condition and renews the lease.
+# db_path: path of the sqlite database file, as a string
+# lease_timeout: seconds before an assignment that was never completed (the worker abandoned the task) is handed out again
+# seed: seed of the block shuffles, so a schedule can be reproduced (None: random)
+class LocalAllocator(Allocator):
+	def __init__(self, db_path, lease_timeout=900, seed=None):
+		super().__init__(db_path, lease_timeout)
+		self.seed = seed
+		with closing(self._connect()) as conn:
+			conn.execute('''CREATE TABLE IF NOT EXISTS slots (
+				slot INTEGER PRIMARY KEY,
+				block INTEGER NOT NULL,
+				features TEXT NOT NULL,
+				worker_id TEXT,
+				ass_id TEXT,
+				status TEXT,
+				lease_expires REAL,
+				updated REAL)''')
+			conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS slots_assignment_idx ON slots (worker_id, ass_id)')
+			conn.execute('CREATE INDEX IF NOT EXISTS slots_status_idx ON slots (status, slot)')
+
+	def _block(self, block):
+		conditions = list(CONDITIONS)
+		random.Random(None if self.seed is None else '%s-%d' % (self.seed, block)).shuffle(conditions)
+		return conditions
+
+	## atomically assign a condition to a worker's assignment
+	# returns the condition as a JSON string
+	def allocate(self, worker_id, ass_id):
+		now = time.time()
+		conn = self._connect()
+		try:
+			conn.execute('BEGIN IMMEDIATE')
+			row = conn.execute('SELECT slot, features, status FROM slots WHERE worker_id = ? AND ass_id = ?',
+				(worker_id, ass_id)).fetchone()
+			if row is not None:
+				if row['status'] == LEASED:
+					conn.execute('UPDATE slots SET lease_expires = ?, updated = ? WHERE slot = ?', (now + self.lease_timeout, now, row['slot']))
+				conn.execute('COMMIT')
+				return row['features']
+			row = conn.execute('''SELECT slot, features FROM slots WHERE status IS NULL OR (status = ? AND lease_expires <= ?)
+				ORDER BY slot LIMIT 1''', (LEASED, now)).fetchone()
+			if row is None:
+				block = conn.execute('SELECT COALESCE(MAX(block) + 1, 0) FROM slots').fetchone()[0]
+				conn.executemany('INSERT INTO slots (block, features) VALUES (?, ?)',
+					[(block, json.dumps(features)) for features in self._block(block)])
+				row = conn.execute('SELECT slot, features FROM slots WHERE block = ? ORDER BY slot LIMIT 1', (block,)).fetchone()
+			conn.execute('UPDATE slots SET worker_id = ?, ass_id = ?, status = ?, lease_expires = ?, updated = ? WHERE slot = ?',
+				(worker_id, ass_id, LEASED, now + self.lease_timeout, now, row['slot']))
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+		finally:
+			conn.close()
+		return row['features']
+
+	## mark a worker's assignment as completed (its recording passed validation)
+	# returns False if the worker holds no lease (e.g. it ran out and the slot went to someone else)
+	def complete(self, worker_id, ass_id):
+		with closing(self._connect()) as conn:
+			cursor = conn.execute('UPDATE slots SET status = ?, lease_expires = NULL, updated = ? WHERE worker_id = ? AND ass_id = ? AND status = ?',
+				(COMPLETED, time.time(), worker_id, ass_id, LEASED))
+		return cursor.rowcount > 0
+
+	## return a leased condition to the pool right away
+	def release(self, worker_id, ass_id):
+		with closing(self._connect()) as conn:
+			cursor = conn.execute('''UPDATE slots SET worker_id = NULL, ass_id = NULL, status = NULL, lease_expires = NULL, updated = ?
+				WHERE worker_id = ? AND ass_id = ? AND status = ?''', (time.time(), worker_id, ass_id, LEASED))
+		return cursor.rowcount > 0
+
+	## assignments per condition
+	# returns {condition JSON string: {'completed': n, 'leased': n}} (expired leases are not counted)
+	def counts(self):
+		counts = collections.OrderedDict((json.dumps(features), {COMPLETED: 0, LEASED: 0}) for features in CONDITIONS)
+		with closing(self._connect()) as conn:
+			rows = conn.execute('''SELECT features, status, COUNT(*) AS n FROM slots
+				WHERE status = ? OR (status = ? AND lease_expires > ?) GROUP BY features, status''',
+				(COMPLETED, LEASED, time.time())).fetchall()
+		for row in rows:
+			counts[row['features']][row['status']] = row['n']
+		return counts
+
+
+## SQS condition allocator
+# takes conditions from the deployment queue filled by deploy_sqs_items (appen/1_create-job.py). messages are long-polled
+# in batches of 10 into a per-process prefetch buffer, instead of one client and one receive_message round trip per worker.
+# a message is only deleted when its assignment completes; until then SQS keeps it invisible for lease_timeout seconds
+# and then hands it out again (the worker abandoned the task). buffered messages close to becoming visible again are
+# dropped from the buffer instead of being handed out twice.
+# assignments and their receipt handles are kept in sqlite, so any uwsgi process can complete them.
+# db_path: path of the sqlite database file, as a string
+# queue_url: url of the deployment queue
+# wait_time: seconds to long-poll when the buffer is empty
+class SqsAllocator(Allocator):
+	BATCH_SIZE = 10
+	# buffered messages are dropped this many seconds before their visibility timeout runs out
+	BUFFER_MARGIN = 60
+
+	def __init__(self, db_path, queue_url, region='us-east-1', lease_timeout=900, wait_time=2, client=None):
+		super().__init__(db_path, lease_timeout)
+		self.queue_url = queue_url
+		self.region = region
+		self.wait_time = wait_time
+		self._client = client
+		self._buffer = collections.deque()
+		self._lock = threading.Lock()
+		with closing(self._connect()) as conn:
+			conn.execute('''CREATE TABLE IF NOT EXISTS sqs_assignments (
+				worker_id TEXT NOT NULL,
+				ass_id TEXT NOT NULL,
+				features TEXT NOT NULL,
+				receipt_handle TEXT NOT NULL,
+				status TEXT NOT NULL,
+				lease_expires REAL,
+				updated REAL NOT NULL,
+				PRIMARY KEY (worker_id, ass_id))''')
+
+	## one SQS client per process (boto3 clients are not fork-safe, so it is made on first use, after uwsgi forks)
+	@property
+	def client(self):
+		if self._client is None:
+			import boto3
+			self._client = boto3.client('sqs', region_name=self.region)
+		return self._client
+
+	def _fill(self):
+		response = self.client.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=self.BATCH_SIZE,
+			WaitTimeSeconds=self.wait_time, VisibilityTimeout=self.lease_timeout)
+		now = time.time()
+		self._buffer.extend((now, message) for message in response.get('Messages', []))
+
+	def _take(self):
+		with self._lock:
+			while True:
+				while self._buffer and time.time() - self._buffer[0][0] > self.lease_timeout - self.BUFFER_MARGIN:
+					self._buffer.popleft()
+				if self._buffer:
+					return self._buffer.popleft()[1]
+				self._fill()
+				if not self._buffer:
+					return None
+
+	## assign the next queued condition to a worker's assignment
+	# allocating again for the same (worker_id, ass_id) returns the same condition and renews the lease, unless the lease ran
+	# out (SQS may have handed the message to someone else): then the worker gets the next queued condition
+	# returns the condition as a JSON string, or None if the queue is empty
+	def allocate(self, worker_id, ass_id):
+		from botocore.exceptions import ClientError
+
+		with closing(self._connect()) as conn:
+			row = conn.execute('SELECT features, receipt_handle, status, lease_expires FROM sqs_assignments WHERE worker_id = ? AND ass_id = ?',
+				(worker_id, ass_id)).fetchone()
+		if row is not None and row['status'] == COMPLETED:
+			return row['features']
+		if row is not None and row['lease_expires'] > time.time():
+			try:
+				self.client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=row['receipt_handle'],
+					VisibilityTimeout=self.lease_timeout)
+			except ClientError as e:
+				print('  could not renew the SQS lease of', worker_id, ass_id, ':', e)
+			else:
+				with closing(self._connect()) as conn:
+					conn.execute('UPDATE sqs_assignments SET lease_expires = ?, updated = ? WHERE worker_id = ? AND ass_id = ?',
+						(time.time() + self.lease_timeout, time.time(), worker_id, ass_id))
+				return row['features']
+		message = self._take()
+		if message is None:
+			return None
+		# the lease starts now, not when the message was prefetched
+		self.client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=message['ReceiptHandle'],
+			VisibilityTimeout=self.lease_timeout)
+		now = time.time()
+		with closing(self._connect()) as conn:
+			conn.execute('''INSERT OR REPLACE INTO sqs_assignments (worker_id, ass_id, features, receipt_handle, status, lease_expires, updated)
+				VALUES (?, ?, ?, ?, ?, ?, ?)''', (worker_id, ass_id, message['Body'], message['ReceiptHandle'], LEASED, now + self.lease_timeout, now))
+		return message['Body']
+
+	## delete a worker's message from the queue (its recording passed validation)
+	# returns False if the worker holds no lease, the lease ran out (the message may have been received again, and SQS
+	# does not reliably delete it with an older receipt handle), or SQS no longer accepts the receipt handle
+	def complete(self, worker_id, ass_id):
+		from botocore.exceptions import ClientError
+
+		with closing(self._connect()) as conn:
+			row = conn.execute('SELECT receipt_handle, lease_expires FROM sqs_assignments WHERE worker_id = ? AND ass_id = ? AND status = ?',
+				(worker_id, ass_id, LEASED)).fetchone()
+			if row is None or row['lease_expires'] <= time.time():
+				return False
+			try:
+				self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=row['receipt_handle'])
+			except ClientError as e:
+				print('  could not delete the SQS message of', worker_id, ass_id, ':', e)
+				return False
+			conn.execute('UPDATE sqs_assignments SET status = ?, lease_expires = NULL, updated = ? WHERE worker_id = ? AND ass_id = ?',
+				(COMPLETED, time.time(), worker_id, ass_id))
+		return True
+
+	## return a leased condition to the queue right away
+	def release(self, worker_id, ass_id):
+		with closing(self._connect()) as conn:
+			row = conn.execute('SELECT receipt_handle FROM sqs_assignments WHERE worker_id = ? AND ass_id = ? AND status = ?',
+				(worker_id, ass_id, LEASED)).fetchone()
+			if row is None:
+				return False
+			self.client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=row['receipt_handle'], VisibilityTimeout=0)
+			conn.execute('DELETE FROM sqs_assignments WHERE worker_id = ? AND ass_id = ?', (worker_id, ass_id))
+		return True
+
+
+## build the allocator selected in app_config.txt
+# backend: 'local' (LocalAllocator) or 'sqs' (SqsAllocator, needs queue_url)
+def make_allocator(backend, db_path, lease_timeout=900, queue_url=None, region='us-east-1'):
+	if backend == 'local':
+		return LocalAllocator(db_path, lease_timeout)
+	if backend == 'sqs':
+		return SqsAllocator(db_path, queue_url, region, lease_timeout)
+	raise ValueError('unknown allocation backend %r (use \'local\' or \'sqs\')' % backend)
@@ -2,39 +2,111 @@
 # helper functions
 from flask import request
 import os
+import time
+
+
+## template of a prompt file, by its file extension (see template_picker)
+def prompt_template(battery, file_name):
+	if file_name.endswith(".txt"):
+		return battery + "/recorder_text-prompt.html"
+	elif file_name.endswith(".wav"):
+		if "qual" in file_name: return battery + "/recorder_audio-prompt-diag.html"
+		else: return battery + "/recorder_audio-prompt.html"
+	elif file_name.endswith(".png"):
+		return battery + "/recorder_image-prompt.html"
+	else:
+		return battery + "/recorder_invalid-prompt.html"
+
+
+## prompt index
+# maps (battery, test) -> {question: (template, text prompt)} for every prompt file in static/test-files/<battery>/<test>,
+# with text prompts read when they are indexed. a test directory is re-indexed only when its mtime changes (a prompt was
+# added, removed or replaced), and its mtime is checked at most every refresh_interval seconds, so a lookup is a dict hit.
+# home: home directory of the flask app, as a string
+class PromptIndex:
+	def __init__(self, home, refresh_interval=2.0):
+		self.root = os.path.join(home, 'static', 'test-files')
+		self.refresh_interval = refresh_interval
+		self._tests = {}
+
+	## index one test directory: (mtime, sorted file names, {question: (template, text)})
+	# when several files share a question name, the last one in sorted order wins (.txt over .png, .wav over both)
+	def _index(self, battery, test):
+		path = os.path.join(self.root, battery, test)
+		mtime = os.stat(path).st_mtime_ns
+		names = sorted(os.listdir(path))
+		prompts = {}
+		for name in names:
+			text = ""
+			if name.endswith(".txt"):
+				with open(os.path.join(path, name), 'r') as content:
+					text = content.read()
+			prompts[os.path.splitext(name)[0]] = (prompt_template(battery, name), text)
+		return mtime, names, prompts
+
+	def _test(self, battery, test):
+		now = time.monotonic()
+		entry = self._tests.get((battery, test))
+		if entry is None:
+			mtime, names, prompts = self._index(battery, test)
+		else:
+			checked, mtime, names, prompts = entry
+			if now - checked < self.refresh_interval:
+				return names, prompts
+			if os.stat(os.path.join(self.root, battery, test)).st_mtime_ns != mtime:
+				mtime, names, prompts = self._index(battery, test)
+		self._tests[(battery, test)] = (now, mtime, names, prompts)
+		return names, prompts
+
+	## index every battery and test up front (e.g. at startup, before uwsgi forks its workers)
+	# returns the number of prompts indexed
+	def build(self):
+		count = 0
+		if not os.path.isdir(self.root):
+			return count
+		for battery in sorted(os.listdir(self.root)):
+			if not os.path.isdir(os.path.join(self.root, battery)):
+				continue
+			for test in sorted(os.listdir(os.path.join(self.root, battery))):
+				if os.path.isdir(os.path.join(self.root, battery, test)):
+					count += len(self._test(battery, test)[1])
+		return count
+
+	## (template, text prompt) of a question (see template_picker)
+	def lookup(self, battery, test, question):
+		names, prompts = self._test(battery, test)
+		if question in prompts:
+			return prompts[question]
+		# not a whole prompt file name: fall back to the original substring match over the file names
+		# (a text prompt then has no <question>.txt to read, so its text is empty)
+		template = "recorder_invalid-prompt.html"
+		for name in names:
+			if question in name:
+				template = prompt_template(battery, name)
+		return template, ""
+
+
+_prompt_indexes = {}
+
+## the process-wide prompt index of a flask app home directory
+def prompt_index(home):
+	if home not in _prompt_indexes:
+		_prompt_indexes[home] = PromptIndex(home)
+	return _prompt_indexes[home]
 
 
 ## detect type of question prompt (text, audio, image); pre-process text data
 # detects the type of question given by the user-defined question name, through its file extension.
 # returns 2 vars:	the correct template to render, in accordance with the file type of the prompt.
-# 			the text prompt, as a string. (if not a text prompt, this is a NoneType)
+# 			the text prompt, as a string. (if not a text prompt, this is an empty string)
 # supported prompt file types: .txt, .wav, .png
+# prompts are looked up in the process-wide PromptIndex instead of listing and reading the test directory on every call.
 # battery: test battery name, as a string
 # test: test name, as a string
 # question: question name, as a string
 # home: home directory of the flask app, as a string
 def template_picker(battery, test, question, home):
-	path = os.path.join(home,'static','test-files',battery,test)
-	template = "recorder_invalid-prompt.html"
-	string = ""
-
-	for e in os.listdir(path):
-		if question in e:
-			if e.endswith(".txt"):
-				filename = os.path.join(path,question+'.txt')
-				print(filename)
-				with open(filename,'r') as content:
-					string = content.read()
-				template = battery + "/recorder_text-prompt.html"
-			elif e.endswith(".wav"):
-				if "qual" in e: template = battery + "/recorder_audio-prompt-diag.html"
-				else: template = battery + "/recorder_audio-prompt.html"
-			elif e.endswith(".png"):
-				template = battery + "/recorder_image-prompt.html"
-			else:
-				template = battery + "/recorder_invalid-prompt.html"
-
-	return template, string
+	return prompt_index(home).lookup(battery, test, question)
 
 
 ## get all mturk ExternalQuestion arguments
@@ -0,0 +1,262 @@
+# ingest.py
+# streaming, resumable upload of worker recordings: the body is written to disk block by block as it arrives, and the WAV
+# header, duration and a running energy/VAD summary are computed on the way, so validation never has to reopen the file
+# to measure it. an upload is sent in chunks at byte offsets; a chunk that is retransmitted after a lost response is
+# ignored up to what already arrived, and a client that lost its connection asks for the received offset and resumes there.
+import fcntl
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+
+## upload states
+RECEIVING, COMPLETE = 'receiving', 'complete'
+
+WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_EXTENSIBLE = 1, 3, 0xFFFE
+# the data chunk has to start within this many bytes of the file
+MAX_HEADER_BYTES = 64 * 1024
+# bytes read from the request (and analysed) at a time
+BLOCK_SIZE = 64 * 1024
+
+
+## an upload the server refuses
+# status: the HTTP status to answer with (400 bad request, 409 wrong offset, 413 too large, 415 not a supported WAV file)
+class UploadError(Exception):
+	def __init__(self, message, status=400):
+		super().__init__(message)
+		self.status = status
+
+
+## parse the header of a (partly received) WAV file
+# head: the first bytes of the file
+# returns None if more bytes are needed, or a dict with format, channels, samplerate, sample_width, block_align, data_offset and
+# data_size (None if the writer did not know it yet); raises UploadError (415) if this is not a PCM or float WAV file
+def parse_wav_header(head):
+	if len(head) < 12:
+		return None
+	if head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+		raise UploadError('not a WAV file', 415)
+	fmt = None
+	position = 12
+	while position + 8 <= len(head):
+		chunk_id, size = head[position:position + 4], struct.unpack('<I', head[position + 4:position + 8])[0]
+		if chunk_id == b'fmt ':
+			if position + 8 + size > len(head):
+				return None
+			fmt = head[position + 8:position + 8 + size]
+		elif chunk_id == b'data':
+			if fmt is None or len(fmt) < 16:
+				raise UploadError('WAV data chunk before its fmt chunk', 415)
+			header = _parse_fmt(fmt)
+			header['data_offset'] = position + 8
+			header['data_size'] = size if 0 < size < 0xFFFFFFFF else None
+			return header
+		position += 8 + size + (size & 1)
+	if position >= MAX_HEADER_BYTES:
+		raise UploadError('no WAV data chunk in the first %d bytes' % MAX_HEADER_BYTES, 415)
+	return None
+
+
+def _parse_fmt(fmt):
+	format_tag, channels, samplerate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+	if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+		format_tag = struct.unpack('<H', fmt[24:26])[0]
+	sample_width = bits // 8
+	if not ((format_tag == WAVE_FORMAT_PCM and sample_width in (1, 2, 3, 4))
+			or (format_tag == WAVE_FORMAT_IEEE_FLOAT and sample_width in (4, 8))):
+		raise UploadError('unsupported WAV encoding (format %d, %d bits)' % (format_tag, bits), 415)
+	if channels < 1 or samplerate < 1 or block_align != channels * sample_width:
+		raise UploadError('inconsistent WAV fmt chunk', 415)
+	return {'format': format_tag, 'channels': channels, 'samplerate': samplerate, 'sample_width': sample_width,
+		'block_align': block_align}
+
+
+## decode raw WAV sample bytes (whole blocks) to a mono float signal in [-1, 1]
+def decode_samples(raw, header):
+	width = header['sample_width']
+	if header['format'] == WAVE_FORMAT_IEEE_FLOAT:
+		x = np.frombuffer(raw, dtype='<f%d' % width).astype(np.float64)
+	elif width == 1:
+		x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128) / 128
+	elif width == 3:
+		triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+		x = ((triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)) << 8 >> 8) / float(1 << 23)
+	else:
+		x = np.frombuffer(raw, dtype='<i%d' % width) / float(1 << (8 * width - 1))
+	return x.reshape(-1, header['channels']).mean(axis=1)
+
+
+## seconds of a signal whose frames (world.loudness frames) are louder than threshold_db dBFS
+# for recordings that arrived without an upload summary
+def voiced_seconds(x, fs, threshold_db):
+	from world import loudness
+	frame_length, hop_length = loudness.frame_lengths(fs)
+	power = loudness.frame_power(loudness.to_mono(x), frame_length, hop_length)
+	return int(np.count_nonzero(power >= 10 ** (threshold_db / 10))) * hop_length / fs
+
+
+## streaming upload of one worker recording
+# the file is received into <path>.part and moved to path once complete. the upload's state and running summary are kept in
+# <path without .wav>_upload.json, so any app process can take the next chunk, and validation can read the measurements.
+# path: where the finished recording goes (<save_location>/<env>/<worker>_<ass>_worker_recording.wav), as a string
+# max_bytes: largest recording accepted, in bytes
+# vad_threshold_db: frames (25 ms, every 10 ms) louder than this many dBFS count as voiced
+class UploadSession:
+	def __init__(self, path, max_bytes=16 * 1024 * 1024, vad_threshold_db=-45.0):
+		self.path = path
+		self.part_path = path + '.part'
+		self.summary_path = os.path.splitext(path)[0] + '_upload.json'
+		self.lock_path = os.path.splitext(path)[0] + '_upload.lock'
+		self.max_bytes = max_bytes
+		self.vad_threshold_db = vad_threshold_db
+		self.state = self._load()
+
+	def _load(self):
+		try:
+			with open(self.summary_path, 'r') as handle:
+				return json.load(handle)
+		except (FileNotFoundError, ValueError):
+			return None
+
+	def _save(self):
+		self.state['updated'] = time.time()
+		temporary = self.summary_path + '.tmp'
+		with open(temporary, 'w') as handle:
+			json.dump(self.state, handle)
+		os.replace(temporary, self.summary_path)
+
+	def _new_state(self, upload_id, total):
+		return {'upload': upload_id, 'status': RECEIVING, 'received': 0, 'total': total, 'header': None, 'samples': 0,
+			'vad_threshold_db': self.vad_threshold_db, 'next_frame': 0, 'frames': 0, 'voiced_frames': 0, 'power_sum': 0.0,
+			'peak_power': 0.0, 'started': time.time()}
+
+	## True once the upload finished and path still holds the file it received
+	@property
+	def complete(self):
+		return (self.state is not None and self.state['status'] == COMPLETE and os.path.exists(self.path)
+			and os.path.getsize(self.path) == self.state['received'])
+
+	## length of the received audio in seconds (what val1b measures)
+	@property
+	def duration(self):
+		header = self.state['header'] if self.state is not None else None
+		return self.state['samples'] / header['samplerate'] if header else 0.0
+
+	## seconds of voiced frames in the received audio (what the silence gate, val1c, measures)
+	@property
+	def voiced_duration(self):
+		header = self.state['header'] if self.state is not None else None
+		if not header:
+			return 0.0
+		from world import loudness
+		return self.state['voiced_frames'] * loudness.frame_lengths(header['samplerate'])[1] / header['samplerate']
+
+	## the upload's progress and measurements, as a json-serializable dict
+	# upload_id: the client's id of the upload it wants to resume; an upload with another id reports nothing received
+	def status(self, upload_id=None):
+		if self.state is None or (upload_id is not None and upload_id != self.state['upload']):
+			return {'upload': upload_id, 'status': RECEIVING, 'received': 0}
+		header = self.state['header'] or {}
+		power = self.state['power_sum'] / self.state['frames'] if self.state['frames'] else 0.0
+		return {'upload': self.state['upload'], 'status': self.state['status'], 'received': self.state['received'],
+			'total': self.state['total'], 'samplerate': header.get('samplerate'), 'channels': header.get('channels'),
+			'duration': round(self.duration, 3), 'voiced_duration': round(self.voiced_duration, 3),
+			'mean_db': round(10 * np.log10(max(power, 1e-10)), 1), 'peak_db': round(10 * np.log10(max(self.state['peak_power'], 1e-10)), 1)}
+
+	## write a chunk of the upload, read from stream in blocks, at byte offset
+	# upload_id: the client's id of this upload (a new id starts over, e.g. the worker recorded again)
+	# total: size of the whole file in bytes, if known; the upload completes when that many bytes arrived
+	# returns status(); raises UploadError
+	def write(self, upload_id, offset, stream, total=None):
+		if total is not None and total > self.max_bytes:
+			raise UploadError('recording larger than %d bytes' % self.max_bytes, 413)
+		os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+		with open(self.lock_path, 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			self.state = self._load()
+			if self.state is None or self.state['upload'] != upload_id:
+				if offset != 0:
+					raise UploadError('unknown upload; start again from offset 0', 409)
+				self.state = self._new_state(upload_id, total)
+				open(self.part_path, 'wb').close()
+			if self.state['status'] == COMPLETE:
+				return self.status()
+			if offset > self.state['received']:
+				raise UploadError('offset %d is past the %d bytes received' % (offset, self.state['received']), 409)
+			if total is not None and self.state['total'] not in (None, total):
+				raise UploadError('total changed from %d to %d bytes' % (self.state['total'], total), 400)
+			self.state['total'] = total if total is not None else self.state['total']
+			try:
+				self._receive(stream, self.state['received'] - offset)
+			finally:
+				self._save()
+			if self.state['total'] is not None and self.state['received'] >= self.state['total']:
+				self._finish()
+		return self.status()
+
+	def _receive(self, stream, skip):
+		with open(self.part_path, 'r+b') as part:
+			while True:
+				block = stream.read(BLOCK_SIZE)
+				if not block:
+					break
+				if skip:
+					# retransmitted bytes that already arrived
+					dropped = min(skip, len(block))
+					block, skip = block[dropped:], skip - dropped
+					if not block:
+						continue
+				received = self.state['received']
+				if received + len(block) > self.max_bytes:
+					raise UploadError('recording larger than %d bytes' % self.max_bytes, 413)
+				if self.state['total'] is not None and received + len(block) > self.state['total']:
+					raise UploadError('more than the announced %d bytes' % self.state['total'], 400)
+				part.seek(received)
+				part.write(block)
+				part.flush()
+				self.state['received'] = received + len(block)
+				self._analyse(part)
+
+	## update the header, sample count and frame energies with the bytes that arrived since the last call
+	def _analyse(self, part):
+		state = self.state
+		if state['header'] is None:
+			part.seek(0)
+			state['header'] = parse_wav_header(part.read(min(state['received'], MAX_HEADER_BYTES)))
+			if state['header'] is None:
+				if state['received'] >= MAX_HEADER_BYTES:
+					raise UploadError('no WAV data chunk in the first %d bytes' % MAX_HEADER_BYTES, 415)
+				return
+		header = state['header']
+		data_end = state['received']
+		if header['data_size'] is not None:
+			data_end = min(data_end, header['data_offset'] + header['data_size'])
+		state['samples'] = max(0, data_end - header['data_offset']) // header['block_align']
+
+		from world import loudness
+		frame_length, hop_length = loudness.frame_lengths(header['samplerate'])
+		if state['samples'] < frame_length:
+			return
+		last_frame = (state['samples'] - frame_length) // hop_length
+		if last_frame < state['next_frame']:
+			return
+		start = state['next_frame'] * hop_length
+		count = last_frame * hop_length + frame_length - start
+		part.seek(header['data_offset'] + start * header['block_align'])
+		x = decode_samples(part.read(count * header['block_align']), header)
+		power = loudness.frame_power(x, frame_length, hop_length)
+		state['next_frame'] = last_frame + 1
+		state['frames'] += len(power)
+		state['voiced_frames'] += int(np.count_nonzero(power >= 10 ** (state['vad_threshold_db'] / 10)))
+		state['power_sum'] += float(power.sum())
+		state['peak_power'] = max(state['peak_power'], float(power.max()))
+
+	def _finish(self):
+		if self.state['header'] is None:
+			raise UploadError('not a WAV file', 415)
+		os.replace(self.part_path, self.path)
+		self.state['status'] = COMPLETE
+		self._save()
@@ -0,0 +1,162 @@
+# jobs.py
+# background synthesis job queue
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+
+## job states
+# queued: waiting for an analysis worker (also used between retries)
+# running: claimed by an analysis worker
+# done: synthesized response written to <worker>_<ass>_synthesized.wav
+# failed: gave up after max_attempts
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+TERMINAL_STATES = (DONE, FAILED)
+
+
+## local synthesis job queue
+# sqlite-backed queue shared by every uwsgi process and analysis worker on the same machine (no SQS needed).
+# one job per (worker_id, ass_id); re-enqueueing a job (e.g. the worker re-records) resets it.
+# db_path: path of the sqlite database file, as a string
+# lease_timeout: seconds after which a running job whose worker died is handed out again
+# every claim gets a new lease id; only the holder of the current lease can complete or fail the job, so a worker whose lease
+# expired, or whose job was re-enqueued meanwhile, cannot overwrite the state of the run that replaced it
+class JobQueue:
+	def __init__(self, db_path, lease_timeout=300):
+		self.db_path = db_path
+		self.lease_timeout = lease_timeout
+		os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+		with closing(self._connect()) as conn:
+			conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+				job_id TEXT PRIMARY KEY,
+				worker_id TEXT NOT NULL,
+				ass_id TEXT NOT NULL,
+				payload TEXT NOT NULL,
+				status TEXT NOT NULL,
+				attempts INTEGER NOT NULL DEFAULT 0,
+				max_attempts INTEGER NOT NULL,
+				error TEXT,
+				created REAL NOT NULL,
+				updated REAL NOT NULL,
+				available_at REAL NOT NULL,
+				lease_expires REAL,
+				lease_id TEXT)''')
+			# queues created before lease ids
+			if 'lease_id' not in [column['name'] for column in conn.execute('PRAGMA table_info(jobs)')]:
+				conn.execute('ALTER TABLE jobs ADD COLUMN lease_id TEXT')
+			conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, available_at)')
+
+	def _connect(self):
+		conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+		conn.row_factory = sqlite3.Row
+		conn.execute('PRAGMA journal_mode=WAL')
+		return conn
+
+	## add (or reset) the synthesis job for a worker's assignment
+	# payload: json-serializable dict handed to the analysis worker
+	# returns the job id, as a string
+	def enqueue(self, worker_id, ass_id, payload, max_attempts=3):
+		job_id = job_id_for(worker_id, ass_id)
+		now = time.time()
+		with closing(self._connect()) as conn:
+			conn.execute('''INSERT INTO jobs (job_id, worker_id, ass_id, payload, status, attempts, max_attempts,
+					error, created, updated, available_at, lease_expires)
+				VALUES (?, ?, ?, ?, ?, 0, ?, NULL, ?, ?, ?, NULL)
+				ON CONFLICT(job_id) DO UPDATE SET payload=excluded.payload, status=excluded.status, attempts=0,
+					max_attempts=excluded.max_attempts, error=NULL, updated=excluded.updated,
+					available_at=excluded.available_at, lease_expires=NULL, lease_id=NULL''',
+				(job_id, worker_id, ass_id, json.dumps(payload), QUEUED, max_attempts, now, now, now))
+		return job_id
+
+	## atomically claim the oldest runnable job
+	# runnable: queued and past its retry delay, or running with an expired lease (the worker process died) and attempts left.
+	# a job whose lease expired on its last attempt is marked failed instead, so a job that kills its worker (e.g. a native
+	# crash) is not run forever
+	# returns the job as a dict (payload decoded, lease_id: the claim's token for complete() and fail()), or None if nothing is runnable
+	def claim(self):
+		now = time.time()
+		conn = self._connect()
+		try:
+			conn.execute('BEGIN IMMEDIATE')
+			conn.execute('''UPDATE jobs SET status = ?, error = COALESCE(error, ?), updated = ?, lease_expires = NULL, lease_id = NULL
+				WHERE status = ? AND lease_expires <= ? AND attempts >= max_attempts''',
+				(FAILED, 'the analysis worker died (lease expired) on the last attempt', now, RUNNING, now))
+			row = conn.execute('''SELECT * FROM jobs
+				WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires <= ? AND attempts < max_attempts)
+				ORDER BY available_at LIMIT 1''', (QUEUED, now, RUNNING, now)).fetchone()
+			if row is None:
+				conn.execute('COMMIT')
+				return None
+			lease_id = uuid.uuid4().hex
+			conn.execute('UPDATE jobs SET status = ?, attempts = attempts + 1, updated = ?, lease_expires = ?, lease_id = ? WHERE job_id = ?',
+				(RUNNING, now, now + self.lease_timeout, lease_id, row['job_id']))
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+		finally:
+			conn.close()
+		job = dict(row)
+		job['status'] = RUNNING
+		job['attempts'] += 1
+		job['lease_id'] = lease_id
+		job['payload'] = json.loads(job['payload'])
+		return job
+
+	## mark a claimed job as finished
+	# lease_id: the token claim() returned with the job
+	# returns False (and changes nothing) if the lease was lost: it expired and the job was claimed again, or it was re-enqueued
+	def complete(self, job_id, lease_id):
+		with closing(self._connect()) as conn:
+			cursor = conn.execute('UPDATE jobs SET status = ?, updated = ?, lease_expires = NULL, lease_id = NULL WHERE job_id = ? AND lease_id = ?',
+				(DONE, time.time(), job_id, lease_id))
+		return cursor.rowcount > 0
+
+	## record a failed attempt
+	# re-queues the job with exponential backoff (2, 4, 8... seconds) until max_attempts is reached, then marks it failed
+	# lease_id: the token claim() returned with the job
+	# returns the new status, as a string; None (and changes nothing) if the lease was lost (see complete())
+	def fail(self, job_id, lease_id, error):
+		now = time.time()
+		conn = self._connect()
+		try:
+			conn.execute('BEGIN IMMEDIATE')
+			row = conn.execute('SELECT attempts, max_attempts FROM jobs WHERE job_id = ? AND lease_id = ?', (job_id, lease_id)).fetchone()
+			status = None
+			if row is not None:
+				status = QUEUED if row['attempts'] < row['max_attempts'] else FAILED
+				conn.execute('''UPDATE jobs SET status = ?, error = ?, updated = ?, available_at = ?, lease_expires = NULL, lease_id = NULL
+					WHERE job_id = ? AND lease_id = ?''', (status, str(error), now, now + 2 ** row['attempts'], job_id, lease_id))
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+		finally:
+			conn.close()
+		return status
+
+	## look up a job
+	# returns a dict with job_id, status, attempts, max_attempts, error, created, updated; None if no such job
+	def status(self, job_id):
+		with closing(self._connect()) as conn:
+			row = conn.execute('SELECT job_id, status, attempts, max_attempts, error, created, updated FROM jobs WHERE job_id = ?',
+				(job_id,)).fetchone()
+		return dict(row) if row is not None else None
+
+	## long-poll a job until it reaches a terminal state or timeout (seconds) elapses
+	# returns the latest status dict (see status())
+	def wait(self, job_id, timeout, poll_interval=0.5):
+		deadline = time.time() + timeout
+		job = self.status(job_id)
+		while job is not None and job['status'] not in TERMINAL_STATES and time.time() < deadline:
+			time.sleep(poll_interval)
+			job = self.status(job_id)
+		return job
+
+
+## job id of a worker's assignment
+def job_id_for(worker_id, ass_id):
+	return worker_id + '_' + ass_id
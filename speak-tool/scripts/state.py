@@ -0,0 +1,192 @@
+# state.py
+# session state store: every worker's task state in one indexed sqlite database shared by the app processes,
+# instead of <worker>.txt, <worker>_<ass>_trait_config.txt / _entrainment_config.txt / _starttime.pickle / _endtime.pickle,
+# <worker>_score.txt and codes.pickle in the save directory
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+
+## claim_worker results
+# claimed: the worker had not started the task; this assignment now owns it
+# owned: this assignment already owned the worker (the worker resumed the task)
+# taken: another assignment owns the worker
+CLAIMED, OWNED, TAKEN = 'claimed', 'owned', 'taken'
+
+## assignment status, in order
+STARTED, RECORDED, COMPLETED = 'started', 'recorded', 'completed'
+
+ASSIGNMENT_FIELDS = ('trait', 'entrainment_features', 'status', 'started', 'ended', 'score')
+
+
+## session state store
+# db_path: path of the sqlite database file, as a string
+# journal_mode: 'wal' (default) for a database on the app machine's local disk. several app nodes can share one database
+#	file on network storage with 'delete' (rollback journal + file locks), since WAL needs shared memory on one host.
+class StateStore:
+	def __init__(self, db_path, journal_mode='wal'):
+		self.db_path = db_path
+		self.journal_mode = journal_mode
+		self._constants = {}
+		os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+		with closing(self._connect()) as conn:
+			conn.execute('''CREATE TABLE IF NOT EXISTS workers (
+				worker_id TEXT PRIMARY KEY,
+				ass_id TEXT NOT NULL,
+				hit_id TEXT NOT NULL,
+				claimed REAL NOT NULL)''')
+			conn.execute('''CREATE TABLE IF NOT EXISTS assignments (
+				worker_id TEXT NOT NULL,
+				ass_id TEXT NOT NULL,
+				trait TEXT,
+				entrainment_features TEXT,
+				status TEXT,
+				started REAL,
+				ended REAL,
+				score TEXT,
+				updated REAL NOT NULL,
+				PRIMARY KEY (worker_id, ass_id))''')
+			conn.execute('CREATE INDEX IF NOT EXISTS assignments_condition_idx ON assignments (entrainment_features, status)')
+			conn.execute('CREATE INDEX IF NOT EXISTS assignments_status_idx ON assignments (status, updated)')
+			conn.execute('CREATE TABLE IF NOT EXISTS constants (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+	def _connect(self):
+		conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+		conn.row_factory = sqlite3.Row
+		conn.execute('PRAGMA journal_mode=' + self.journal_mode)
+		return conn
+
+	## atomic check-and-set of the "already started this task" logic
+	# claims the worker for (ass_id, hit_id) unless another assignment has; returns CLAIMED, OWNED or TAKEN
+	def claim_worker(self, worker_id, ass_id, hit_id=''):
+		with closing(self._connect()) as conn:
+			cursor = conn.execute('INSERT INTO workers (worker_id, ass_id, hit_id, claimed) VALUES (?, ?, ?, ?) ON CONFLICT(worker_id) DO NOTHING',
+				(worker_id, ass_id, hit_id, time.time()))
+			if cursor.rowcount > 0:
+				return CLAIMED
+			row = conn.execute('SELECT ass_id, hit_id FROM workers WHERE worker_id = ?', (worker_id,)).fetchone()
+		return OWNED if (row['ass_id'], row['hit_id']) == (ass_id, hit_id) else TAKEN
+
+	## undo a claim (e.g. no condition could be assigned), so the worker can start again
+	def release_worker(self, worker_id, ass_id):
+		with closing(self._connect()) as conn:
+			conn.execute('DELETE FROM workers WHERE worker_id = ? AND ass_id = ?', (worker_id, ass_id))
+
+	## the (ass_id, hit_id) that owns a worker, or None if the worker has not started the task
+	def worker_owner(self, worker_id):
+		with closing(self._connect()) as conn:
+			row = conn.execute('SELECT ass_id, hit_id FROM workers WHERE worker_id = ?', (worker_id,)).fetchone()
+		return (row['ass_id'], row['hit_id']) if row is not None else None
+
+	## set fields of a worker's assignment (created on first use)
+	# fields: any of ASSIGNMENT_FIELDS; entrainment_features is a list of feature names
+	def update(self, worker_id, ass_id, **fields):
+		unknown = set(fields) - set(ASSIGNMENT_FIELDS)
+		if unknown:
+			raise ValueError('unknown assignment fields: %s' % ', '.join(sorted(unknown)))
+		if 'entrainment_features' in fields:
+			fields['entrainment_features'] = json.dumps(list(fields['entrainment_features']))
+		columns = sorted(fields)
+		values = [fields[column] for column in columns]
+		with closing(self._connect()) as conn:
+			conn.execute('INSERT INTO assignments (worker_id, ass_id, updated' + ''.join(', ' + column for column in columns) + ') VALUES (?, ?, ?'
+				+ ', ?' * len(columns) + ') ON CONFLICT(worker_id, ass_id) DO UPDATE SET updated = excluded.updated'
+				+ ''.join(', %s = excluded.%s' % (column, column) for column in columns),
+				[worker_id, ass_id, time.time()] + values)
+
+	## a worker's assignment as a dict (entrainment_features decoded to a list), or None
+	def get(self, worker_id, ass_id):
+		with closing(self._connect()) as conn:
+			row = conn.execute('SELECT * FROM assignments WHERE worker_id = ? AND ass_id = ?', (worker_id, ass_id)).fetchone()
+		return self._decode(row) if row is not None else None
+
+	## assignments by condition and/or status, oldest update first
+	# entrainment_features: list of feature names (None: any); status: one of STARTED, RECORDED, COMPLETED (None: any)
+	def query(self, entrainment_features=None, status=None):
+		clauses, values = [], []
+		if entrainment_features is not None:
+			clauses.append('entrainment_features = ?')
+			values.append(json.dumps(list(entrainment_features)))
+		if status is not None:
+			clauses.append('status = ?')
+			values.append(status)
+		with closing(self._connect()) as conn:
+			rows = conn.execute('SELECT * FROM assignments' + (' WHERE ' + ' AND '.join(clauses) if clauses else '') + ' ORDER BY updated',
+				values).fetchall()
+		return [self._decode(row) for row in rows]
+
+	@staticmethod
+	def _decode(row):
+		assignment = dict(row)
+		if assignment['entrainment_features'] is not None:
+			assignment['entrainment_features'] = json.loads(assignment['entrainment_features'])
+		return assignment
+
+	## immutable values (e.g. the completion codes), cached in-process after the first read
+	# returns default if the constant was never set
+	def constant(self, name, default=None):
+		if name not in self._constants:
+			with closing(self._connect()) as conn:
+				row = conn.execute('SELECT value FROM constants WHERE name = ?', (name,)).fetchone()
+			if row is None:
+				return default
+			self._constants[name] = json.loads(row['value'])
+		return self._constants[name]
+
+	## set a constant (json-serializable); processes that already cached it keep the old value until they restart
+	def set_constant(self, name, value):
+		with closing(self._connect()) as conn:
+			conn.execute('INSERT OR REPLACE INTO constants (name, value) VALUES (?, ?)', (name, json.dumps(value)))
+		self._constants[name] = value
+
+	## import the state an older deployment left as files in directory (<save_location>/<env>)
+	# returns the number of assignments imported
+	def import_files(self, directory):
+		def read(name):
+			with open(os.path.join(directory, name), 'r') as handle:
+				return handle.readline().strip('\n')
+
+		def unpickle(name):
+			with open(os.path.join(directory, name), 'rb') as handle:
+				return pickle.load(handle)
+
+		assignments = set()
+		for name in sorted(os.listdir(directory)):
+			if name.endswith('_trait_config.txt'):
+				worker_id, ass_id = name[:-len('_trait_config.txt')].split('_', 1)
+				self.update(worker_id, ass_id, trait=read(name))
+			elif name.endswith('_entrainment_config.txt'):
+				worker_id, ass_id = name[:-len('_entrainment_config.txt')].split('_', 1)
+				self.update(worker_id, ass_id, entrainment_features=json.loads(read(name).replace("'", '"')))
+			elif name.endswith('_starttime.pickle'):
+				worker_id, ass_id = name[:-len('_starttime.pickle')].split('_', 1)
+				self.update(worker_id, ass_id, started=unpickle(name))
+			elif name.endswith('_endtime.pickle'):
+				worker_id, ass_id = name[:-len('_endtime.pickle')].split('_', 1)
+				self.update(worker_id, ass_id, ended=unpickle(name), status=COMPLETED)
+			else:
+				continue
+			assignments.add((worker_id, ass_id))
+		for name in os.listdir(directory):
+			if name.endswith('.txt') and name.count('_') == 0:
+				owner = read(name).split('_')
+				self.claim_worker(name[:-len('.txt')], owner[0], owner[1] if len(owner) > 1 else '')
+		with closing(self._connect()) as conn:
+			conn.execute('UPDATE assignments SET status = ? WHERE status IS NULL', (STARTED,))
+		for name in os.listdir(directory):
+			owner = self.worker_owner(name[:-len('_score.txt')]) if name.endswith('_score.txt') else None
+			if owner is not None:
+				self.update(name[:-len('_score.txt')], owner[0], score=read(name))
+		if os.path.exists(os.path.join(directory, 'codes.pickle')):
+			self.set_constant('codes', list(unpickle('codes.pickle')))
+		return len(assignments)
+
+
+## python scripts/state.py <save_location>/<env>: import an older deployment's state files into <save_location>/<env>/state.sqlite3
+if __name__ == '__main__':
+	directory = sys.argv[1]
+	print(StateStore(os.path.join(directory, 'state.sqlite3')).import_files(directory), 'assignments imported')
@@ -0,0 +1,11 @@
+# conftest.py
+# offline tests of the helpers; run with: python -m pytest scripts/tests (from speak-tool/)
+# test_speech_recognition.py calls the Google speech API and is not collected
+import os
+import sys
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(tests_dir, '..', '..')))		# speak-tool (import scripts)
+sys.path.insert(0, os.path.abspath(os.path.join(tests_dir, '..', '..', '..')))	# the framework (import world)
+
+collect_ignore = ['test_speech_recognition.py']
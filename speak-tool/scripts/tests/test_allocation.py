@@ -0,0 +1,128 @@
+import collections
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from scripts import allocation
+from scripts.allocation import CONDITIONS, LocalAllocator, SqsAllocator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(allocation, 'time', clock)
+    return clock
+
+
+def test_local_allocator_assigns_every_arm_equally_often(tmp_path):
+    allocator = LocalAllocator(str(tmp_path / 'allocation.sqlite3'), seed=1)
+    assigned = collections.Counter(allocator.allocate('w%d' % i, 'a%d' % i) for i in range(3 * len(CONDITIONS)))
+    assert sorted(assigned) == sorted(json.dumps(features) for features in CONDITIONS)
+    assert set(assigned.values()) == {3}
+
+
+def test_local_allocator_renews_the_lease_of_a_returning_worker(tmp_path, clock):
+    allocator = LocalAllocator(str(tmp_path / 'allocation.sqlite3'), lease_timeout=100, seed=1)
+    first = allocator.allocate('w1', 'a1')
+    clock.now += 80
+    assert allocator.allocate('w1', 'a1') == first
+    clock.now += 80
+    # still within the renewed lease: the slot is not handed out again
+    others = [allocator.allocate('w%d' % i, 'a%d' % i) for i in range(2, len(CONDITIONS) + 1)]
+    assert first not in others
+    assert allocator.complete('w1', 'a1')
+
+
+def test_local_allocator_hands_out_an_expired_lease_again(tmp_path, clock):
+    allocator = LocalAllocator(str(tmp_path / 'allocation.sqlite3'), lease_timeout=100, seed=1)
+    first = allocator.allocate('w1', 'a1')
+    clock.now += 101
+    assert allocator.allocate('w2', 'a2') == first
+    # the first worker lost its condition and gets a fresh one
+    assert not allocator.complete('w1', 'a1')
+    assert allocator.allocate('w1', 'a1') != first
+    assert allocator.complete('w1', 'a1') and allocator.complete('w2', 'a2')
+    counts = allocator.counts()
+    assert sum(count[allocation.COMPLETED] for count in counts.values()) == 2
+
+
+def test_local_allocator_release_returns_the_condition(tmp_path):
+    allocator = LocalAllocator(str(tmp_path / 'allocation.sqlite3'), seed=1)
+    first = allocator.allocate('w1', 'a1')
+    assert allocator.release('w1', 'a1')
+    assert allocator.allocate('w2', 'a2') == first
+
+
+class FakeSqs:
+    """Just enough of an SQS client: a queue of condition messages with receipt handles and visibility."""
+
+    def __init__(self, clock, bodies):
+        self.clock = clock
+        self.messages = [{'MessageId': str(i), 'Body': body, 'visible_at': 0.0, 'receipt': None} for i, body in enumerate(bodies)]
+        self.receipts = 0
+
+    def _by_receipt(self, receipt):
+        for message in self.messages:
+            if message['receipt'] == receipt:
+                return message
+        raise ClientError({'Error': {'Code': 'ReceiptHandleIsInvalid', 'Message': receipt}}, 'ChangeMessageVisibility')
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, VisibilityTimeout):
+        received = []
+        for message in self.messages:
+            if len(received) < MaxNumberOfMessages and message['visible_at'] <= self.clock.now:
+                self.receipts += 1
+                message['receipt'] = 'r%d' % self.receipts
+                message['visible_at'] = self.clock.now + VisibilityTimeout
+                received.append({'Body': message['Body'], 'ReceiptHandle': message['receipt']})
+        return {'Messages': received}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self._by_receipt(ReceiptHandle)['visible_at'] = self.clock.now + VisibilityTimeout
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.messages.remove(self._by_receipt(ReceiptHandle))
+
+
+def sqs_allocator(tmp_path, clock, bodies):
+    client = FakeSqs(clock, bodies)
+    return SqsAllocator(str(tmp_path / 'allocation.sqlite3'), 'queue', lease_timeout=100, client=client), client
+
+
+def test_sqs_allocator_deletes_the_message_of_a_completed_assignment(tmp_path, clock):
+    allocator, client = sqs_allocator(tmp_path, clock, ['["entrain-pitch"]', '[]'])
+    assert allocator.allocate('w1', 'a1') == '["entrain-pitch"]'
+    assert allocator.allocate('w1', 'a1') == '["entrain-pitch"]'
+    assert allocator.complete('w1', 'a1')
+    assert [message['Body'] for message in client.messages] == ['[]']
+
+
+def test_sqs_allocator_renews_the_lease_of_a_returning_worker(tmp_path, clock):
+    allocator, client = sqs_allocator(tmp_path, clock, ['["entrain-pitch"]', '[]'])
+    allocator.allocate('w1', 'a1')
+    clock.now += 80
+    allocator.allocate('w1', 'a1')
+    clock.now += 80
+    assert allocator.complete('w1', 'a1')
+    assert len(client.messages) == 1
+
+
+def test_sqs_allocator_gives_a_fresh_condition_after_the_lease_ran_out(tmp_path, clock):
+    allocator, client = sqs_allocator(tmp_path, clock, ['["entrain-pitch"]'])
+    allocator.allocate('w1', 'a1')
+    clock.now += 101
+    assert allocator.allocate('w2', 'a2') == '["entrain-pitch"]'
+    assert not allocator.complete('w1', 'a1')
+    # the queue is empty now: the first worker gets nothing instead of the second worker's message
+    assert allocator.allocate('w1', 'a1') is None
+    assert allocator.complete('w2', 'a2')
+    assert client.messages == []
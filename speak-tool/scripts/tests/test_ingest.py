@@ -0,0 +1,102 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from scripts import ingest
+from scripts.ingest import COMPLETE, RECEIVING, UploadError, UploadSession
+from scripts.validation import val1b, val1c
+
+
+def recording(seconds=2.0, fs=16000, channels=1, subtype='PCM_16', speech_seconds=1.0):
+    """A WAV file: `speech_seconds` of a loud tone, then silence."""
+    t = np.arange(int(seconds * fs)) / fs
+    x = np.where(t < speech_seconds, 0.4 * np.sin(2 * np.pi * 180 * t), 0.0)
+    buffer = io.BytesIO()
+    sf.write(buffer, np.column_stack([x] * channels) if channels > 1 else x, fs, subtype=subtype, format='WAV')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'env' / 'W1_A1_worker_recording.wav')
+
+
+def test_a_chunked_upload_survives_a_resend_and_a_resume(path):
+    wav = recording()
+    chunk = 10000
+    session = UploadSession(path)
+    session.write('u1', 0, io.BytesIO(wav[:chunk]), total=len(wav))
+    # the response to the second chunk is lost, so the client sends it again
+    session.write('u1', chunk, io.BytesIO(wav[chunk:2 * chunk]), total=len(wav))
+    status = session.write('u1', chunk, io.BytesIO(wav[chunk:2 * chunk]), total=len(wav))
+    assert (status['status'], status['received']) == (RECEIVING, 2 * chunk)
+
+    # the connection drops; another app process asks where to resume
+    resumed = UploadSession(path)
+    assert resumed.status('u1')['received'] == 2 * chunk
+    assert resumed.status('other-upload')['received'] == 0
+    # a retransmission that overlaps what already arrived is trimmed
+    resumed.write('u1', chunk + 500, io.BytesIO(wav[chunk + 500:3 * chunk]), total=len(wav))
+    status = resumed.write('u1', 3 * chunk, io.BytesIO(wav[3 * chunk:]), total=len(wav))
+
+    assert status['status'] == COMPLETE and resumed.complete
+    with open(path, 'rb') as received:
+        assert received.read() == wav
+    data, fs = sf.read(path)
+    assert status['samplerate'] == fs and status['duration'] == pytest.approx(len(data) / fs, abs=1e-3)
+    assert resumed.voiced_duration == pytest.approx(ingest.voiced_seconds(data, fs, -45.0))
+    assert 0.9 < resumed.voiced_duration < 1.1
+    assert val1b(resumed, 1.5) and val1c(resumed, 0.5) == val1c(path, 0.5) is True
+
+
+def test_a_new_upload_id_starts_over(path):
+    wav = recording(1.0)
+    session = UploadSession(path)
+    session.write('u1', 0, io.BytesIO(wav[:5000]), total=len(wav))
+    status = session.write('u2', 0, io.BytesIO(wav), total=len(wav))
+    assert status['status'] == COMPLETE and status['upload'] == 'u2' and status['received'] == len(wav)
+
+
+def test_out_of_order_chunks_are_refused(path):
+    wav = recording(1.0)
+    session = UploadSession(path)
+    with pytest.raises(UploadError) as error:
+        session.write('u1', 100, io.BytesIO(wav[100:]), total=len(wav))
+    assert error.value.status == 409
+    session.write('u1', 0, io.BytesIO(wav[:1000]), total=len(wav))
+    with pytest.raises(UploadError) as error:
+        session.write('u1', 2000, io.BytesIO(wav[2000:]), total=len(wav))
+    assert error.value.status == 409
+    with pytest.raises(UploadError) as error:
+        session.write('u1', 1000, io.BytesIO(wav[1000:]), total=len(wav) + 1)
+    assert error.value.status == 400
+
+
+def test_oversized_recordings_are_refused(path):
+    wav = recording(1.0)
+    with pytest.raises(UploadError) as error:
+        UploadSession(path, max_bytes=1000).write('u1', 0, io.BytesIO(wav), total=len(wav))
+    assert error.value.status == 413
+    # without an announced size, the limit applies while the body streams in
+    with pytest.raises(UploadError) as error:
+        UploadSession(path, max_bytes=1000).write('u2', 0, io.BytesIO(wav))
+    assert error.value.status == 413
+
+
+@pytest.mark.parametrize('body', [b'not a wav file at all', recording(0.2, subtype='ULAW')])
+def test_unsupported_files_are_refused(path, body):
+    with pytest.raises(UploadError) as error:
+        UploadSession(path).write('u1', 0, io.BytesIO(body), total=len(body))
+    assert error.value.status == 415
+
+
+@pytest.mark.parametrize('subtype,channels', [('PCM_U8', 1), ('PCM_24', 1), ('PCM_32', 2), ('FLOAT', 1), ('DOUBLE', 2)])
+def test_every_supported_encoding_decodes_like_soundfile(subtype, channels):
+    wav = recording(0.1, channels=channels, subtype=subtype)
+    header = ingest.parse_wav_header(wav)
+    raw = wav[header['data_offset']:header['data_offset'] + header['data_size']]
+    data, _ = sf.read(io.BytesIO(wav))
+    expected = data.mean(axis=1) if channels > 1 else data
+    np.testing.assert_allclose(ingest.decode_samples(raw, header), expected, atol=1e-7)
@@ -0,0 +1,116 @@
+import pytest
+
+from scripts import jobs
+from scripts.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), lease_timeout=300)
+
+
+def test_a_claimed_job_is_not_handed_out_twice(queue):
+    job_id = queue.enqueue('w1', 'a1', {'entrainment_features': ['entrain-pitch']})
+    job = queue.claim()
+    assert (job['job_id'], job['status'], job['attempts']) == (job_id, RUNNING, 1)
+    assert job['payload'] == {'entrainment_features': ['entrain-pitch']}
+    assert queue.claim() is None
+    assert queue.complete(job_id, job['lease_id'])
+    assert queue.status(job_id)['status'] == DONE
+
+
+def test_failed_attempts_back_off_then_fail_for_good(queue, clock):
+    job_id = queue.enqueue('w1', 'a1', {}, max_attempts=2)
+    assert queue.fail(job_id, queue.claim()['lease_id'], 'throttled') == QUEUED
+    assert queue.claim() is None
+    clock.now += 2
+    job = queue.claim()
+    assert job['attempts'] == 2
+    assert queue.fail(job_id, job['lease_id'], 'throttled again') == FAILED
+    clock.now += 100
+    assert queue.claim() is None
+    assert queue.status(job_id)['error'] == 'throttled again'
+
+
+def test_a_job_whose_worker_died_is_retried_until_its_attempts_are_used_up(queue, clock):
+    job_id = queue.enqueue('w1', 'a1', {}, max_attempts=2)
+    queue.claim()
+    clock.now += 301
+    assert queue.claim()['attempts'] == 2
+    clock.now += 301
+    assert queue.claim() is None
+    job = queue.status(job_id)
+    assert job['status'] == FAILED and 'died' in job['error']
+
+
+def test_re_enqueueing_resets_a_job(queue):
+    job_id = queue.enqueue('w1', 'a1', {}, max_attempts=1)
+    queue.fail(job_id, queue.claim()['lease_id'], 'boom')
+    queue.enqueue('w1', 'a1', {'again': True}, max_attempts=1)
+    job = queue.claim()
+    assert (job['attempts'], job['payload']) == (1, {'again': True})
+
+
+def test_wait_returns_once_the_job_is_done_or_the_timeout_passes(queue, clock):
+    job_id = queue.enqueue('w1', 'a1', {})
+    start = clock.now
+    assert queue.wait(job_id, 5)['status'] == QUEUED
+    assert clock.now - start >= 5
+    queue.complete(job_id, queue.claim()['lease_id'])
+    assert queue.wait(job_id, 5)['status'] == DONE
+
+
+def test_a_worker_that_lost_its_lease_cannot_finish_the_job(queue, clock):
+    job_id = queue.enqueue('w1', 'a1', {}, max_attempts=3)
+    stale = queue.claim()
+    clock.now += 301
+    current = queue.claim()
+    assert not queue.complete(job_id, stale['lease_id'])
+    assert queue.fail(job_id, stale['lease_id'], 'late') is None
+    assert queue.status(job_id)['status'] == RUNNING
+    assert queue.complete(job_id, current['lease_id'])
+    assert queue.status(job_id)['status'] == DONE
+
+
+def test_re_enqueueing_revokes_the_running_claim(queue):
+    job_id = queue.enqueue('w1', 'a1', {'take': 1})
+    stale = queue.claim()
+    queue.enqueue('w1', 'a1', {'take': 2})
+    assert not queue.complete(job_id, stale['lease_id'])
+    assert queue.status(job_id)['status'] == QUEUED
+    current = queue.claim()
+    assert current['attempts'] == stale['attempts'] and current['lease_id'] != stale['lease_id']
+    assert queue.complete(job_id, current['lease_id'])
+
+
+def test_queues_created_before_lease_ids_are_migrated(tmp_path, clock):
+    import sqlite3
+
+    path = str(tmp_path / 'old.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE jobs (job_id TEXT PRIMARY KEY, worker_id TEXT NOT NULL, ass_id TEXT NOT NULL, payload TEXT NOT NULL,
+        status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, error TEXT, created REAL NOT NULL,
+        updated REAL NOT NULL, available_at REAL NOT NULL, lease_expires REAL)''')
+    conn.commit()
+    conn.close()
+    queue = JobQueue(path)
+    job_id = queue.enqueue('w1', 'a1', {})
+    assert queue.complete(job_id, queue.claim()['lease_id'])
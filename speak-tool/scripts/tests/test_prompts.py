@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from scripts.helpers import PromptIndex, prompt_index, template_picker
+
+
+def listing_picker(battery, test, question, home):
+    """template_picker as it was: list the test directory and read the prompt on every call."""
+    path = os.path.join(home, 'static', 'test-files', battery, test)
+    template, string = 'recorder_invalid-prompt.html', ''
+    for e in os.listdir(path):
+        if question in e:
+            if e.endswith('.txt'):
+                with open(os.path.join(path, question + '.txt'), 'r') as content:
+                    string = content.read()
+                template = battery + '/recorder_text-prompt.html'
+            elif e.endswith('.wav'):
+                template = battery + ('/recorder_audio-prompt-diag.html' if 'qual' in e else '/recorder_audio-prompt.html')
+            elif e.endswith('.png'):
+                template = battery + '/recorder_image-prompt.html'
+            else:
+                template = battery + '/recorder_invalid-prompt.html'
+    return template, string
+
+
+@pytest.fixture
+def home(tmp_path):
+    test_dir = tmp_path / 'static' / 'test-files' / 'prosody_task' / 'reading'
+    test_dir.mkdir(parents=True)
+    (test_dir / 'read_aloud.txt').write_text('Please read this sentence aloud.')
+    (test_dir / 'listen.wav').write_bytes(b'RIFF')
+    (test_dir / 'qual_check.wav').write_bytes(b'RIFF')
+    (test_dir / 'picture.png').write_bytes(b'PNG')
+    (test_dir / 'notes.md').write_text('')
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('question', ['read_aloud', 'listen', 'qual_check', 'picture', 'notes', 'missing', 'pict'])
+def test_lookups_match_the_directory_listing(home, question):
+    assert template_picker('prosody_task', 'reading', question, home) == listing_picker('prosody_task', 'reading', question, home)
+
+
+def test_the_index_is_built_up_front_and_refreshed_when_the_directory_changes(home):
+    index = PromptIndex(home, refresh_interval=0.0)
+    assert index.build() == 5
+    test_dir = os.path.join(home, 'static', 'test-files', 'prosody_task', 'reading')
+    with open(os.path.join(test_dir, 'new_prompt.txt'), 'w') as prompt:
+        prompt.write('A new prompt.')
+    mtime = os.stat(test_dir).st_mtime_ns
+    os.utime(test_dir, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert index.lookup('prosody_task', 'reading', 'new_prompt') == ('prosody_task/recorder_text-prompt.html', 'A new prompt.')
+
+
+def test_an_unchanged_directory_is_not_listed_again(home, monkeypatch):
+    index = PromptIndex(home, refresh_interval=60.0)
+    index.lookup('prosody_task', 'reading', 'listen')
+    monkeypatch.setattr(os, 'listdir', None)
+    assert index.lookup('prosody_task', 'reading', 'read_aloud')[1] == 'Please read this sentence aloud.'
+    assert prompt_index(home) is prompt_index(home)
@@ -0,0 +1,79 @@
+import os
+import pickle
+import threading
+
+import pytest
+
+from scripts.state import CLAIMED, COMPLETED, OWNED, STARTED, TAKEN, StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StateStore(str(tmp_path / 'state.sqlite3'))
+
+
+def test_only_one_assignment_claims_a_worker(store):
+    results = []
+    threads = [threading.Thread(target=lambda ass_id=ass_id: results.append(store.claim_worker('W1', ass_id, 'H1')))
+               for ass_id in ('A%d' % i for i in range(8))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [CLAIMED] + [TAKEN] * 7
+    owner = store.worker_owner('W1')
+    assert store.claim_worker('W1', owner[0], 'H1') == OWNED
+    store.release_worker('W1', owner[0])
+    assert store.worker_owner('W1') is None and store.claim_worker('W1', 'A9', 'H1') == CLAIMED
+
+
+def test_assignments_are_updated_and_queried_by_condition_and_status(store):
+    store.update('W1', 'A1', trait='clear', entrainment_features=['entrain-pitch'], status=STARTED)
+    store.update('W2', 'A2', entrainment_features=['entrain-pitch'], status=COMPLETED)
+    store.update('W1', 'A1', status=COMPLETED, score='4')
+    assignment = store.get('W1', 'A1')
+    assert (assignment['trait'], assignment['entrainment_features'], assignment['status'], assignment['score']) == \
+        ('clear', ['entrain-pitch'], COMPLETED, '4')
+    assert [a['worker_id'] for a in store.query(['entrain-pitch'], COMPLETED)] == ['W2', 'W1']
+    assert store.query(['entrain-volume']) == [] and store.get('W3', 'A3') is None
+    with pytest.raises(ValueError):
+        store.update('W1', 'A1', colour='blue')
+
+
+def test_constants_are_cached_after_the_first_read(store):
+    assert store.constant('codes', []) == []
+    StateStore(store.db_path).set_constant('codes', ['c1', 'c2'])
+    assert store.constant('codes') == ['c1', 'c2']
+    StateStore(store.db_path).set_constant('codes', ['c3'])
+    assert store.constant('codes') == ['c1', 'c2']
+
+
+def test_an_older_deployments_files_are_imported(tmp_path):
+    directory = str(tmp_path)
+
+    def write(name, text):
+        with open(os.path.join(directory, name), 'w') as handle:
+            handle.write(text + '\n')
+
+    def dump(name, value):
+        with open(os.path.join(directory, name), 'wb') as handle:
+            pickle.dump(value, handle)
+
+    write('W1.txt', 'A1_H1')
+    write('W1_A1_trait_config.txt', 'clear')
+    write('W1_A1_entrainment_config.txt', "['entrain-pitch', 'disentrain-volume']")
+    dump('W1_A1_starttime.pickle', 100.0)
+    dump('W1_A1_endtime.pickle', 200.0)
+    write('W1_score.txt', '5')
+    write('W2.txt', 'A2_H2')
+    write('W2_A2_entrainment_config.txt', '[]')
+    dump('codes.pickle', {'code1'})
+
+    store = StateStore(os.path.join(directory, 'state.sqlite3'))
+    assert store.import_files(directory) == 2
+    first = store.get('W1', 'A1')
+    assert (first['trait'], first['entrainment_features'], first['started'], first['ended'], first['status'], first['score']) == \
+        ('clear', ['entrain-pitch', 'disentrain-volume'], 100.0, 200.0, COMPLETED, '5')
+    assert store.get('W2', 'A2')['status'] == STARTED and store.get('W2', 'A2')['entrainment_features'] == []
+    assert store.worker_owner('W1') == ('A1', 'H1') and store.worker_owner('W2') == ('A2', 'H2')
+    assert store.constant('codes') == ['code1']
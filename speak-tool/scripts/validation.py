@@ -4,6 +4,7 @@ import os, csv
 from jiwer import wer
 import speech_recognition as sr
 import soundfile as sf
+from .ingest import voiced_seconds
 
 
 
@@ -11,16 +12,20 @@ import soundfile as sf
 # 1. transcribes a given file audio_file, using Google Speech Recognition API
 # 2. saves the transcript in a .txt file in the same directory
 # 3. returns the transcript as a string
-# audio_file: path of the audio file to be transcribed (including extension), as a string
+# audio_file: the recording as a world.audio.AudioAsset (already read into memory), or the path of the audio file (including extension), as a string
 # transc: the resultant transcript, as a string
 def val1(audio_file):
 	r = sr.Recognizer()
 	transc = "!INAUDIBLE"
 
-	with sr.AudioFile(audio_file) as source:
+	if isinstance(audio_file, str):
+		audio_path, audio_source = audio_file, audio_file
+	else:
+		audio_path, audio_source = audio_file.path, audio_file.file_obj()
+	with sr.AudioFile(audio_source) as source:
     		audio = r.record(source)
-	print(audio_file)
-	with open(os.path.splitext(audio_file)[0] + '_transcript.txt', 'w') as output:
+	print(audio_path)
+	with open(os.path.splitext(audio_path)[0] + '_transcript.txt', 'w') as output:
 		try:
 			transc = r.recognize_google(audio)
 			output.write(transc)
@@ -45,15 +50,34 @@ def val1a(transcript, threshold):
 
 
 ## validation 1b - audio file length threshold check
-# given the audiofile path as a string, find whether the length of the recording is greater than the threshold
+# given the recording (world.audio.AudioAsset, or a completed scripts.UploadSession) or the audiofile path as a string, find whether the length of the recording is greater than the threshold
 # threshold: # of seconds, as an int
 # outputs boolean value; True if passes threshold check, False otherwise
 def val1b(file_path, threshold):
-	f = sf.SoundFile(file_path)
-	length = len(f) / f.samplerate
+	if isinstance(file_path, str):
+		with sf.SoundFile(file_path) as f:
+			length = len(f) / f.samplerate
+	else:
+		length = file_path.duration
 	return length > threshold
 
 
+## validation 1c - silence gate
+# given the recording (scripts.UploadSession, world.audio.AudioAsset) or the audiofile path as a string, find whether it holds more
+# than threshold seconds of voiced (louder than threshold_db dBFS) frames, i.e. the worker's microphone actually picked up speech
+# threshold: # of seconds, as a float
+# outputs boolean value; True if passes threshold check, False otherwise
+def val1c(file_path, threshold, threshold_db=-45.0):
+	if isinstance(file_path, str):
+		data, samplerate = sf.read(file_path)
+		voiced = voiced_seconds(data, samplerate, threshold_db)
+	elif hasattr(file_path, 'voiced_duration'):
+		voiced = file_path.voiced_duration
+	else:
+		voiced = voiced_seconds(file_path.data, file_path.samplerate, threshold_db)
+	return voiced > threshold
+
+
 ## validation 2 - comparison w/ transcript
 # 1. finds the ground-truth transcript associated with the question.
 # 2. calculates the WER (word error rate) for the subject-generated transcript, based on the ground truth.
@@ -6,7 +6,8 @@
 	 - volume-meter (Chris Wilson)
 	
 	Special considerations when implementing this library into an HTML document/template:
-	 - declare vars "upload_link" and "next_link" in HTML template
+	 - declare vars "chunk_link" (resumable upload) and "next_link" in HTML template ("upload_link", the one-request
+	   upload, is no longer used by this script)
 	 - record button id = "recBtn"
 */
 
@@ -28,6 +29,11 @@ var meter_width=250;
 var meter_height=50;
 var rafID = null;
 
+// resumable upload vars
+var chunk_size = 256 * 1024;		// bytes per upload request
+var max_chunk_attempts = 6;		// attempts per chunk before giving up
+var retry_delay = 1;			// seconds before the first retry (doubled after every failed attempt)
+
 // meter colors
 var notRec_notClip = "#ffa64d" 
 var notRec_Clip = "#ff4d4d"
@@ -173,31 +179,69 @@ function recSubmit(blob) {
 	// .wav file name (without extension)
 	var filename = new Date().toISOString();
 
-	// assemble form data to be submitted to URL upload_link
-	// (upload_link var declared in recorder template)
-	var fd = new FormData();
-	fd.append("audio_data", blob, filename);
-
-	// send POST request to URL upload_link (async), then redirect user to next link
-	postRequestAsync(upload_link, next_link, fd)
-		.then(next => redirectUser(next))
+	// send the recording to URL chunk_link in chunks (async), then redirect user to next link
+	// (chunk_link var declared in recorder template)
+	uploadResumable(chunk_link, blob, filename)
+		.then(upload => redirectUser(next_link))
 		.catch(err => {
 			console.log('There was an error with the upload:', err);
 			status_msg.innerHTML = 'There was an error with the upload. Please try again.';
 		});
 }
- 
-async function postRequestAsync(upload, next, file) {
-	let response = await fetch(upload, {method: "POST", body: file});
-	
-	// Check if the response is OK (status 200-299)
-	if (!response.ok) {
-		// NOT OK? Reject the promise with the status text
-		throw new Error(response.statusText);
+
+// upload a blob in chunks of chunk_size bytes, resuming where the server says the upload stopped after a failed request,
+// so a flaky connection only resends the chunk it lost; resolves with the server's summary of the finished upload
+async function uploadResumable(link, blob, uploadId) {
+	let offset = 0;
+	let attempts = 0;
+	while (true) {
+		let end = Math.min(offset + chunk_size, blob.size);
+		let response = null;
+		let upload = null;
+		try {
+			response = await fetch(link + "&upload=" + encodeURIComponent(uploadId) + "&offset=" + offset + "&total=" + blob.size,
+				{method: "PUT", body: blob.slice(offset, end)});
+			upload = await response.json();
+		} catch (err) {
+			console.log("chunk upload failed:", err);
+		}
+
+		if (upload !== null && response.ok && upload.status == "complete") {
+			console.log("recording submitted.");
+			return upload;
+		}
+		if (upload !== null && (response.ok || response.status == 409)) {
+			// next chunk (or, after a 409, wherever the server's copy of the upload ends)
+			attempts = 0;
+			offset = upload.received;
+			continue;
+		}
+		if (upload !== null && response.status < 500) {
+			// refused (too large, not a recording): sending it again will not help
+			throw new Error(upload.error);
+		}
+
+		// lost connection or server error: wait, ask the server how much arrived, and resume from there
+		attempts += 1;
+		if (attempts >= max_chunk_attempts)
+			throw new Error("upload failed after " + attempts + " attempts");
+		await wait(retry_delay * Math.pow(2, attempts - 1));
+		offset = await receivedOffset(link, uploadId, offset);
 	}
-	
-	console.log("recording submitted.");
-	return next;
+}
+
+// how many bytes of the upload the server has (fallback: the offset we would have resent anyway)
+async function receivedOffset(link, uploadId, fallback) {
+	try {
+		let response = await fetch(link + "&upload=" + encodeURIComponent(uploadId), {cache: "no-store"});
+		return (await response.json()).received;
+	} catch (err) {
+		return fallback;
+	}
+}
+
+function wait(seconds) {
+	return new Promise(resolve => setTimeout(resolve, seconds * 1000));
 }
 
 // redirect user to URL next_link
@@ -0,0 +1,62 @@
+/*
+	synthesis-status: waits for the background synthesis job queued by /validate-voice
+
+	Special considerations when implementing this library into an HTML document/template:
+	 - declare vars "audio_link", "status_link" and "retry_link" in HTML template
+	 - audio element id = "synthesized_audio", source id = "synthesized_source"
+	 - message element id = "synthesis_msg", submit button id = "submit_evaluation"
+*/
+
+// seconds the server may hold each status request open (long-poll); 0 = plain polling, which keeps
+// the (few) uwsgi processes free for other workers
+var status_wait = 0;
+// seconds between status requests
+var status_poll_interval = 2;
+
+var synthesis_msg = document.getElementById("synthesis_msg");
+
+
+// poll the status link until the job is done (show the audio) or has failed (send worker back to record)
+async function waitForSynthesis() {
+	while (true) {
+		let job;
+		try {
+			let response = await fetch(status_link + "&wait=" + status_wait, {cache: "no-store"});
+			job = await response.json();
+		} catch (err) {
+			console.log("status request failed:", err);
+			await sleep(status_poll_interval);
+			continue;
+		}
+
+		console.log("synthesis job status:", job.status);
+		if (job.status == "done") {
+			showAudio();
+			return;
+		} else if (job.status == "failed" || job.status == "missing") {
+			window.location.replace(retry_link);
+			return;
+		}
+		if (status_wait == 0) {
+			await sleep(status_poll_interval);
+		}
+	}
+}
+
+
+function sleep(seconds) {
+	return new Promise(resolve => setTimeout(resolve, seconds * 1000));
+}
+
+
+// load the synthesized response and let the worker submit their rating
+function showAudio() {
+	document.getElementById("synthesized_source").src = audio_link + "?t=" + Date.now();
+	var audio = document.getElementById("synthesized_audio");
+	audio.load();
+	audio.className = "";
+	synthesis_msg.className = "hidden";
+	document.getElementById("submit_evaluation").disabled = false;
+}
+
+waitForSynthesis();
@@ -1,4 +1,18 @@
-from app import app
+import gc
+import sys
+
+from app import app, boot_mode, warm_up
+
+# uWSGI imports this module once in the master (lazy-apps is off) and forks the route processes from it.
+# 'preload' warms the validation path here and freezes the GC, so the imported modules and warmed caches stay
+# shared copy-on-write instead of being copied into every process by the collector; 'lean' skips the warm-up.
+# either way the routes only queue synthesis jobs, so the analysis stack (world.experiment) is never imported here.
+if boot_mode == 'preload':
+    warm_up()
+    gc.collect()
+    gc.freeze()
+if 'world.experiment' in sys.modules:
+    print('wsgi: warning: the analysis stack was imported into the web processes')
 
 if __name__ == "__main__":
     app.run()
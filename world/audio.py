@@ -0,0 +1,69 @@
+"""Worker recordings decoded once and shared across validation and analysis."""
+import io
+import wave
+
+import numpy as np
+import soundfile as sf
+
+
+class AudioAsset:
+    """A recording read from disk and decoded once."""
+
+    def __init__(self, raw, path=None):
+        self.raw = raw
+        self.path = path
+        self.data, self.samplerate = sf.read(io.BytesIO(raw))
+
+    @classmethod
+    def from_file(cls, path):
+        """Reads and decodes an audio file."""
+        with open(path, 'rb') as audio_file:
+            return cls(audio_file.read(), path)
+
+    @property
+    def frames(self):
+        return len(self.data)
+
+    @property
+    def duration(self):
+        """Length of the recording in seconds."""
+        return self.frames / self.samplerate
+
+    def file_obj(self):
+        """A fresh in-memory file holding the original encoded bytes."""
+        return io.BytesIO(self.raw)
+
+
+def as_asset(audio):
+    """Accepts either an AudioAsset or the path of an audio file."""
+    if isinstance(audio, AudioAsset):
+        return audio
+    return AudioAsset.from_file(audio)
+
+
+def pcm_to_wav(pcm, samplerate, channels=1, sample_width=2):
+    """Wraps raw little-endian PCM (as Polly's 'pcm' output format returns it) into WAV bytes."""
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(samplerate)
+        wav_file.writeframes(pcm)
+    return wav_buffer.getvalue()
+
+
+def join_pcm(chunks, samplerate, fade_seconds=0.005, sample_width=2):
+    """Concatenates raw 16-bit PCM chunks, fading each join out and in over `fade_seconds` to avoid clicks."""
+    fade = int(round(fade_seconds * samplerate))
+    ramp = np.sin(np.linspace(0, np.pi / 2, fade)) ** 2 if fade else np.empty(0)
+    parts = []
+    for i, chunk in enumerate(chunks):
+        samples = np.frombuffer(chunk, dtype='<i%d' % sample_width).astype(np.float64)
+        n = min(fade, len(samples))
+        if i > 0 and n:
+            samples[:n] *= ramp[:n]
+        if i < len(chunks) - 1 and n:
+            samples[len(samples) - n:] *= ramp[:n][::-1]
+        parts.append(samples)
+    joined = np.concatenate(parts) if parts else np.empty(0)
+    return np.round(joined).astype('<i%d' % sample_width).tobytes()
@@ -0,0 +1,277 @@
+"""Offline batch re-analysis of every worker recording under <save_location>/<env>.
+
+Sessions (`<worker>_<ass>_worker_recording.wav`) are found with `os.scandir`
+and analysed in a process pool. Each session's entrainment features are the
+condition the app stored for it: the session state (`state.sqlite3`), the
+analysis job queue (`jobs.sqlite3`) or, for sessions recorded before either
+existed, `<worker>_<ass>_entrainment_config.txt`. A session with no stored
+condition fails instead of being analysed under a guessed one, unless
+`--features-override` sets the features of every session. Results go to <save_location>/<output env> so the live files
+are never overwritten. A JSON-lines manifest there records every finished
+session; a rerun skips the ones already done, so an interrupted run resumes
+where it stopped.
+
+    python -m world.batch /data/speak_amt_prosody production --processes 8
+    python -m world.batch /data/speak_amt_prosody production --all-conditions --stub-synthesizer
+    python -m world.batch /data/speak_amt_prosody production --skip-synthesis --f0-profile fast
+    python -m world.batch /data/speak_amt_prosody production --stub-synthesizer --plot
+
+Polly calls from all the processes together are held to `--polly-tps`.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import soundfile as sf
+
+RECORDING_SUFFIX = '_worker_recording.wav'
+CONDITION_SUFFIX = '_entrainment_config.txt'
+MANIFEST_NAME = 'batch_manifest.jsonl'
+DONE = 'done'
+FAILED = 'failed'
+# half of Polly's default 8 TPS quota; the other half is left to the live analysis workers
+DEFAULT_POLLY_TPS = 4.0
+
+
+def discover_sessions(save_location, env):
+    """{session id: recording path} of every worker recording in <save_location>/<env>."""
+    sessions = {}
+    with os.scandir(os.path.join(save_location, env)) as entries:
+        for entry in entries:
+            if entry.name.endswith(RECORDING_SUFFIX) and entry.is_file():
+                sessions[entry.name[:-len(RECORDING_SUFFIX)]] = entry.path
+    return dict(sorted(sessions.items()))
+
+
+def _read_only(db_path):
+    return sqlite3.connect('file:' + db_path + '?mode=ro', uri=True)
+
+
+def queued_features(save_location, env):
+    """{session id: (worker_id, ass_id, entrainment features)} from the analysis job queue, if there is one."""
+    db_path = os.path.join(save_location, env, 'jobs.sqlite3')
+    if not os.path.exists(db_path):
+        return {}
+    conn = _read_only(db_path)
+    try:
+        rows = conn.execute('SELECT job_id, worker_id, ass_id, payload FROM jobs').fetchall()
+    finally:
+        conn.close()
+    return {job_id: (worker_id, ass_id, json.loads(payload).get('entrainment_features', []))
+            for job_id, worker_id, ass_id, payload in rows}
+
+
+def stored_features(save_location, env):
+    """{session id: (worker_id, ass_id, entrainment features)} of every session whose condition the app stored.
+
+    The session state (speak-tool/scripts/state.py) wins over the job queue, which wins over the
+    `_entrainment_config.txt` files older deployments wrote.
+    """
+    directory = os.path.join(save_location, env)
+    stored = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(CONDITION_SUFFIX):
+                worker_id, _, ass_id = entry.name[:-len(CONDITION_SUFFIX)].partition('_')
+                with open(entry.path, encoding='utf-8') as condition_file:
+                    # written as str(list), e.g. ['entrain-pitch']
+                    features = json.loads(condition_file.readline().strip().replace("'", '"'))
+                stored[worker_id + '_' + ass_id] = (worker_id, ass_id, features)
+    stored.update(queued_features(save_location, env))
+
+    db_path = os.path.join(directory, 'state.sqlite3')
+    if os.path.exists(db_path):
+        conn = _read_only(db_path)
+        try:
+            rows = conn.execute('SELECT worker_id, ass_id, entrainment_features FROM assignments '
+                                'WHERE entrainment_features IS NOT NULL').fetchall()
+        finally:
+            conn.close()
+        stored.update((worker_id + '_' + ass_id, (worker_id, ass_id, json.loads(features)))
+                      for worker_id, ass_id, features in rows)
+    return stored
+
+
+def audio_duration(recording):
+    """Length of a recording in seconds (0.0 if it cannot be read, e.g. an empty or truncated file)."""
+    try:
+        return sf.info(recording).duration
+    except Exception:
+        return 0.0
+
+
+def read_manifest(path):
+    """{session id: last manifest record} (a torn last line from a crash is ignored)."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record['session']] = record
+    return records
+
+
+def append_manifest(manifest, record):
+    manifest.write(json.dumps(record) + '\n')
+    manifest.flush()
+    os.fsync(manifest.fileno())
+
+
+def init_worker(options):
+    from world import experiment, f0, polly_service
+    from world.local_polly import LocalPollyClient
+
+    processes = options['processes'] or os.cpu_count()
+    # the token bucket is per process, so the processes split the --polly-tps budget
+    polly_service.configure(default_priority=polly_service.BATCH, rate=options['polly_tps'] / processes)
+    # and chunked F0 profiles give every process its own pool, so they split the CPUs too
+    f0.configure_pool(workers=processes)
+    if options['stub_synthesizer']:
+        polly_service.configure(client=LocalPollyClient(latency=options['stub_latency'], throttle_rate=options['stub_throttle_rate']))
+        # keep stub audio out of the real synthesis cache
+        experiment.SYNTHESIS_CACHE_DIR = experiment.STUB_SYNTHESIS_CACHE_DIR
+
+
+def process_session(session, worker_id, ass_id, recording, features, options):
+    """Re-analyses one session; returns a manifest record."""
+    from world import experiment, features as feature_store
+    from world.prosody_plan import CONDITIONS, ProsodyPlan, condition_name
+
+    start = time.time()
+    save_location, env = options['save_location'], options['output_env']
+    response = experiment.generate_response()
+    try:
+        if options['skip_synthesis'] or options['all_conditions']:
+            feature_store.configure(os.path.join(save_location, env, 'features'))
+            plan = ProsodyPlan.from_recording(response, recording, 5, options['f0_profile'])
+            if options['skip_synthesis']:
+                conditions = CONDITIONS if options['all_conditions'] else [features]
+                with open(os.path.join(save_location, env, session + '_plan.json'), 'w', encoding='utf-8') as plan_file:
+                    json.dump({condition_name(condition): plan.ssml(condition) for condition in conditions}, plan_file, indent=1)
+            else:
+                experiment.render_conditions(plan, worker_id, ass_id, save_location, env, synthesis_engine=options['synthesis_engine'])
+        else:
+            experiment.perform_analysis(worker_id, ass_id, save_location, env, response, recording, features,
+                                        options['f0_profile'], options['bot_contour'], options['synthesis_engine'])
+        status, error = DONE, None
+    except Exception as e:
+        traceback.print_exc()
+        status, error = FAILED, repr(e)
+    return {'session': session, 'status': status, 'error': error, 'features': list(features),
+            'seconds': time.time() - start, 'audio_seconds': audio_duration(recording)}
+
+
+def failed_record(session, features, error):
+    return {'session': session, 'status': FAILED, 'error': error, 'features': features, 'seconds': 0.0, 'audio_seconds': 0.0}
+
+
+def run(options):
+    """Processes every session not yet done; returns a summary dict."""
+    sessions = discover_sessions(options['save_location'], options['env'])
+    stored = stored_features(options['save_location'], options['env'])
+    output_dir = os.path.join(options['save_location'], options['output_env'])
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    done = {session for session, record in read_manifest(manifest_path).items() if record['status'] == DONE}
+
+    todo = [session for session in sessions if session not in done]
+    if options['limit']:
+        todo = todo[:options['limit']]
+    print('%d sessions, %d already done, %d to process' % (len(sessions), len(done & set(sessions)), len(todo)))
+
+    counts = {DONE: 0, FAILED: 0}
+    audio_seconds = 0.0
+    start = time.time()
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, \
+            ProcessPoolExecutor(options['processes'], initializer=init_worker, initargs=(options,)) as pool:
+        def record_result(record):
+            append_manifest(manifest, record)
+            counts[record['status']] += 1
+            return record['audio_seconds']
+
+        futures = {}
+        for session in todo:
+            if options['features_override']:
+                worker_id, _, ass_id = session.partition('_')
+                features = options['features']
+            elif session in stored:
+                worker_id, ass_id, features = stored[session]
+            else:
+                print('%s: no stored entrainment condition, skipped' % session)
+                record_result(failed_record(session, None, 'no stored entrainment condition'))
+                continue
+            futures[pool.submit(process_session, session, worker_id, ass_id, sessions[session], features, options)] = (session, features)
+
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                record = future.result()
+            except Exception as e:
+                # e.g. BrokenProcessPool: a worker process died (a native crash); the session fails, the run goes on
+                session, features = futures[future]
+                record = failed_record(session, list(features), repr(e))
+            audio_seconds += record_result(record)
+            elapsed = time.time() - start
+            if i % options['report_every'] == 0 or i == len(futures):
+                print('%d/%d sessions (%d failed) | %.2f sessions/s | %.1f s of audio per s' % (
+                    i, len(futures), counts[FAILED], i / elapsed, audio_seconds / elapsed))
+
+    elapsed = time.time() - start
+    summary = {'sessions': len(todo), 'done': counts[DONE], 'failed': counts[FAILED], 'seconds': elapsed,
+               'sessions_per_second': len(todo) / elapsed if elapsed else 0.0,
+               'audio_seconds_per_second': audio_seconds / elapsed if elapsed else 0.0}
+    if options['plot']:
+        from world import plotting
+
+        summary['figures'] = plotting.plot_all(output_dir, options['processes'])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('save_location', help='The app\'s save_location.')
+    parser.add_argument('env', help='Environment whose recordings are re-analysed (e.g. production).')
+    parser.add_argument('--output-env', help='Where results and the manifest go (default: <env>-reanalysis).')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--features', nargs='*', default=[],
+                        help='Entrainment features for --features-override.')
+    parser.add_argument('--features-override', action='store_true',
+                        help='Use --features for every session instead of its stored condition.')
+    parser.add_argument('--all-conditions', action='store_true', help='Render all nine conditions for every session.')
+    parser.add_argument('--skip-synthesis', action='store_true',
+                        help='Only extract features and write each session\'s condition SSML to <session>_plan.json.')
+    parser.add_argument('--stub-synthesizer', action='store_true',
+                        help='Synthesize with the local Polly stand-in (world.local_polly) instead of Polly.')
+    parser.add_argument('--polly-tps', type=float, default=DEFAULT_POLLY_TPS,
+                        help='Polly requests per second for the whole run, split evenly across the processes. Batch '
+                             'requests only yield to live ones within a process, so leave the live analysis workers '
+                             'their polly_tps: the two together must stay within the account quota.')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='Seconds each stand-in Polly call takes.')
+    parser.add_argument('--stub-throttle-rate', type=float, default=0.0,
+                        help='Fraction of stand-in Polly calls that fail with a ThrottlingException.')
+    parser.add_argument('--f0-profile', help='F0 estimator profile (see world.f0).')
+    parser.add_argument('--bot-contour', choices=['harvest', 'speech-marks'])
+    parser.add_argument('--synthesis-engine', choices=['polly', 'world'])
+    parser.add_argument('--plot', action='store_true',
+                        help='Afterwards, render the comparison figure of every session (see world.plotting).')
+    parser.add_argument('--limit', type=int, help='Process at most this many sessions.')
+    parser.add_argument('--report-every', type=int, default=10, help='Print throughput every N sessions.')
+    args = parser.parse_args(argv)
+
+    options = vars(args)
+    options['output_env'] = args.output_env or args.env + '-reanalysis'
+    summary = run(options)
+    print(json.dumps(summary))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
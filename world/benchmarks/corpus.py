@@ -0,0 +1,52 @@
+"""Deterministic synthetic speech corpus for the benchmarks.
+
+Utterances are rendered with `pw.synthesize` from parametric contours: a
+declining F0 with slow intonation and a seeded random walk, syllable-rate
+voicing, a fixed formant-like spectral envelope with a syllable-rate energy
+envelope, and breathy/unvoiced aperiodicity. The same (duration, fs, seed)
+always gives the same samples, so benchmark inputs never drift.
+"""
+import numpy as np
+import pyworld as pw
+
+FRAME_PERIOD = 5.0
+DURATIONS = (2.0, 8.0, 20.0)
+SAMPLE_RATES = (16000, 44100)
+
+
+def parametric_f0(duration, seed=0, frame_period=FRAME_PERIOD, base=150.0):
+    """F0 contour (0 = unvoiced) with declination, intonation and a random walk; voicing at syllable rate."""
+    rng = np.random.default_rng(seed)
+    n_frames = int(duration * 1000 / frame_period) + 1
+    t = np.arange(n_frames) * frame_period / 1000
+    walk = 10 * rng.standard_normal(n_frames).cumsum() / np.sqrt(n_frames)
+    f0 = base * (1 - 0.1 * t / max(duration, 1e-9)) + 30 * np.sin(2 * np.pi * 0.7 * t) + walk
+    voiced = np.sin(2 * np.pi * 4.0 * t + rng.uniform(0, 2 * np.pi)) > -0.3
+    return np.where(voiced, np.clip(f0, 85, 260), 0.0)
+
+
+def utterance(duration, fs=16000, seed=0, frame_period=FRAME_PERIOD):
+    """A synthetic utterance (float64 samples peaking at 0.8) and its generating F0 contour."""
+    f0 = parametric_f0(duration, seed, frame_period)
+    n_frames = len(f0)
+    t = np.arange(n_frames) * frame_period / 1000
+    fft_size = pw.get_cheaptrick_fft_size(fs)
+    freqs = np.linspace(0, fs / 2, fft_size // 2 + 1)
+    envelope = np.exp(-freqs / 1500) + 0.3 * np.exp(-((freqs - 700) / 200) ** 2) + 0.2 * np.exp(-((freqs - 1200) / 300) ** 2)
+    energy = 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 2 * t))
+    sp = np.outer(energy, envelope ** 2 * 1e-3)
+    ap = np.where((f0 > 0)[:, None], 0.1, 0.999) * np.ones((n_frames, fft_size // 2 + 1))
+    y = pw.synthesize(f0, sp, ap, fs, frame_period)
+    return 0.8 * y / np.max(np.abs(y)), f0
+
+
+_corpus = {}
+
+
+def corpus(durations=DURATIONS, sample_rates=SAMPLE_RATES):
+    """{(duration, fs): samples} for every combination (memoized per process)."""
+    for duration in durations:
+        for fs in sample_rates:
+            if (duration, fs) not in _corpus:
+                _corpus[(duration, fs)] = utterance(duration, fs, seed=int(duration * 10) + fs)[0]
+    return {key: _corpus[key] for key in _corpus if key[0] in durations and key[1] in sample_rates}
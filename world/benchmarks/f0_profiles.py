@@ -0,0 +1,89 @@
+"""Benchmarks the F0 estimator profiles against the 'accurate' (full-rate Harvest) output.
+
+For every profile this reports wall time per recording and how closely its
+contour agrees with the reference: voicing agreement, gross pitch error,
+mean absolute deviation in cents, and — what actually matters for the task —
+how many of the per-word entrainment pitch tags come out identical.
+
+    python -m world.benchmarks.f0_profiles recordings/*_worker_recording.wav --json f0_profiles.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import soundfile as sf
+
+from world import f0, prosody, text_plan
+from world.experiment import generate_response
+
+
+def contour_agreement(reference, contour):
+    """Voicing agreement, gross pitch error (>20 %) and mean |cents| against a reference contour."""
+    both_voiced = (reference > 0) & (contour > 0)
+    ratio = contour[both_voiced] / reference[both_voiced]
+    return {
+        'voicing_agreement': float(np.mean((reference > 0) == (contour > 0))),
+        'gross_pitch_error': float(np.mean(np.abs(ratio - 1) > 0.2)) if both_voiced.any() else float('nan'),
+        'mean_abs_cents': float(np.mean(np.abs(1200 * np.log2(ratio)))) if both_voiced.any() else float('nan'),
+    }
+
+
+def tag_agreement(reference_tags, tags):
+    """Fraction of identical per-word pitch tags, and the largest tag difference in percent."""
+    equal = np.sum(reference_tags == tags)
+    return {
+        'tag_agreement': float(equal / len(reference_tags)),
+        'max_tag_diff': float(np.nanmax(np.abs(reference_tags - tags))),
+    }
+
+
+def time_extraction(extractor, x, fs, frame_period, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        contour = extractor.extract(x, fs, frame_period=frame_period)
+    return contour, (time.perf_counter() - start) / repeats
+
+
+def run(wav_files, profiles, frame_period=5.0, repeats=1, response=None):
+    """Returns {profile: averaged metrics} over all recordings."""
+    _, syllable_counts = text_plan.syllabify(response or generate_response())
+    results = {profile: [] for profile in profiles}
+    for wav_file in wav_files:
+        x, fs = sf.read(wav_file)
+        reference, reference_time = time_extraction(f0.get_extractor(f0.DEFAULT_PROFILE), x, fs, frame_period, repeats)
+        reference_tags = prosody.word_pitch_values(reference, syllable_counts)
+        for profile in profiles:
+            if profile == f0.DEFAULT_PROFILE:
+                contour, seconds = reference, reference_time
+            else:
+                contour, seconds = time_extraction(f0.get_extractor(profile), x, fs, frame_period, repeats)
+            metrics = {'seconds': seconds, 'speedup': reference_time / seconds}
+            metrics.update(contour_agreement(reference, contour))
+            metrics.update(tag_agreement(reference_tags, prosody.word_pitch_values(contour, syllable_counts)))
+            results[profile].append(metrics)
+    return {profile: {name: float(np.mean([m[name] for m in runs])) for name in runs[0]}
+            for profile, runs in results.items()}
+
+
+def print_table(summary):
+    columns = ['seconds', 'speedup', 'voicing_agreement', 'gross_pitch_error', 'mean_abs_cents', 'tag_agreement', 'max_tag_diff']
+    print('%-16s' % 'profile' + ''.join('%19s' % column for column in columns))
+    for profile, metrics in summary.items():
+        print('%-16s' % profile + ''.join('%19.4f' % metrics[column] for column in columns))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('wav_files', nargs='+', help='Worker recordings to benchmark on.')
+    parser.add_argument('-p', '--profiles', nargs='+', default=list(f0.PROFILES), choices=list(f0.PROFILES))
+    parser.add_argument('-f', '--frame_period', type=float, default=5.0)
+    parser.add_argument('-r', '--repeats', type=int, default=1, help='Timed extractions per recording and profile.')
+    parser.add_argument('--json', help='Also write the summary to this JSON file.')
+    args = parser.parse_args()
+
+    summary = run(args.wav_files, args.profiles, args.frame_period, args.repeats)
+    print_table(summary)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file_handle:
+            json.dump(summary, file_handle, indent=2)
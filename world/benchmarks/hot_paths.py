@@ -0,0 +1,151 @@
+"""Microbenchmarks of the per-submission hot paths, with regression checks against a stored baseline.
+
+Covers F0 extraction (every estimator profile), loudness, per-word pitch and
+volume aggregation, the prosody plan, normalize_db_values, resample_ipu, SSML
+construction and write_correlation_data, on the synthetic corpus in
+world.benchmarks.corpus. Every benchmark reports the median and best time per
+call; with --baseline, any benchmark whose median is more than --tolerance
+slower than the baseline's is reported and the exit status is 1.
+
+    python -m world.benchmarks.hot_paths --json results.json
+    python -m world.benchmarks.hot_paths --save-baseline world/benchmarks/baseline.json
+    python -m world.benchmarks.hot_paths --baseline world/benchmarks/baseline.json --tolerance 0.25
+
+Timings are machine specific: record the baseline on the deploy hardware.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from world import f0, loudness, prosody, text_plan
+from world.benchmarks import corpus
+from world.experiment import generate_response, resample_ipu, write_correlation_data
+from world.prosody_plan import CONDITIONS, ProsodyPlan
+
+
+def measure(function, repeats=5, min_seconds=0.05):
+    """(median, best) seconds per call; calls are looped until one timing takes at least `min_seconds`."""
+    function()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or loops >= 1 << 20:
+            break
+        loops *= 2
+    timings = [elapsed / loops]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        timings.append((time.perf_counter() - start) / loops)
+    return float(np.median(timings)), float(np.min(timings))
+
+
+def benchmarks(tmp_dir, durations=corpus.DURATIONS, sample_rates=corpus.SAMPLE_RATES, profiles=None):
+    """{name: zero-argument callable} of every benchmark; file-writing benchmarks write into `tmp_dir`."""
+    response = generate_response()
+    words, syllable_counts = text_plan.syllabify(response)
+    cases = {}
+    for (duration, fs), x in corpus.corpus(durations, sample_rates).items():
+        tag = '%gs@%dHz' % (duration, fs)
+        for profile in profiles or f0.PROFILES:
+            extractor = f0.get_extractor(profile)
+            cases['f0/%s/%s' % (profile, tag)] = lambda extractor=extractor, x=x, fs=fs: extractor.extract(x, fs, frame_period=corpus.FRAME_PERIOD)
+        cases['loudness/%s' % tag] = lambda x=x, fs=fs: loudness.frame_rms_db(x, fs)
+
+    # aggregation works on frame-level features, so only the duration matters
+    for duration in durations:
+        tag = '%gs' % duration
+        contour = corpus.parametric_f0(duration, seed=int(duration))
+        loudness_db = loudness.frame_rms_db(corpus.utterance(duration, 16000, seed=int(duration))[0], 16000)
+        normalized = prosody.normalize_db_values(loudness_db, 25, 100)
+        total = int(sum(syllable_counts))
+        gradient = prosody.volume_gradient(normalized, total)
+        bot = contour[contour > 0]
+        human = corpus.parametric_f0(duration * 1.1, seed=int(duration) + 1)
+        human = human[human > 0]
+        bot_ipu, human_ipu = resample_ipu(bot, human)
+        plan = ProsodyPlan(response, words, syllable_counts, contour, loudness_db)
+        cases.update({
+            'word_pitch_values/' + tag: lambda c=contour: prosody.word_pitch_values(c, syllable_counts),
+            'batch_word_pitch_values_x9/' + tag: lambda c=contour: prosody.batch_word_pitch_values([c] * 9, syllable_counts),
+            'volume_gradient/' + tag: lambda n=normalized: prosody.volume_gradient(n, total),
+            'word_volume_values/' + tag: lambda g=gradient: prosody.word_volume_values(g, syllable_counts),
+            'normalize_db_values/' + tag: lambda l=loudness_db: prosody.normalize_db_values(l, 55, 65),
+            'resample_ipu/' + tag: lambda b=bot, h=human: resample_ipu(b, h),
+            'prosody_plan/' + tag: lambda c=contour, l=loudness_db: ProsodyPlan(response, words, syllable_counts, c, l),
+            'render_ssml_9_conditions/' + tag: lambda p=plan: p.render_ssml(CONDITIONS),
+            'write_correlation_data/' + tag: lambda b=bot_ipu, h=human_ipu: write_correlation_data(
+                [b], [h], tmp_dir, '', 'bench', tag),
+        })
+    pitch_values = prosody.word_pitch_values(corpus.parametric_f0(8.0), syllable_counts)
+    cases['build_ssml'] = lambda: prosody.build_ssml(words, pitch_values, pitch_values)
+    cases['build_ssml_chunks'] = lambda: prosody.build_ssml_chunks(words, pitch_values, pitch_values)
+    cases['syllabify'] = lambda: text_plan.syllabify(response)
+    return cases
+
+
+def run(names=None, repeats=5, **options):
+    """Runs the benchmarks (optionally only names containing one of `names`); returns the results document."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='pef-bench-') as tmp_dir:
+        for name, function in benchmarks(tmp_dir, **options).items():
+            if names and not any(part in name for part in names):
+                continue
+            median, best = measure(function, repeats)
+            results[name] = {'median': median, 'best': best}
+            print('%-48s %12.3f ms %12.3f ms' % (name, median * 1000, best * 1000))
+    return {'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'numpy': np.__version__},
+            'results': results}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Benchmarks whose median is more than `tolerance` (fractional) slower than the baseline's."""
+    regressions = {}
+    for name, result in results['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        ratio = result['median'] / reference['median']
+        if ratio > 1 + tolerance:
+            regressions[name] = ratio
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', '--filter', nargs='+', help='Only run benchmarks whose name contains one of these.')
+    parser.add_argument('-d', '--durations', nargs='+', type=float, default=list(corpus.DURATIONS))
+    parser.add_argument('-s', '--sample_rates', nargs='+', type=int, default=list(corpus.SAMPLE_RATES))
+    parser.add_argument('-p', '--profiles', nargs='+', choices=list(f0.PROFILES))
+    parser.add_argument('-r', '--repeats', type=int, default=5)
+    parser.add_argument('--json', help='Write the results to this JSON file.')
+    parser.add_argument('--save-baseline', help='Write the results as the new baseline to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results against this baseline JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown before a benchmark counts as regressed.')
+    args = parser.parse_args()
+
+    print('%-48s %15s %15s' % ('benchmark', 'median', 'best'))
+    document = run(args.filter, args.repeats, durations=args.durations, sample_rates=args.sample_rates, profiles=args.profiles)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as file_handle:
+                json.dump(document, file_handle, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file_handle:
+            regressions = compare(document, json.load(file_handle), args.tolerance)
+        for name, ratio in sorted(regressions.items()):
+            print('REGRESSION %-48s %.2fx baseline' % (name, ratio))
+        print('%d regressions' % len(regressions))
+        sys.exit(1 if regressions else 0)
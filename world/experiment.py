@@ -1,26 +1,41 @@
 """."""
 from __future__ import division, print_function
 import argparse
-import re
 import os
-import librosa
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from scipy.stats import pearsonr
 from scipy.signal import resample
 
 import numpy as np
-import matplotlib.pyplot as plt
-import soundfile as sf
-import pyworld as pw
-from world.aws_code_examples.polly_wrapper import PollyWrapper
-import boto3
-from pysyllables import get_syllable_count
+from world.audio import AudioAsset, join_pcm, pcm_to_wav
+from world import f0
+from world import features as feature_store
+from world import plotting
+from world import polly_service
+from world import prosody
+from world.prosody_plan import CONDITIONS, ProsodyPlan, condition_name
+from world import resynthesis
+from world import speech_marks
+from world import synthesis_cache
+from world import text_plan
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-f", "--frame_period", type=float, default=5.0)
 parser.add_argument("-s", "--speed", type=int, default=1)
 
-EPSILON = 1e-8
+# Polly returns raw 16-bit mono PCM at this rate (8000 or 16000), wrapped into WAV without ffmpeg
+SYNTHESIS_FORMAT = 'pcm'
+SYNTHESIS_ENGINE = 'standard'
+SYNTHESIS_VOICE = 'Joanna'
+SYNTHESIS_SAMPLE_RATE = 16000
+# seconds before an MP3 -> WAV ffmpeg re-encode is abandoned
+FFMPEG_TIMEOUT = 30
+SPEECH_MARK_TYPES = ('word', 'sentence')
+# synthesized audio is cached under <save_location>/<env>/<SYNTHESIS_CACHE_DIR>
+SYNTHESIS_CACHE_DIR = 'synthesis_cache'
+# ...or here when Polly is replaced by the local stand-in (world.local_polly), so its audio never reaches real workers
+STUB_SYNTHESIS_CACHE_DIR = 'synthesis_cache_stub'
 
 def extract_ipus(x_polly, x_var):
     """Extracts individual pitch units (IPUs) from the data."""
@@ -37,118 +52,194 @@ def resample_ipu(bot_adjacent_ipu, human_adjacent_ipu):
 
     return bot_adjacent_ipu, human_adjacent_ipu
 
-def plot_fig(fig_list, log=True):
-    """Plots the figures."""
-    n = len(fig_list)
-    f = fig_list[0]
-    
-    if len(f.shape) == 1:
-        plt.figure()
-        for i, f in enumerate(fig_list):
-            plt.subplot(n, 1, i + 1)
-            if len(f.shape) == 1:
-                plt.plot(f)
-                plt.xlim([0, len(f)])
-    elif len(f.shape) == 2:
-        plt.figure()
-        for i, f in enumerate(fig_list):
-            plt.subplot(n, 1, i + 1)
-            if log:
-                x = np.log(f + EPSILON)
-            else:
-                x = f + EPSILON
-            plt.imshow(x.T, origin='lower', 
-                       interpolation='none', aspect='auto', extent=(0, x.shape[0], 0, x.shape[1]))
-    else:
-        raise ValueError('Input dimension must < 3.')
-
-def save_figure(filename, fig_list, log=True):
-    """Saves the figures to a file."""
-    x_polly, x = fig_list[0], fig_list[1]
-
-    bot_adjacent_ipu, human_adjacent_ipu = extract_ipus(x_polly, x)
-    bot_adjacent_ipu, human_adjacent_ipu = resample_ipu(bot_adjacent_ipu, human_adjacent_ipu)
-
-    plot_fig(fig_list, log)
-
-    plt.savefig(filename)
-    plt.close()
-    return bot_adjacent_ipu, human_adjacent_ipu
-
-def analyze_speech_pitch(worker_id, ass_id, save_location, env, response, wav_filename, frame_period, entrain=True):
-    x_var, fs_var = sf.read(wav_filename)
-    
-    f0_var = pw.harvest(x_var, fs_var, f0_floor=80.0, f0_ceil=270, frame_period=frame_period)[0]
-    f0_no_zeroes = [datapoint for datapoint in f0_var if datapoint > 0]
-    mean_f0 = np.mean(f0_no_zeroes)
-    f0_diff_sequence = [x - mean_f0 for x in f0_no_zeroes]
-    f0_mean_sequence = [(x + mean_f0) / 2 for x in f0_no_zeroes]
-    f0_percent_change_sequence = [(x / f0_mean_sequence[i]) * 100 for i, x in enumerate(f0_diff_sequence)]
-
-    split_response = response.split(' ')
-    stripped_split_response = [re.sub(r'\W+', '', word) for word in split_response if word]
-    syllable_counts_response = [get_syllable_count(w) if get_syllable_count(w) is not None 
-                                else get_syllable_count(stripped_split_response[i]) 
-                                for i, w in enumerate(stripped_split_response)]
-    total_syllables_response = sum(syllable_counts_response)
-    datapoints_per_syllable_response = len(f0_percent_change_sequence) / total_syllables_response
-    start_index = 0
-    text_response = '<speak>'
-
-    for i in range(0, len(split_response)):
-        text_response += add_pitch_prosody_tags(start_index, split_response, 
-                                          syllable_counts_response, 
-                                          f0_percent_change_sequence, 
-                                          datapoints_per_syllable_response, i, entrain)
-        start_index += int(syllable_counts_response[i] * datapoints_per_syllable_response)
-
-    text_response += '</speak>'
-    audio_stream = synthesize_speech(text_response, save_location, env, worker_id, ass_id)
-
-    if audio_stream is not None:
-        speech_file_name = os.path.join(save_location, env, worker_id + "_" + ass_id + "_synthesized.mp3")
-        x_polly, fs_polly = sf.read(speech_file_name)
-        f0_polly = pw.harvest(x_polly, fs_polly, f0_floor=80.0, f0_ceil=270.0, frame_period=frame_period)[0]
-        bot_adjacent_ipu, human_adjacent_ipu = save_figure(os.path.join(save_location, env, worker_id + "_" + ass_id + "_comparison.png"), [f0_polly, f0_var])
-
-        print(speech_file_name + ' entrained.. ')
-        print('Loop complete. Check /comparison directory.')
-        write_correlation_data([bot_adjacent_ipu], [human_adjacent_ipu], save_location, env, worker_id, ass_id)
-
-def add_pitch_prosody_tags(start_index, split_response, syllable_counts_response, 
-                     f0_percent_change_sequence, datapoints_per_syllable_response, i, entrain):
-    end_index = start_index + int(syllable_counts_response[i] * datapoints_per_syllable_response)
-    avg_percent_diff = np.average([datapoint for datapoint in f0_percent_change_sequence[start_index:end_index]])
-    avg_percent_diff = avg_percent_diff if entrain else -avg_percent_diff
-    pitch_tag = round(avg_percent_diff, 0)
-    pitch_tag = '+' + str(pitch_tag) if pitch_tag > 0 else str(pitch_tag)
-    return '<prosody pitch="' + pitch_tag + '%">' + split_response[i] + '</prosody>'
-
-
-def synthesize_speech(text_response, save_location, env, worker_id, ass_id):
-    polly_object = PollyWrapper(boto3.client('polly', region_name='us-east-1'), boto3.resource('s3', region_name='us-east-1'))
-
-    results = polly_object.synthesize(text_response, 'standard', 'Joanna', 'mp3', 'en-US', False)
-    audio_stream = results[0]
-
-    if audio_stream is not None:
-        save_speech_file(audio_stream, save_location, env, worker_id, ass_id, text_response)
-    return audio_stream
-
-def save_speech_file(audio_stream, save_location, env, worker_id, ass_id, text_response):
+def analyze_speech_pitch(worker_id, ass_id, save_location, env, response, audio, frame_period, entrain=True, f0_profile=None,
+                         bot_contour=None, synthesis_engine=None):
+    """Synthesizes the pitch condition and compares the bot's F0 contour with the worker's (see synthesize_condition)."""
+    plan = ProsodyPlan.from_recording(response, audio, frame_period, f0_profile)
+    features = ['entrain-pitch' if entrain else 'disentrain-pitch']
+    synthesize_condition(plan, features, worker_id, ass_id, save_location, env, frame_period, f0_profile, bot_contour, synthesis_engine)
+
+def compare_pitch(plan, pitch_values, synthesized, marks, worker_id, ass_id, save_location, env, frame_period, f0_profile=None,
+                  bot_contour=None):
+    """Writes the bot's and the worker's F0 contours (plotted later by world.plotting) and their IPU correlation.
+
+    `bot_contour` is 'harvest' (default: extract F0 from the synthesized audio) or
+    'speech-marks' (estimate it from Polly word marks and the cached baseline
+    voice, falling back to 'harvest' when the marks don't line up with the words).
+    """
+    f0_polly = None
+    if bot_contour == 'speech-marks':
+        f0_polly = estimate_bot_f0(plan.words, pitch_values, synthesized, marks, save_location, env, frame_period, f0_profile)
+    if f0_polly is None:
+        f0_polly = feature_store.extract_f0(synthesized.data, synthesized.samplerate, frame_period=frame_period, f0_floor=80.0, f0_ceil=270.0, profile=f0_profile)
+    plotting.write_contours(plotting.contours_path(save_location, env, worker_id, ass_id), f0_polly, plan.f0, frame_period)
+    bot_adjacent_ipu, human_adjacent_ipu = resample_ipu(*extract_ipus(f0_polly, plan.f0))
+
+    print(synthesized.path + ' entrained.. ')
+    print('Loop complete. Check /comparison directory.')
+    write_correlation_data([bot_adjacent_ipu], [human_adjacent_ipu], save_location, env, worker_id, ass_id)
+
+def synthesize_chunks(chunks, save_location, env, audio_format=SYNTHESIS_FORMAT, priority=None, speech_mark_types=None):
+    """Audio bytes of every SSML document in `chunks`, synthesized concurrently.
+
+    Polly is only called for SSML not already in the synthesis cache (see
+    world.synthesis_cache), through the process's shared, rate-limited
+    PollyService; `priority` is polly_service.LIVE or BATCH (None uses the
+    service default). With `speech_mark_types` (e.g. ('word', 'sentence')) the
+    speech marks of every chunk are fetched alongside and returned as a second
+    list, else that list is None.
+    """
+    sample_rate = SYNTHESIS_SAMPLE_RATE if audio_format == 'pcm' else None
+    cache = synthesis_cache.get_cache(os.path.join(save_location, env, SYNTHESIS_CACHE_DIR))
+    service = polly_service.get_service()
+
+    def synthesize(ssml):
+        key = synthesis_cache.synthesis_key(ssml, SYNTHESIS_VOICE, SYNTHESIS_ENGINE, audio_format, sample_rate)
+        return cache.get_or_synthesize(key, lambda: service.synthesize(
+            ssml, SYNTHESIS_ENGINE, SYNTHESIS_VOICE, audio_format, 'en-US', sample_rate=sample_rate, priority=priority))
+
+    def marks(ssml):
+        key = synthesis_cache.synthesis_key(ssml, SYNTHESIS_VOICE, SYNTHESIS_ENGINE, 'json:' + ','.join(speech_mark_types))
+        data = cache.get_or_synthesize(key, lambda: service.speech_marks(
+            ssml, SYNTHESIS_ENGINE, SYNTHESIS_VOICE, speech_mark_types, 'en-US', priority=priority))
+        return None if data is None else speech_marks.parse_marks(data)
+
+    if len(chunks) == 1 and not speech_mark_types:
+        return [synthesize(chunks[0])], None
+    with ThreadPoolExecutor(len(chunks) * (2 if speech_mark_types else 1)) as executor:
+        audio_futures = [executor.submit(synthesize, ssml) for ssml in chunks]
+        mark_futures = [executor.submit(marks, ssml) for ssml in chunks] if speech_mark_types else None
+        return ([future.result() for future in audio_futures],
+                None if mark_futures is None else [future.result() for future in mark_futures])
+
+def synthesize_speech_with_marks(text_response, save_location, env, worker_id, ass_id, audio_format=SYNTHESIS_FORMAT, priority=None,
+                                 speech_mark_types=None):
+    """Synthesizes the SSML response with Polly and saves it as <worker>_<ass>_synthesized.wav.
+
+    `text_response` is one SSML document, or a list of them (see
+    prosody.build_ssml_chunks) for responses longer than one Polly request
+    allows; the chunks' PCM is joined with short fades. Returns the synthesized
+    audio as an AudioAsset (None if Polly returned no audio) and, if
+    `speech_mark_types` are given, the speech marks of the whole response
+    (times in ms from the start of the joined audio), else None.
+    """
+    chunks = [text_response] if isinstance(text_response, str) else list(text_response)
+    if len(chunks) > 1 and audio_format != 'pcm':
+        raise ValueError("Chunked synthesis needs 'pcm' output, not %r." % audio_format)
+    parts, chunk_marks = synthesize_chunks(chunks, save_location, env, audio_format, priority, speech_mark_types)
+
+    if any(part is None for part in parts):
+        return None, None
+    audio = parts[0] if len(parts) == 1 else join_pcm(parts, SYNTHESIS_SAMPLE_RATE)
+    synthesized = save_speech_file(audio, save_location, env, worker_id, ass_id, '\n'.join(chunks), audio_format)
+
+    marks = None
+    if chunk_marks is not None and not any(chunk is None for chunk in chunk_marks):
+        # 16-bit mono PCM: 2 bytes per sample
+        durations = [1000.0 * len(part) / (2 * SYNTHESIS_SAMPLE_RATE) for part in parts]
+        marks = speech_marks.join_marks(chunk_marks, durations)
+    return synthesized, marks
+
+def synthesize_speech(text_response, save_location, env, worker_id, ass_id, audio_format=SYNTHESIS_FORMAT, priority=None):
+    """Synthesizes the SSML response (see synthesize_speech_with_marks); returns it as an AudioAsset, or None."""
+    return synthesize_speech_with_marks(text_response, save_location, env, worker_id, ass_id, audio_format, priority)[0]
+
+def plain_voice(words, save_location, env):
+    """Samples (float, SYNTHESIS_SAMPLE_RATE) and word spans (ms) of the plain, unmodified bot voice saying `words`.
+
+    The synthesis is cached, so this costs Polly calls only the first time a
+    response is used. The spans are None if the speech marks do not line up
+    with the words; the samples are None if Polly returned no audio.
+    """
+    chunks = prosody.build_plain_ssml_chunks(words)
+    parts, chunk_marks = synthesize_chunks(chunks, save_location, env, 'pcm', polly_service.BATCH, SPEECH_MARK_TYPES)
+    if any(part is None for part in parts):
+        return None, None
+    x = np.frombuffer(join_pcm(parts, SYNTHESIS_SAMPLE_RATE) if len(parts) > 1 else parts[0], dtype='<i2') / 32768.0
+    if any(chunk is None for chunk in chunk_marks):
+        return x, None
+    durations = [1000.0 * len(part) / (2 * SYNTHESIS_SAMPLE_RATE) for part in parts]
+    word_marks = [mark for mark in speech_marks.join_marks(chunk_marks, durations) if mark['type'] == 'word']
+    if len(word_marks) != len(words):
+        return x, None
+    return x, speech_marks.word_spans(word_marks, sum(durations))
+
+def baseline_voice(words, save_location, env, frame_period, f0_profile=None):
+    """F0 contour and word spans (ms) of the plain bot voice (see plain_voice); the contour is cached too.
+
+    Returns (None, None) if the speech marks do not line up with the words.
+    """
+    x, spans = plain_voice(words, save_location, env)
+    if spans is None:
+        return None, None
+    contour = feature_store.extract_f0(x, SYNTHESIS_SAMPLE_RATE, frame_period=frame_period, f0_floor=80.0, f0_ceil=270.0, profile=f0_profile)
+    return contour, spans
+
+def render_speech(words, save_location, env, worker_id, ass_id, pitch_values=None, volume_values=None, synthesis_engine=None,
+                  speech_mark_types=None):
+    """Speaks `words` with per-word pitch (%) and/or volume (dB) offsets; returns (AudioAsset or None, speech marks or None).
+
+    `synthesis_engine` is 'polly' (default: per-word prosody SSML sent to Polly)
+    or 'world' (the cached plain voice is resynthesized locally with the
+    offsets applied; see world.resynthesis). Speech marks are only available
+    from Polly.
+    """
+    synthesis_engine = synthesis_engine or 'polly'
+    if synthesis_engine == 'polly':
+        text_response = prosody.build_ssml_chunks(words, pitch_values, volume_values)
+        return synthesize_speech_with_marks(text_response, save_location, env, worker_id, ass_id, speech_mark_types=speech_mark_types)
+    if synthesis_engine != 'world':
+        raise ValueError("Unknown synthesis engine %r; choose 'polly' or 'world'." % synthesis_engine)
+
+    x, spans = plain_voice(words, save_location, env)
+    if x is None:
+        return None, None
+    _, syllable_counts = text_plan.syllabify(' '.join(words))
+    y = resynthesis.resynthesize(x, SYNTHESIS_SAMPLE_RATE, syllable_counts, pitch_values, volume_values, spans)
+    # the transcript records the SSML Polly would have been sent
+    text_response = prosody.build_ssml(words, pitch_values, volume_values)
+    return save_speech_file(resynthesis.to_pcm(y), save_location, env, worker_id, ass_id, text_response, 'pcm'), None
+
+def estimate_bot_f0(words, pitch_values, synthesized, marks, save_location, env, frame_period, f0_profile=None):
+    """Bot F0 contour from speech marks and the cached baseline voice (None if the marks don't line up)."""
+    word_marks = [mark for mark in marks or [] if mark['type'] == 'word']
+    if len(word_marks) != len(words):
+        return None
+    baseline_f0, baseline_spans = baseline_voice(words, save_location, env, frame_period, f0_profile)
+    if baseline_f0 is None:
+        return None
+    n_frames = f0.frame_count(synthesized.frames, synthesized.samplerate, frame_period)
+    spans = speech_marks.word_spans(word_marks, 1000.0 * synthesized.duration)
+    return speech_marks.bot_contour(baseline_f0, baseline_spans, spans, pitch_values, frame_period, n_frames)
+
+def save_speech_file(audio, save_location, env, worker_id, ass_id, text_response, audio_format=SYNTHESIS_FORMAT):
+    """Writes the synthesized speech bytes (as WAV) and the SSML transcript; returns the speech as an AudioAsset.
+
+    PCM from Polly is wrapped into WAV in-process. MP3 is still re-encoded with
+    ffmpeg (bounded by FFMPEG_TIMEOUT); if that fails the MP3 itself is returned.
+    """
     speech_file_name = os.path.join(save_location, env, worker_id + "_" + ass_id + "_synthesized.mp3")
     speech_text_file_name = os.path.join(save_location, env, worker_id + "_" + ass_id + "_synthesized_transcript.txt")
-    with open(speech_file_name, 'wb') as speech_file:
-        speech_file.write(audio_stream.read())
+    wav_filename = os.path.join(save_location, env, worker_id + "_" + ass_id + "_synthesized.wav")
     with open(speech_text_file_name, 'w', encoding='utf-8') as speech_text_file:
         speech_text_file.write(text_response)
 
-    wav_filename = os.path.join(save_location, env, worker_id + "_" + ass_id + "_synthesized.wav")
+    if audio_format == 'pcm':
+        wav_bytes = pcm_to_wav(audio, SYNTHESIS_SAMPLE_RATE)
+        with open(wav_filename, 'wb') as wav_file:
+            wav_file.write(wav_bytes)
+        return AudioAsset(wav_bytes, wav_filename)
+
+    with open(speech_file_name, 'wb') as speech_file:
+        speech_file.write(audio)
     try:
         # Re-encode MP3 file using ffmpeg
-        subprocess.run(["ffmpeg", "-y", "-i", speech_file_name, wav_filename], check=True)
-    except subprocess.CalledProcessError as e:
+        subprocess.run(["ffmpeg", "-y", "-i", speech_file_name, wav_filename], check=True, timeout=FFMPEG_TIMEOUT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
         print(f"An error occurred while re-encoding the MP3 file: {e}")
+        return AudioAsset(audio, speech_file_name)
+    return AudioAsset.from_file(wav_filename)
 
 def write_correlation_data(bot_adjacent_ipus, human_adjacent_ipus, save_location, env, worker_id, ass_id):
     bot_raw_vals = [x for bot_adjacent_ipu in bot_adjacent_ipus for x in bot_adjacent_ipu]
@@ -171,196 +262,103 @@ def generate_response():
     )
     return response
 
-def list_words_by_pitch(response, wav_filename, frame_period, entrain=True):
-    # Perform pitch analysis
-    x_var, fs_var = sf.read(wav_filename)
-    if not entrain:
-        mean_x = np.mean(x_var)
-        x_var = 2*mean_x - x_var
-    f0_var = pw.harvest(x_var, fs_var, f0_floor=80.0, f0_ceil=270, frame_period=frame_period)[0]
-
-    f0_no_zeroes = [datapoint for datapoint in f0_var if datapoint > 0]
-    mean_f0 = np.mean(f0_no_zeroes)
-
-    f0_diff_sequence = [x - mean_f0 for x in f0_no_zeroes]
-    f0_mean_sequence = [(x + mean_f0) / 2 for x in f0_no_zeroes]
-    f0_percent_change_sequence = [(x / f0_mean_sequence[i]) * 100 for i, x in enumerate(f0_diff_sequence)]
-
-    split_response = response.split(' ')
-    stripped_split_response = [re.sub(r'\W+', '', word) for word in split_response if word]
-    syllable_counts_response = [
-        get_syllable_count(w) if get_syllable_count(w) is not None else get_syllable_count(split_response[i])
-        for i, w in enumerate(stripped_split_response)
-    ]
-    total_syllables_response = sum(syllable_counts_response)
-    datapoints_per_syllable_response = len(f0_percent_change_sequence) / total_syllables_response
-
-    pitch_changes = []
-    start_index = 0
-    for i in range(len(stripped_split_response)):
-        syllables = syllable_counts_response[i]
-        end_index = start_index + int(syllables * datapoints_per_syllable_response)
-        avg_percent_diff = np.average(f0_percent_change_sequence[start_index:end_index])
-        pitch_changes.append(round(avg_percent_diff, 0))
-        start_index = end_index
-
-    return pitch_changes
-
-def amplitude_to_custom_db(amplitude, prev_amplitude):
-    if prev_amplitude == 0:
-        prev_amplitude = amplitude
-    result = round(20 * np.log10(abs(amplitude / prev_amplitude) + 1e-9), 6)
-    if result == 0:
-        return 0.000001
-    else:
-        return result
-
-def list_words_by_amplitude(response, wav_filename, entrain=True):
-    amplitude, sample_rate = librosa.load(wav_filename)
-    amplitude_db = librosa.amplitude_to_db(amplitude)
-    amplitude_normalized = normalize_db_values(amplitude_db, 25, 100)
-    amplitude_no_zeroes = amplitude_normalized
-    length = len(amplitude_no_zeroes)
-    average_first_half = np.mean(np.abs(amplitude_no_zeroes[:length // 2]))
-    average_second_half = np.mean(np.abs(amplitude_no_zeroes[length // 2:]))
-
-    difference = average_second_half - average_first_half
-
-    split_response = response.split(' ')
-    stripped_split_response = [re.sub(r'\W+', '', word) for word in split_response if word]
-    syllable_counts_response = [
-        get_syllable_count(w) if get_syllable_count(w) is not None else get_syllable_count(split_response[i])
-        for i, w in enumerate(stripped_split_response)
-    ]
-    total_syllables_response = sum(syllable_counts_response)
-
-    amplitude_changes = []
-    if entrain:
-        gradient = np.linspace(average_second_half - difference, average_second_half, total_syllables_response)
-    else:
-        gradient = np.linspace(average_first_half, average_first_half - difference, total_syllables_response)
-    prev_mean_amplitude = 0
-    for i in range(len(stripped_split_response)):
-        syllables = syllable_counts_response[i]
-        word_amplitudes = gradient[:syllables]
-        mean_amplitude = np.mean(word_amplitudes)
-        amplitude_change = amplitude_to_custom_db(mean_amplitude, prev_mean_amplitude)
-        amplitude_changes.append(amplitude_change)
-        gradient = gradient[syllables:]
-        prev_mean_amplitude = mean_amplitude
-    return amplitude_changes
-
-def normalize_db_values(db_values, target_min_db, target_max_db):
-    db_min = np.min(db_values)
-    db_max = np.max(db_values)
-    normalized_db_values = (db_values - db_min) / (db_max - db_min)
-    normalized_db_values = (normalized_db_values * (target_max_db - target_min_db)) + target_min_db
-    return normalized_db_values
-
-def analyze_speech_amplitude(worker_id, ass_id, save_location, env, response, wav_filename, entrain=True):
-    amplitude, sample_rate = librosa.load(wav_filename)
-    amplitude_db = librosa.amplitude_to_db(amplitude)
-    amplitude_normalized = normalize_db_values(amplitude_db, 55, 65)
-    amplitude_no_zeroes = amplitude_normalized
-    length = len(amplitude_no_zeroes)
-    average_first_half = np.mean(np.abs(amplitude_no_zeroes[:length//2]))
-    average_second_half = np.mean(np.abs(amplitude_no_zeroes[length//2:]))
-    difference = average_second_half - average_first_half
-
-    split_response = response.split(' ')
-    stripped_split_response = [re.sub(r'\W+', '', word) for word in split_response if word]
-    syllable_counts_response = [get_syllable_count(w) if get_syllable_count(w) is not None 
-                                else get_syllable_count(stripped_split_response[i]) 
-                                for i, w in enumerate(stripped_split_response)]
-    total_syllables_response = sum(syllable_counts_response)
-
-    if entrain:
-        gradient = np.linspace(average_second_half - difference, average_second_half, total_syllables_response)
-    else:
-        gradient = np.linspace(average_first_half, average_first_half - difference, total_syllables_response)
-    prev_mean_amplitude = 0
-
-    text_response = '<speak>'
-    for word, syllables in zip(split_response, syllable_counts_response):
-        text_response += add_amplitude_prosody_tags(syllables, word, gradient, prev_mean_amplitude)
-        gradient = gradient[syllables:]
-        prev_mean_amplitude = np.mean(gradient[:syllables])
-    text_response += '</speak>'
-
-    audio_stream = synthesize_speech(text_response, save_location, env, worker_id, ass_id)
-
-    if audio_stream is not None:
-        save_speech_file(audio_stream, save_location, env, worker_id, ass_id, text_response)
-        print('Loop complete. Check /comparison directory.')
-
-def add_amplitude_prosody_tags(syllables, word, gradient, prev_mean_amplitude):
-    word_amplitudes = gradient[:syllables]
-    mean_amplitude = np.mean(word_amplitudes)
-    amplitude_change = amplitude_to_custom_db(mean_amplitude, prev_mean_amplitude)
-    volume_level = amplitude_change
-    volume_level = "+" + "{:.6f}".format(volume_level) if volume_level >= 0 else "{:.6f}".format(volume_level)
-    return '<prosody volume="' + volume_level + 'dB">' + word + '</prosody>'
-
-def synthesize_combined_features(worker_id, ass_id, save_location, env, response, wav_filename, features, frame_period=5):
-    if 'entrain-pitch' in features:
-        entrain_pitch = True
-    else:
-        entrain_pitch = False
-    if 'entrain-volume' in features:
-        entrain_volume = True
-    else:
-        entrain_volume = False
-    pitch_sequence = list_words_by_pitch(response, wav_filename, frame_period, entrain=entrain_pitch)
-    volume_sequence = list_words_by_amplitude(response, wav_filename, entrain=entrain_volume)
-    
-    split_response = response.split(' ')
-    stripped_split_response = [re.sub(r'\W+', '', word) for word in split_response if word]
-    
-    text_response = '<speak>'
-    for i in range(len(stripped_split_response)):
-        word = split_response[i]
-        pitch_change = pitch_sequence[i]
-        volume_change = volume_sequence[i]
-        
-        if pitch_change > 0:
-            pitch_change = '+' + str(pitch_change)
-        
-        volume_change = "+" + "{:.6f}".format(volume_change) if volume_change >= 0 else "{:.6f}".format(volume_change)
-        text_response += f'<prosody pitch="{pitch_change}%" volume="{volume_change}dB">{word}</prosody>'
-
-    text_response += '</speak>'
-    synthesize_speech(text_response, save_location, env, worker_id, ass_id)
+def analyze_speech_amplitude(worker_id, ass_id, save_location, env, response, audio, entrain=True, synthesis_engine=None):
+    """Synthesizes the volume condition (see synthesize_condition)."""
+    plan = ProsodyPlan.from_recording(response, audio)
+    features = ['entrain-volume' if entrain else 'disentrain-volume']
+    synthesize_condition(plan, features, worker_id, ass_id, save_location, env, synthesis_engine=synthesis_engine)
+
+def synthesize_combined_features(worker_id, ass_id, save_location, env, response, audio, features, frame_period=5, f0_profile=None,
+                                 synthesis_engine=None):
+    """Synthesizes a combined pitch and volume condition (see synthesize_condition)."""
+    plan = ProsodyPlan.from_recording(response, audio, frame_period, f0_profile)
+    synthesize_condition(plan, features, worker_id, ass_id, save_location, env, frame_period, f0_profile, synthesis_engine=synthesis_engine)
+
+def synthesize_condition(plan, features, worker_id, ass_id, save_location, env, frame_period=5, f0_profile=None, bot_contour=None,
+                         synthesis_engine=None):
+    """Renders one condition of a ProsodyPlan; pitch-only conditions also get the F0 comparison (see compare_pitch)."""
+    if not features:
+        return generate_plain_response(worker_id, ass_id, save_location, env, plan.response)
+    planned = plan.values(features)
+    if planned is None:
+        return None
+    words, pitch_values, volume_values = planned
+    pitch_only = volume_values is None
+    speech_mark_types = SPEECH_MARK_TYPES if pitch_only and bot_contour == 'speech-marks' else None
+    synthesized, marks = render_speech(words, save_location, env, worker_id, ass_id, pitch_values, volume_values,
+                                       synthesis_engine=synthesis_engine, speech_mark_types=speech_mark_types)
+
+    if synthesized is not None:
+        if pitch_only:
+            compare_pitch(plan, pitch_values, synthesized, marks, worker_id, ass_id, save_location, env, frame_period, f0_profile, bot_contour)
+        elif pitch_values is None:
+            print('Loop complete. Check /comparison directory.')
+    return synthesized
+
+def render_conditions(plan, worker_id, ass_id, save_location, env, conditions=CONDITIONS, synthesis_engine=None):
+    """Renders many conditions of one recording at once, e.g. every arm for a pilot or offline analysis.
+
+    Each condition is saved as <worker>_<ass>_<condition name>_synthesized.wav.
+    With Polly, the SSML of all conditions goes out in one concurrent batch
+    (through the cache, at batch priority). Returns {condition name: AudioAsset or None}.
+    """
+    rendered = {}
+    if (synthesis_engine or 'polly') != 'polly':
+        for features in conditions:
+            name = condition_name(features)
+            if not features:
+                rendered[name] = synthesize_speech(plan.ssml(features), save_location, env, worker_id, ass_id + '_' + name)
+                continue
+            planned = plan.values(features)
+            if planned is None:
+                rendered[name] = None
+                continue
+            words, pitch_values, volume_values = planned
+            rendered[name] = render_speech(words, save_location, env, worker_id, ass_id + '_' + name, pitch_values, volume_values,
+                                           synthesis_engine=synthesis_engine)[0]
+        return rendered
+
+    ssml = {name: chunks for name, chunks in plan.render_ssml(conditions).items() if chunks is not None}
+    all_chunks = [chunk for chunks in ssml.values() for chunk in chunks]
+    parts, _ = synthesize_chunks(all_chunks, save_location, env, 'pcm', polly_service.BATCH)
+    position = 0
+    for name, chunks in ssml.items():
+        condition_parts = parts[position:position + len(chunks)]
+        position += len(chunks)
+        if any(part is None for part in condition_parts):
+            rendered[name] = None
+            continue
+        audio = condition_parts[0] if len(condition_parts) == 1 else join_pcm(condition_parts, SYNTHESIS_SAMPLE_RATE)
+        rendered[name] = save_speech_file(audio, save_location, env, worker_id, ass_id + '_' + name, '\n'.join(chunks), 'pcm')
+    return rendered
 
 def generate_plain_response(worker_id, ass_id, save_location, env, response):
     text_response = '<speak>' + response + '</speak>'
     synthesize_speech(text_response, save_location, env, worker_id, ass_id)
 
-def perform_analysis(worker_id, ass_id, save_location, env, response, wav_filename, features):
-    """Performs analysis based on the chosen entrainment features."""
-    if 'entrain-pitch' in features and 'entrain-volume' in features:
-        synthesize_combined_features(worker_id, ass_id, save_location, env, response, wav_filename, features, frame_period=5)
-    elif 'entrain-pitch' in features and 'disentrain-volume' in features:
-        synthesize_combined_features(worker_id, ass_id, save_location, env, response, wav_filename, features, frame_period=5)
-    elif 'entrain-pitch' in features:
-        analyze_speech_pitch(worker_id, ass_id, save_location, env, response, wav_filename, frame_period=5, entrain=True)
-    elif 'disentrain-pitch' in features and 'entrain-volume' in features:
-        synthesize_combined_features(worker_id, ass_id, save_location, env, response, wav_filename, features, frame_period=5)
-    elif 'disentrain-pitch' in features and 'disentrain-volume' in features:
-        synthesize_combined_features(worker_id, ass_id, save_location, env, response, wav_filename, features, frame_period=5)
-    elif 'disentrain-pitch' in features:
-        analyze_speech_pitch(worker_id, ass_id, save_location, env, response, wav_filename, frame_period=5, entrain=False)
-    elif 'entrain-volume' in features:
-        analyze_speech_amplitude(worker_id, ass_id, save_location, env, response, wav_filename, entrain=True)
-    elif 'disentrain-volume' in features:
-        analyze_speech_amplitude(worker_id, ass_id, save_location, env, response, wav_filename, entrain=False)
-    elif not features:
+def perform_analysis(worker_id, ass_id, save_location, env, response, audio, features, f0_profile=None, bot_contour=None,
+                     synthesis_engine=None):
+    """Performs analysis based on the chosen entrainment features.
+
+    `audio` is the worker recording as an AudioAsset (or its path); it is decoded
+    once here and shared by every stage. `f0_profile` names the F0 estimator
+    profile (see world.f0); None uses the default, full-rate Harvest.
+    `bot_contour` selects how the pitch conditions get the bot's F0 contour
+    (see analyze_speech_pitch), and `synthesis_engine` how the conditions are
+    rendered: 'polly' (default) or 'world' (see render_speech).
+    """
+    feature_store.configure(os.path.join(save_location, env, 'features'))
+    if not features:
         generate_plain_response(worker_id, ass_id, save_location, env, response)
+        return
+    plan = ProsodyPlan.from_recording(response, audio, 5, f0_profile)
+    synthesize_condition(plan, features, worker_id, ass_id, save_location, env, 5, f0_profile, bot_contour, synthesis_engine)
 
-def main(save_location, env, worker_id, ass_id, entrainment_features):
+def main(save_location, env, worker_id, ass_id, entrainment_features, f0_profile=None, bot_contour=None, synthesis_engine=None):
     """Performs speech analysis."""
     response = generate_response()
     wav_filename = os.path.join(save_location,env,worker_id+"_"+ass_id+"_worker_recording.wav")
-    perform_analysis(worker_id, ass_id, save_location, env, response, wav_filename, entrainment_features)
+    perform_analysis(worker_id, ass_id, save_location, env, response, wav_filename, entrainment_features, f0_profile, bot_contour, synthesis_engine)
 
 """main('./', 'sandbox', '1', '1', ['entrain-pitch', 'entrain-volume'])
 main('./', 'sandbox', '2', '2', ['entrain-pitch', 'disentrain-volume'])
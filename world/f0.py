@@ -0,0 +1,229 @@
+"""Named F0 estimator profiles behind one extractor interface.
+
+Every profile returns a contour on the same frame grid as full-rate
+`pw.harvest(x, fs, frame_period=...)`, so the profiles are interchangeable in
+the per-word pitch aggregation and the IPU comparison.
+
+- accurate: Harvest on the full-rate signal (the original behaviour)
+- fast: Harvest on the signal decimated to 16 kHz
+- fastest: DIO + StoneMask on the signal decimated to 16 kHz
+- coarse-to-fine: a quick DIO pass finds the speaker's F0 range, then Harvest
+  searches only that range on the decimated signal
+
+Any profile can be prefixed with 'chunked-' (e.g. 'chunked-accurate') to split
+long recordings at silent regions and extract the chunks in a process pool.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, gcd
+
+import numpy as np
+import pyworld as pw
+from scipy.signal import resample_poly
+
+DEFAULT_PROFILE = 'accurate'
+CHUNKED_PREFIX = 'chunked-'
+# WORLD is designed for speech sampled at >= 16 kHz; with an F0 ceiling of a
+# few hundred Hz nothing above that is needed for pitch tracking.
+DECIMATED_RATE = 16000
+
+
+def frame_count(n_samples, fs, frame_period):
+    """Number of frames WORLD's estimators return for a signal."""
+    return int(1000.0 * n_samples / fs / frame_period) + 1
+
+
+def decimate(x, fs, target_fs=DECIMATED_RATE):
+    """Polyphase-resamples `x` down to `target_fs` (no-op if already at or below it)."""
+    if fs <= target_fs:
+        return x, fs
+    divisor = gcd(int(fs), int(target_fs))
+    return resample_poly(x, target_fs // divisor, int(fs) // divisor), target_fs
+
+
+def fit_frames(f0, n_frames):
+    """Trims or zero-pads a contour to `n_frames` (decimation can shift the count by one)."""
+    if len(f0) >= n_frames:
+        return f0[:n_frames]
+    return np.concatenate([f0, np.zeros(n_frames - len(f0))])
+
+
+class F0Extractor:
+    """Base class: `extract` returns an F0 contour aligned with full-rate Harvest."""
+
+    name = None
+
+    def extract(self, x, fs, frame_period=5.0, f0_floor=80.0, f0_ceil=270.0):
+        n_frames = frame_count(len(x), fs, frame_period)
+        return fit_frames(self._extract(np.ascontiguousarray(x, dtype=np.float64), fs,
+                                        frame_period, f0_floor, f0_ceil), n_frames)
+
+    def _extract(self, x, fs, frame_period, f0_floor, f0_ceil):
+        raise NotImplementedError
+
+
+class HarvestExtractor(F0Extractor):
+    name = 'accurate'
+
+    def _extract(self, x, fs, frame_period, f0_floor, f0_ceil):
+        return pw.harvest(x, fs, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=frame_period)[0]
+
+
+class DecimatedHarvestExtractor(F0Extractor):
+    name = 'fast'
+
+    def _extract(self, x, fs, frame_period, f0_floor, f0_ceil):
+        x, fs = decimate(x, fs)
+        return pw.harvest(x, fs, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=frame_period)[0]
+
+
+class DioStonemaskExtractor(F0Extractor):
+    name = 'fastest'
+
+    def _extract(self, x, fs, frame_period, f0_floor, f0_ceil):
+        x, fs = decimate(x, fs)
+        f0, t = pw.dio(x, fs, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=frame_period)
+        return pw.stonemask(x, f0, t, fs)
+
+
+class CoarseToFineExtractor(F0Extractor):
+    """DIO at a coarse frame period bounds the search range of the Harvest pass."""
+
+    name = 'coarse-to-fine'
+
+    def __init__(self, coarse_frame_period=20.0, margin=1.25):
+        self.coarse_frame_period = coarse_frame_period
+        self.margin = margin
+
+    def _extract(self, x, fs, frame_period, f0_floor, f0_ceil):
+        x, fs = decimate(x, fs)
+        coarse = pw.dio(x, fs, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=self.coarse_frame_period)[0]
+        voiced = coarse[coarse > 0]
+        if len(voiced) >= 10:
+            low, high = np.percentile(voiced, [5, 95])
+            f0_floor = max(f0_floor, low / self.margin)
+            f0_ceil = min(f0_ceil, high * self.margin)
+        return pw.harvest(x, fs, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=frame_period)[0]
+
+
+PROFILES = {extractor.name: extractor for extractor in
+            (HarvestExtractor(), DecimatedHarvestExtractor(), DioStonemaskExtractor(), CoarseToFineExtractor())}
+
+
+def frame_energy_db(x, fs, frame_period, n_frames):
+    """Log energy of a one-frame-period window centred on every frame."""
+    hop = fs * frame_period / 1000.0
+    window = max(1, int(round(hop)))
+    starts = np.clip(np.round(np.arange(n_frames) * hop).astype(int) - window // 2, 0, max(0, len(x) - window))
+    # windowed sums as differences of a running sum (as in world.loudness), not a length-`window` convolution
+    squares = np.concatenate([[0.0], np.cumsum(np.square(x))])
+    power = (squares[np.minimum(starts + window, len(x))] - squares[starts]) / window
+    return 10 * np.log10(power + 1e-12)
+
+
+def _extract_chunk(profile, x, fs, frame_period, f0_floor, f0_ceil):
+    return get_extractor(profile).extract(x, fs, frame_period=frame_period, f0_floor=f0_floor, f0_ceil=f0_ceil)
+
+
+_pool = None
+_pool_processes = None
+
+
+def configure_pool(processes=None, workers=1):
+    """Sizes the chunk pool of this process, before its first chunked extraction.
+
+    Each of `workers` processes extracting side by side (the analysis workers,
+    a batch run's processes) gets its own pool, so by default each one gets
+    its share of the CPUs, `cpu_count // workers`, rather than all of them.
+    """
+    global _pool_processes
+    _pool_processes = processes or max(1, os.cpu_count() // max(1, workers))
+
+
+def get_pool(processes=None):
+    """Process pool shared by every chunked extraction in this process."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(processes or _pool_processes or os.cpu_count())
+    return _pool
+
+
+class ChunkedExtractor(F0Extractor):
+    """Splits long recordings at silences and extracts the chunks in parallel.
+
+    Cuts are placed in the quietest pause near every `chunk_seconds`; each
+    chunk is extracted with `overlap_seconds` of padding on both sides, which is
+    then dropped, so every kept frame saw the same signal context as in a
+    whole-file extraction. Chunk starts are snapped to the frame grid, so the
+    stitched contour has exactly the whole-file frame count and timing.
+    Recordings shorter than `min_seconds` are extracted whole.
+    """
+
+    def __init__(self, base, chunk_seconds=10.0, overlap_seconds=0.5, min_seconds=20.0, pause_seconds=0.1, processes=None):
+        self.base = base
+        self.name = CHUNKED_PREFIX + base.name
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.min_seconds = min_seconds
+        self.pause_seconds = pause_seconds
+        self.processes = processes
+
+    def cut_frames(self, x, fs, frame_period, n_frames):
+        """Frame indices where the contour is split (including 0 and n_frames).
+
+        Each cut is the centre of the quietest `pause_seconds` stretch within a
+        quarter chunk of the target chunk length.
+        """
+        chunk_frames = int(self.chunk_seconds * 1000 / frame_period)
+        search = chunk_frames // 4
+        pause_frames = max(1, int(self.pause_seconds * 1000 / frame_period))
+        energy = frame_energy_db(x, fs, frame_period, n_frames)
+        pause_energy = np.convolve(energy, np.ones(pause_frames) / pause_frames, mode='same')
+        cuts = [0]
+        while n_frames - cuts[-1] > chunk_frames + search:
+            low = cuts[-1] + chunk_frames - search
+            cuts.append(low + int(np.argmin(pause_energy[low:low + 2 * search])))
+        cuts.append(n_frames)
+        return cuts
+
+    def extract(self, x, fs, frame_period=5.0, f0_floor=80.0, f0_ceil=270.0):
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        if len(x) / fs < self.min_seconds:
+            return self.base.extract(x, fs, frame_period=frame_period, f0_floor=f0_floor, f0_ceil=f0_ceil)
+
+        n_frames = frame_count(len(x), fs, frame_period)
+        samples_per_frame = fs * frame_period / 1000.0
+        pad_frames = int(ceil(self.overlap_seconds * 1000 / frame_period))
+        cuts = self.cut_frames(x, fs, frame_period, n_frames)
+
+        jobs = []
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            padded_start = max(0, start - pad_frames)
+            padded_end = min(n_frames, end + pad_frames)
+            first_sample = int(round(padded_start * samples_per_frame))
+            last_sample = min(len(x), int(round(padded_end * samples_per_frame)) + 1)
+            jobs.append((start - padded_start, end - start, x[first_sample:last_sample]))
+
+        pool = get_pool(self.processes)
+        futures = [pool.submit(_extract_chunk, self.base.name, chunk, fs, frame_period, f0_floor, f0_ceil)
+                   for _, _, chunk in jobs]
+        contour = np.concatenate([future.result()[offset:offset + length]
+                                  for (offset, length, _), future in zip(jobs, futures)])
+        return fit_frames(contour, n_frames)
+
+
+_chunked = {}
+
+
+def get_extractor(profile=None):
+    """Looks up an estimator profile by name (None means the default, 'accurate')."""
+    profile = profile or DEFAULT_PROFILE
+    if profile.startswith(CHUNKED_PREFIX) and profile[len(CHUNKED_PREFIX):] in PROFILES:
+        if profile not in _chunked:
+            _chunked[profile] = ChunkedExtractor(PROFILES[profile[len(CHUNKED_PREFIX):]])
+        return _chunked[profile]
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError('Unknown F0 profile %r; choose one of %s (optionally prefixed with %r).'
+                         % (profile, ', '.join(PROFILES), CHUNKED_PREFIX))
@@ -0,0 +1,127 @@
+"""Content-addressed store for extracted acoustic features (F0, voicing, loudness).
+
+Features are keyed by a hash of the exact samples they were extracted from plus
+the extractor parameters, so an unchanged recording is never analysed twice:
+retried validations, offline re-analysis and repeated stages all hit the store.
+A small in-process LRU sits in front of the on-disk `.npz` files.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from world import f0, loudness
+
+FEATURE_STORE_ENV = 'PEF_FEATURE_STORE'
+
+
+class FeatureStore:
+    """Compressed on-disk feature arrays with an in-process LRU in front of them."""
+
+    def __init__(self, root=None, cache_size=32):
+        self.root = root
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.npz')
+
+    def get(self, key):
+        """Returns the stored feature dict for `key`, or None."""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if self.root is None:
+            return None
+        try:
+            with np.load(self._path(key)) as stored:
+                features = {name: stored[name] for name in stored.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        self._remember(key, features)
+        return features
+
+    def put(self, key, features):
+        """Stores a dict of arrays under `key`."""
+        self._remember(key, features)
+        if self.root is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                np.savez_compressed(tmp_file, **features)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get_or_compute(self, key, compute):
+        features = self.get(key)
+        if features is None:
+            features = compute()
+            self.put(key, features)
+        return features
+
+    def _remember(self, key, features):
+        self._cache[key] = features
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+_stores = {}
+_default_root = os.environ.get(FEATURE_STORE_ENV)
+
+
+def get_store(root=None):
+    """Returns the (per-process, shared) store for `root`; defaults to the configured root."""
+    root = root if root is not None else _default_root
+    if root not in _stores:
+        _stores[root] = FeatureStore(root)
+    return _stores[root]
+
+
+def configure(root):
+    """Sets the directory used by the default store."""
+    global _default_root
+    _default_root = root
+
+
+def feature_key(x, fs, kind, **params):
+    """Hash of the samples, sample rate, feature kind and extractor parameters."""
+    x = np.ascontiguousarray(x)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps([kind, float(fs), str(x.dtype), x.shape, params], sort_keys=True).encode())
+    digest.update(x.data)
+    return digest.hexdigest()
+
+
+def extract_f0(x, fs, frame_period=5.0, f0_floor=80.0, f0_ceil=270.0, profile=None, store=None):
+    """F0 contour from the given estimator profile (see world.f0), served from the store when already extracted."""
+    extractor = f0.get_extractor(profile)
+    store = store or get_store()
+    params = {'frame_period': float(frame_period), 'f0_floor': float(f0_floor), 'f0_ceil': float(f0_ceil)}
+    kind = 'harvest' if extractor.name == f0.DEFAULT_PROFILE else 'f0:' + extractor.name
+
+    def compute():
+        contour = extractor.extract(x, fs, frame_period=frame_period, f0_floor=f0_floor, f0_ceil=f0_ceil)
+        return {'f0': contour, 'voiced': contour > 0}
+
+    return store.get_or_compute(feature_key(x, fs, kind, **params), compute)['f0']
+
+
+def loudness_db(audio, frame_seconds=loudness.FRAME_SECONDS, hop_seconds=loudness.HOP_SECONDS, store=None):
+    """Frame RMS loudness envelope (dB) of an AudioAsset at its native rate (see world.loudness)."""
+    store = store or get_store()
+
+    def compute():
+        return {'loudness_db': loudness.frame_rms_db(audio.data, audio.samplerate, frame_seconds, hop_seconds)}
+
+    key = feature_key(audio.data, audio.samplerate, 'loudness_db', frame_seconds=frame_seconds, hop_seconds=hop_seconds)
+    return store.get_or_compute(key, compute)['loudness_db']
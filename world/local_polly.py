@@ -0,0 +1,293 @@
+"""Local stand-in for the Polly client, for offline end-to-end runs and load tests.
+
+`LocalPollyClient` answers the `synthesize_speech` / `describe_voices` calls
+the pipeline makes (directly through `polly_service`, or through
+`PollyWrapper`), so it plugs in wherever a boto3 Polly client does:
+
+    polly_service.configure(client=LocalPollyClient(latency=0.15, max_tps=8))
+
+It also runs asynchronous synthesis tasks (`start_speech_synthesis_task` /
+`get_speech_synthesis_task`), writing their output to a `LocalS3Client`, so
+world.polly_tasks runs offline too:
+
+    s3 = LocalS3Client()
+    polly_tasks.synthesize_tasks(requests, LocalPollyClient(s3=s3, task_latency=2), s3, 'bucket')
+
+SSML is parsed for `<prosody pitch/volume/rate>` and `<break>`, and every word
+is rendered with WORLD: a voiced stretch per syllable at the voice's base F0
+shifted by the word's pitch percentage, with a fixed formant-like envelope
+scaled by its volume. Word and sentence speech marks come from the same
+timeline, so they line up with the audio exactly. Only 'pcm' audio (8 or
+16 kHz) and 'json' speech marks are produced.
+
+Latency (a fixed part, a per-character part and random jitter) and
+ThrottlingException errors (at random, and above `max_tps` calls per second)
+are configurable. Errors are raised as botocore ClientErrors, as a real client
+raises them once its own retries are exhausted.
+"""
+import collections
+import io
+import json
+import re
+import threading
+import time
+
+import numpy as np
+import pyworld as pw
+from botocore.exceptions import ClientError
+
+from world import text_plan
+
+FRAME_PERIOD = 5.0
+SYLLABLE_SECONDS = 0.18
+WORD_GAP_SECONDS = 0.04
+SENTENCE_PAUSE_SECONDS = 0.25
+DEFAULT_BREAK_SECONDS = 0.5
+SAMPLE_RATES = ('8000', '16000')
+DEFAULT_SAMPLE_RATE = '16000'
+# characters of input text SynthesizeSpeech / StartSpeechSynthesisTask accept
+MAX_TEXT_LENGTH = 6000
+MAX_TASK_TEXT_LENGTH = 200000
+
+# base F0 of the voices the experiments use; any other voice gets DEFAULT_VOICE_F0
+VOICE_F0 = {'Joanna': 210.0, 'Salli': 220.0, 'Kendra': 200.0, 'Matthew': 115.0, 'Joey': 125.0, 'Justin': 240.0}
+DEFAULT_VOICE_F0 = 180.0
+
+TOKENS = re.compile(r'<(/?)(\w+)([^>]*?)/?>|[^<\s]+')
+ATTRIBUTE = re.compile(r'(\w+)="([^"]*)"')
+SIGNED_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+BREAK_TIME = re.compile(r'(\d+(?:\.\d+)?)(ms|s)')
+WORD_CHARACTER = re.compile(r'\w')
+
+Word = collections.namedtuple('Word', ['start', 'end', 'value', 'syllables', 'pitch', 'volume', 'rate', 'pause'])
+
+
+def _percent(value, default=0.0):
+    match = SIGNED_NUMBER.match(value or '')
+    return float(match.group()) if match else default
+
+
+def parse_ssml(text):
+    """The spoken words of an SSML (or plain text) document, with byte offsets and their prosody.
+
+    Nested `<prosody>` tags add up. A `<break>` (or a sentence end) becomes a
+    pause after the preceding word.
+    """
+    stack = [(0.0, 0.0, 100.0)]
+    words = []
+    pause = 0.0
+    for match in TOKENS.finditer(text):
+        closing, tag, attributes = match.group(1), match.group(2), match.group(3)
+        if tag == 'prosody':
+            if closing and len(stack) > 1:
+                stack.pop()
+            elif not closing:
+                values = dict(ATTRIBUTE.findall(attributes))
+                pitch, volume, rate = stack[-1]
+                stack.append((pitch + _percent(values.get('pitch')), volume + _percent(values.get('volume')),
+                              rate * _percent(values.get('rate'), 100.0) / 100.0))
+        elif tag == 'break':
+            duration = BREAK_TIME.search(attributes)
+            seconds = DEFAULT_BREAK_SECONDS if duration is None else float(duration.group(1)) / (1000.0 if duration.group(2) == 'ms' else 1.0)
+            if words:
+                words[-1] = words[-1]._replace(pause=words[-1].pause + seconds)
+            else:
+                pause += seconds
+        elif tag is None and WORD_CHARACTER.search(match.group()):
+            token = match.group()
+            start = len(text[:match.start()].encode('utf-8'))
+            pitch, volume, rate = stack[-1]
+            words.append(Word(start, start + len(token.encode('utf-8')), token,
+                              text_plan.syllable_count(text_plan.NON_WORD.sub('', token), token), pitch, volume, max(rate, 20.0),
+                              SENTENCE_PAUSE_SECONDS if token.endswith(('.', '!', '?')) else 0.0))
+    return words, pause
+
+
+class LocalPollyClient:
+    """Renders SSML locally with the `synthesize_speech` interface of a boto3 Polly client.
+
+    :param latency: seconds every call takes before it answers.
+    :param latency_per_char: extra seconds per character of input text.
+    :param jitter: up to this many extra seconds, uniformly at random.
+    :param throttle_rate: fraction of calls that fail with a ThrottlingException.
+    :param max_tps: calls above this many in any one-second window fail with a ThrottlingException.
+    :param seed: seed of the jitter and throttling draws.
+    :param s3: where synthesis tasks write their output (a `LocalS3Client`).
+    :param task_latency: seconds before a synthesis task completes.
+    """
+
+    def __init__(self, latency=0.0, latency_per_char=0.0, jitter=0.0, throttle_rate=0.0, max_tps=None, seed=None,
+                 s3=None, task_latency=0.0):
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.max_tps = max_tps
+        self.calls = 0
+        self.throttled = 0
+        self._recent = collections.deque()
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.s3 = s3
+        self.task_latency = task_latency
+        self._tasks = {}
+        self._task_count = 0
+
+    def _admit(self, text, operation):
+        """Counts the call, applies throttling and sleeps the configured latency."""
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            throttle = (self.max_tps is not None and len(self._recent) >= self.max_tps) or \
+                (self.throttle_rate > 0 and self._rng.random() < self.throttle_rate)
+            self._recent.append(now)
+            if throttle:
+                self.throttled += 1
+            delay = self.latency + self.latency_per_char * len(text) + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if throttle:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, operation)
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def _invalid(message, code='ValidationException', operation='SynthesizeSpeech'):
+        return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+    def _output(self, kwargs, max_length, operation):
+        """(content type, bytes) of a SynthesizeSpeech / StartSpeechSynthesisTask request."""
+        text = kwargs['Text']
+        if len(text) > max_length:
+            raise self._invalid('Maximum text length has been exceeded', 'TextLengthExceededException', operation)
+        words, lead = parse_ssml(text) if kwargs.get('TextType') == 'ssml' else parse_ssml(text.replace('<', ' '))
+        timeline = self.timeline(words, lead)
+
+        if kwargs['OutputFormat'] == 'json':
+            mark_types = kwargs.get('SpeechMarkTypes') or []
+            if not mark_types:
+                raise self._invalid('SpeechMarkTypes are required for json output', operation=operation)
+            return 'application/x-json-stream', self.marks(words, timeline, mark_types).encode('utf-8')
+        if kwargs['OutputFormat'] != 'pcm':
+            raise self._invalid('Only pcm audio is rendered locally, not ' + kwargs['OutputFormat'], operation=operation)
+        sample_rate = kwargs.get('SampleRate', DEFAULT_SAMPLE_RATE)
+        if sample_rate not in SAMPLE_RATES:
+            raise self._invalid('Invalid sample rate for pcm: ' + str(sample_rate), operation=operation)
+        y = self.render(words, timeline, VOICE_F0.get(kwargs.get('VoiceId'), DEFAULT_VOICE_F0), int(sample_rate))
+        return 'audio/pcm', (np.clip(y, -1, 1) * 32767).astype('<i2').tobytes()
+
+    def synthesize_speech(self, **kwargs):
+        self._admit(kwargs['Text'], 'SynthesizeSpeech')
+        content_type, content = self._output(kwargs, MAX_TEXT_LENGTH, 'SynthesizeSpeech')
+        return {'ContentType': content_type, 'RequestCharacters': len(kwargs['Text']), 'AudioStream': io.BytesIO(content)}
+
+    def start_speech_synthesis_task(self, **kwargs):
+        """Renders the output right away; the task reports 'completed' (and its S3 object appears) `task_latency` s later."""
+        self._admit(kwargs['Text'], 'StartSpeechSynthesisTask')
+        if self.s3 is None:
+            raise self._invalid('No S3 stand-in to write task output to', operation='StartSpeechSynthesisTask')
+        _, content = self._output(kwargs, MAX_TASK_TEXT_LENGTH, 'StartSpeechSynthesisTask')
+        with self._lock:
+            self._task_count += 1
+            task_id = 'local-task-%d' % self._task_count
+        bucket = kwargs['OutputS3BucketName']
+        key = kwargs.get('OutputS3KeyPrefix', '') + task_id + ('.marks' if kwargs['OutputFormat'] == 'json' else '.' + kwargs['OutputFormat'])
+        task = {'TaskId': task_id, 'TaskStatus': 'scheduled', 'OutputUri': 'https://s3.us-east-1.amazonaws.com/%s/%s' % (bucket, key),
+                'CreationTime': time.time(), 'RequestCharacters': len(kwargs['Text']), 'OutputFormat': kwargs['OutputFormat'],
+                'TextType': kwargs.get('TextType', 'text'), 'VoiceId': kwargs['VoiceId']}
+        self._tasks[task_id] = (time.monotonic() + self.task_latency, bucket, key, content, task)
+        return {'SynthesisTask': dict(task)}
+
+    def get_speech_synthesis_task(self, **kwargs):
+        self._admit('', 'GetSpeechSynthesisTask')
+        if kwargs['TaskId'] not in self._tasks:
+            raise self._invalid('Synthesis task not found', 'SynthesisTaskNotFoundException', 'GetSpeechSynthesisTask')
+        ready_at, bucket, key, content, task = self._tasks[kwargs['TaskId']]
+        if task['TaskStatus'] != 'completed':
+            if time.monotonic() >= ready_at:
+                self.s3.put_object(Bucket=bucket, Key=key, Body=content)
+                task['TaskStatus'] = 'completed'
+            else:
+                task['TaskStatus'] = 'inProgress'
+        return {'SynthesisTask': dict(task)}
+
+    def describe_voices(self, **kwargs):
+        voices = [{'Id': voice, 'Name': voice, 'Gender': 'Female' if f0 > 160 else 'Male', 'LanguageCode': 'en-US',
+                   'LanguageName': 'US English', 'SupportedEngines': ['standard', 'neural']}
+                  for voice, f0 in VOICE_F0.items()]
+        return {'Voices': voices}
+
+    @staticmethod
+    def timeline(words, lead=0.0):
+        """(start frame, voiced end frame, end frame) of every word; frames are FRAME_PERIOD ms."""
+        frames = []
+        position = int(round(lead * 1000 / FRAME_PERIOD))
+        for word in words:
+            voiced = int(round(word.syllables * SYLLABLE_SECONDS * 100.0 / word.rate * 1000 / FRAME_PERIOD))
+            end = position + voiced + int(round((WORD_GAP_SECONDS + word.pause) * 1000 / FRAME_PERIOD))
+            frames.append((position, position + voiced, end))
+            position = end
+        return frames
+
+    @staticmethod
+    def marks(words, timeline, mark_types):
+        """Speech marks as Polly returns them (JSON lines, times in ms, byte offsets into the input)."""
+        marks = []
+        sentence_start = 0
+        for i, (word, (start, _, _)) in enumerate(zip(words, timeline)):
+            if 'sentence' in mark_types and i == sentence_start:
+                last = next((j for j in range(i, len(words)) if words[j].value.endswith(('.', '!', '?'))), len(words) - 1)
+                sentence_start = last + 1
+                marks.append({'time': int(start * FRAME_PERIOD), 'type': 'sentence', 'start': word.start,
+                              'end': words[last].end, 'value': ' '.join(w.value for w in words[i:last + 1])})
+            if 'word' in mark_types:
+                marks.append({'time': int(start * FRAME_PERIOD), 'type': 'word', 'start': word.start, 'end': word.end,
+                              'value': word.value})
+        return '\n'.join(json.dumps(mark) for mark in marks)
+
+    @staticmethod
+    def render(words, timeline, base_f0, fs):
+        """WORLD rendering of the words on their timeline: one rise-fall per syllable, unvoiced silence between words."""
+        n_frames = (timeline[-1][2] if timeline else 0) + 1
+        fft_size = pw.get_cheaptrick_fft_size(fs)
+        freqs = np.linspace(0, fs / 2, fft_size // 2 + 1)
+        envelope = 1e-2 * (np.exp(-freqs / 1500) + 0.3 * np.exp(-((freqs - 700) / 200) ** 2)
+                           + 0.2 * np.exp(-((freqs - 1200) / 300) ** 2)) ** 2
+        f0 = np.zeros(n_frames)
+        gain = np.full(n_frames, 1e-6)
+        for word, (start, voiced_end, _) in zip(words, timeline):
+            n = voiced_end - start
+            if n <= 0:
+                continue
+            phase = np.linspace(0, np.pi * word.syllables, n, endpoint=False)
+            f0[start:voiced_end] = base_f0 * (1 + word.pitch / 100.0) * (1 + 0.04 * np.sin(phase))
+            gain[start:voiced_end] = 10 ** (word.volume / 10.0) * (0.3 + 0.7 * np.sin(phase % np.pi))
+        f0 = np.clip(f0, 0, fs / 2 - 1)
+        sp = gain[:, None] * envelope
+        ap = np.where((f0 > 0)[:, None], 0.05, 0.999) * np.ones_like(sp)
+        return pw.synthesize(f0, sp, ap, fs, FRAME_PERIOD)
+
+
+class LocalS3Client:
+    """In-memory stand-in for the `put_object` / `get_object` / `delete_object` calls of a boto3 S3 client."""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self._lock:
+            self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.read()
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': Key}}, 'GetObject')
+            content = self.objects[(Bucket, Key)]
+        return {'Body': io.BytesIO(content), 'ContentLength': len(content)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
@@ -0,0 +1,76 @@
+"""Frame-level loudness (RMS energy in dB) at the recording's native rate.
+
+Replaces per-sample `librosa.amplitude_to_db` on a 22.05 kHz resampled copy:
+one cumulative sum of squares gives every frame's mean power, so the volume
+conditions only ever hold one value per 10 ms hop. `LoudnessMeter` computes
+the same frames incrementally from blocks of samples, for callers that never
+hold the whole recording in memory.
+"""
+import numpy as np
+
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+# same floor and dynamic range as librosa.amplitude_to_db
+AMIN = 1e-5
+TOP_DB = 80.0
+
+
+def to_mono(x):
+    x = np.asarray(x, dtype=np.float64)
+    return x if x.ndim == 1 else x.mean(axis=1)
+
+
+def power_to_db(power, amin=AMIN, top_db=TOP_DB):
+    """10*log10 of frame power, floored at `amin` amplitude and clipped to `top_db` below the peak."""
+    db = 10 * np.log10(np.maximum(power, amin ** 2))
+    if top_db is not None and len(db):
+        db = np.maximum(db, db.max() - top_db)
+    return db
+
+
+def frame_power(x, frame_length, hop_length):
+    """Mean square of every full frame (frames start every `hop_length` samples)."""
+    if len(x) < frame_length:
+        return np.empty(0)
+    squares = np.concatenate([[0.0], np.cumsum(np.square(x))])
+    starts = np.arange(0, len(x) - frame_length + 1, hop_length)
+    return (squares[starts + frame_length] - squares[starts]) / frame_length
+
+
+def frame_lengths(fs, frame_seconds=FRAME_SECONDS, hop_seconds=HOP_SECONDS):
+    return max(1, int(round(frame_seconds * fs))), max(1, int(round(hop_seconds * fs)))
+
+
+def frame_rms_db(x, fs, frame_seconds=FRAME_SECONDS, hop_seconds=HOP_SECONDS):
+    """Loudness envelope of a signal in dB, one value per hop."""
+    frame_length, hop_length = frame_lengths(fs, frame_seconds, hop_seconds)
+    return power_to_db(frame_power(to_mono(x), frame_length, hop_length))
+
+
+class LoudnessMeter:
+    """Streams blocks of samples into frame powers (same frames as `frame_rms_db`)."""
+
+    def __init__(self, fs, frame_seconds=FRAME_SECONDS, hop_seconds=HOP_SECONDS):
+        self.fs = fs
+        self.frame_length, self.hop_length = frame_lengths(fs, frame_seconds, hop_seconds)
+        self.samples = 0
+        self._pending = np.empty(0)
+        self._powers = []
+
+    def update(self, block):
+        """Adds a block of samples; returns the powers of the frames it completed."""
+        block = to_mono(block)
+        self.samples += len(block)
+        pending = np.concatenate([self._pending, block])
+        powers = frame_power(pending, self.frame_length, self.hop_length)
+        # keep the samples the next (incomplete) frame starts from
+        self._pending = pending[len(powers) * self.hop_length:]
+        self._powers.append(powers)
+        return powers
+
+    def power(self):
+        return np.concatenate(self._powers) if self._powers else np.empty(0)
+
+    def db(self):
+        """Loudness envelope of everything seen so far, in dB."""
+        return power_to_db(self.power())
@@ -0,0 +1,128 @@
+"""Comparison figures of the bot's and the worker's F0 contours, rendered off the synthesis path.
+
+The analysis only writes each pitch session's contours as compact JSON
+(`<worker>_<ass>_contours.json`, see `write_contours`); nothing on the live
+path imports matplotlib. This module turns those files into the
+`_comparison.png` figures whenever someone wants them, batched across
+sessions in a process pool:
+
+    python -m world.plotting /data/speak_amt_prosody production --processes 8
+
+Only sessions whose PNG is missing or older than their contours are plotted,
+so a rerun picks up where the last one stopped.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CONTOURS_SUFFIX = '_contours.json'
+FIGURE_SUFFIX = '_comparison.png'
+EPSILON = 1e-8
+
+
+def contours_path(save_location, env, worker_id, ass_id):
+    return os.path.join(save_location, env, worker_id + '_' + ass_id + CONTOURS_SUFFIX)
+
+
+def write_contours(path, bot_f0, human_f0, frame_period):
+    """Writes the bot's and the worker's F0 contours (Hz, 0 = unvoiced, 0.01 Hz resolution) as JSON."""
+    document = {'frame_period': frame_period,
+                'bot': np.round(np.asarray(bot_f0, dtype=float), 2).tolist(),
+                'human': np.round(np.asarray(human_f0, dtype=float), 2).tolist()}
+    with open(path, 'w', encoding='utf-8') as file_handle:
+        json.dump(document, file_handle, separators=(',', ':'))
+
+
+def read_contours(path):
+    """(bot F0, worker F0, frame period) from a contours file."""
+    with open(path, encoding='utf-8') as file_handle:
+        document = json.load(file_handle)
+    return np.array(document['bot']), np.array(document['human']), document['frame_period']
+
+
+def plot_fig(fig_list, log=True):
+    """Plots the figures."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    n = len(fig_list)
+    f = fig_list[0]
+
+    if len(f.shape) == 1:
+        plt.figure()
+        for i, f in enumerate(fig_list):
+            plt.subplot(n, 1, i + 1)
+            if len(f.shape) == 1:
+                plt.plot(f)
+                plt.xlim([0, len(f)])
+    elif len(f.shape) == 2:
+        plt.figure()
+        for i, f in enumerate(fig_list):
+            plt.subplot(n, 1, i + 1)
+            if log:
+                x = np.log(f + EPSILON)
+            else:
+                x = f + EPSILON
+            plt.imshow(x.T, origin='lower',
+                       interpolation='none', aspect='auto', extent=(0, x.shape[0], 0, x.shape[1]))
+    else:
+        raise ValueError('Input dimension must < 3.')
+    return plt
+
+
+def save_figure(filename, fig_list, log=True):
+    """Saves the figures to a file."""
+    plt = plot_fig(fig_list, log)
+    plt.savefig(filename)
+    plt.close()
+
+
+def plot_contours(path):
+    """Renders one contours file to its `_comparison.png`; returns the PNG path."""
+    bot_f0, human_f0, _ = read_contours(path)
+    figure_path = path[:-len(CONTOURS_SUFFIX)] + FIGURE_SUFFIX
+    save_figure(figure_path, [bot_f0, human_f0])
+    return figure_path
+
+
+def pending(directory):
+    """Contours files in `directory` whose figure is missing or older than they are."""
+    paths = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(CONTOURS_SUFFIX):
+                continue
+            figure_path = entry.path[:-len(CONTOURS_SUFFIX)] + FIGURE_SUFFIX
+            if not os.path.exists(figure_path) or os.path.getmtime(figure_path) < entry.stat().st_mtime:
+                paths.append(entry.path)
+    return sorted(paths)
+
+
+def plot_all(directory, processes=None):
+    """Plots every pending session in `directory` in a process pool; returns the number of figures written."""
+    paths = pending(directory)
+    if not paths:
+        return 0
+    with ProcessPoolExecutor(processes) as pool:
+        return sum(1 for _ in pool.map(plot_contours, paths, chunksize=8))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('save_location', help='The app\'s save_location.')
+    parser.add_argument('env', help='Environment whose sessions are plotted (e.g. production).')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    count = plot_all(os.path.join(args.save_location, args.env), args.processes)
+    print('%d comparison figures written' % count)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
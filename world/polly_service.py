@@ -0,0 +1,190 @@
+"""Long-lived Polly synthesis service shared by everything in a process.
+
+One connection-pooled boto3 client is built per process (instead of a client
+and an unused S3 resource per request). Calls go through a token bucket sized
+to the account's Polly TPS quota and a bounded number of concurrent requests;
+waiting requests are admitted by priority, so live worker requests overtake
+batch re-synthesis queued in the same process. Voice metadata is cached for
+`voices_ttl` seconds.
+
+The limits are per process: with N synthesizing processes, set `rate` to
+roughly quota / N. So is the priority lane: LIVE requests only overtake BATCH
+requests waiting in the same process. A batch run in its own processes (see
+world.batch) does not yield to the live analysis workers; the two only share
+the account quota if their rates add up to no more than it.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from world.aws_code_examples.polly_wrapper import PollyWrapper
+
+LIVE = 0
+BATCH = 1
+
+REGION = 'us-east-1'
+# Polly's default SynthesizeSpeech quota is 8 TPS for standard voices
+DEFAULT_RATE = 8.0
+DEFAULT_MAX_CONCURRENCY = 4
+VOICES_TTL = 3600.0
+
+
+def make_client(region=REGION, max_pool_connections=DEFAULT_MAX_CONCURRENCY):
+    """A Polly client with a connection pool large enough for `max_pool_connections` concurrent calls."""
+    import boto3
+    from botocore.config import Config
+
+    config = Config(max_pool_connections=max_pool_connections, retries={'max_attempts': 5, 'mode': 'adaptive'})
+    return boto3.client('polly', region_name=region, config=config)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PriorityGate:
+    """At most `limit` holders at a time; waiters are admitted lowest priority value first, then FIFO."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority=LIVE):
+        with self._condition:
+            ticket = (priority, next(self._order))
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or self.active >= self.limit:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self.active += 1
+            self._condition.notify_all()
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def waiting(self):
+        with self._condition:
+            return len(self._waiting)
+
+
+class PollyService:
+    """Rate-limited, prioritised access to one shared PollyWrapper."""
+
+    def __init__(self, client=None, rate=DEFAULT_RATE, burst=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 voices_ttl=VOICES_TTL, default_priority=LIVE):
+        self.client = client if client is not None else make_client(max_pool_connections=max_concurrency)
+        self.wrapper = PollyWrapper(self.client, None)
+        self.bucket = TokenBucket(rate, burst)
+        self.gate = PriorityGate(max_concurrency)
+        self.voices_ttl = voices_ttl
+        self.default_priority = default_priority
+        self._voices_fetched = None
+        self._voices_lock = threading.Lock()
+
+    def _call(self, priority, function, *args, **kwargs):
+        self.gate.acquire(self.default_priority if priority is None else priority)
+        try:
+            self.bucket.acquire()
+            return function(*args, **kwargs)
+        finally:
+            self.gate.release()
+
+    @staticmethod
+    def _request(text, engine, voice, output_format, lang_code=None):
+        kwargs = {
+            'Engine': engine,
+            'OutputFormat': output_format,
+            'Text': text,
+            'TextType': 'ssml',
+            'VoiceId': voice}
+        if lang_code is not None:
+            kwargs['LanguageCode'] = lang_code
+        return kwargs
+
+    def synthesize(self, text, engine, voice, audio_format, lang_code=None, sample_rate=None, priority=None):
+        """Synthesizes SSML and returns the audio bytes (None if Polly returned no audio stream).
+
+        For the 'pcm' format Polly returns raw 16-bit signed little-endian mono
+        samples at `sample_rate` Hz. This is the audio request of
+        `PollyWrapper.synthesize`, which has no sample rate parameter.
+        """
+        kwargs = self._request(text, engine, voice, audio_format, lang_code)
+        if sample_rate is not None:
+            kwargs['SampleRate'] = str(sample_rate)
+        audio_stream = self._call(priority, self.client.synthesize_speech, **kwargs).get('AudioStream')
+        return None if audio_stream is None else audio_stream.read()
+
+    def speech_marks(self, text, engine, voice, mark_types=('word', 'sentence'), lang_code=None, priority=None):
+        """Speech marks for SSML as Polly returns them: JSON lines with 'time' (ms), 'type', 'start', 'end', 'value'.
+
+        This is the speech-marks request `PollyWrapper.synthesize` makes for
+        visemes, without the audio request in front of it.
+        """
+        kwargs = self._request(text, engine, voice, 'json', lang_code)
+        kwargs['SpeechMarkTypes'] = list(mark_types)
+        response = self._call(priority, self.client.synthesize_speech, **kwargs)
+        return response['AudioStream'].read()
+
+    def describe_voices(self):
+        """Voice metadata, fetched from Polly at most once every `voices_ttl` seconds."""
+        with self._voices_lock:
+            if self._voices_fetched is None or time.monotonic() - self._voices_fetched > self.voices_ttl:
+                self._call(BATCH, self.wrapper.describe_voices)
+                self._voices_fetched = time.monotonic()
+            return self.wrapper.voice_metadata
+
+    def get_voices(self, engine, language_code):
+        """{name: id} of the voices available for an engine and language (from the cached metadata)."""
+        self.describe_voices()
+        return self.wrapper.get_voices(engine, language_code)
+
+
+_service = None
+_service_pid = None
+_service_options = {}
+
+
+def configure(**options):
+    """Sets the PollyService options (rate, burst, max_concurrency, ...) used by `get_service`."""
+    global _service
+    _service_options.update(options)
+    _service = None
+
+
+def get_service():
+    """The process-wide PollyService (rebuilt after a fork, since boto3 clients are not fork-safe)."""
+    global _service, _service_pid
+    if _service is None or _service_pid != os.getpid():
+        _service = PollyService(**_service_options)
+        _service_pid = os.getpid()
+    return _service
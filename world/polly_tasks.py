@@ -0,0 +1,236 @@
+"""Asynchronous Polly synthesis tasks: submit many, poll them together, stream results to disk.
+
+`run_tasks` starts every requested task at once, polls all unfinished tasks
+from a single loop with per-task exponential backoff, and copies each output
+from S3 to its file in chunks as soon as that task completes (instead of one
+task at a time, 5 s sleeps between status checks and the whole output read
+into memory, as the upstream `PollyWrapper` example did).
+
+The boto3 clients are passed in, so the same code runs against Polly/S3, a
+local endpoint (see `make_clients(endpoint_url=...)`) or the in-process
+stand-ins in world.local_polly. boto3 calls block, so they run in the event
+loop's default thread pool. `do_synthesis_task` is the upstream
+`PollyWrapper.do_synthesis_task` (speech plus optional visemes) on top of
+this, with both tasks polled side by side.
+
+    results = synthesize_tasks([TaskRequest(ssml, 'out/1.pcm'), ...], polly, s3, 'my-bucket')
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+COMPLETED = 'completed'
+FAILED = 'failed'
+TERMINAL_STATUSES = (COMPLETED, FAILED)
+# a start or download call that raised (see run_tasks)
+ERROR = 'error'
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class TaskRequest:
+    """One StartSpeechSynthesisTask call and the file its output is written to."""
+
+    def __init__(self, text, output_path, engine='standard', voice='Joanna', audio_format='pcm',
+                 sample_rate=None, text_type='ssml', speech_mark_types=None, lang_code=None):
+        self.text = text
+        self.output_path = output_path
+        self.engine = engine
+        self.voice = voice
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.text_type = text_type
+        self.speech_mark_types = speech_mark_types
+        self.lang_code = lang_code
+
+    def task_kwargs(self, bucket, key_prefix=None):
+        kwargs = {
+            'Engine': self.engine,
+            'OutputFormat': self.audio_format,
+            'OutputS3BucketName': bucket,
+            'Text': self.text,
+            'TextType': self.text_type,
+            'VoiceId': self.voice}
+        if self.sample_rate is not None:
+            kwargs['SampleRate'] = str(self.sample_rate)
+        if self.speech_mark_types:
+            kwargs['SpeechMarkTypes'] = list(self.speech_mark_types)
+        if self.lang_code is not None:
+            kwargs['LanguageCode'] = self.lang_code
+        if key_prefix:
+            kwargs['OutputS3KeyPrefix'] = key_prefix
+        return kwargs
+
+
+def make_clients(region='us-east-1', endpoint_url=None):
+    """Polly and S3 clients; `endpoint_url` points both at a local stand-in instead of AWS."""
+    import boto3
+
+    return (boto3.client('polly', region_name=region, endpoint_url=endpoint_url),
+            boto3.client('s3', region_name=region, endpoint_url=endpoint_url))
+
+
+def output_key(output_uri, bucket):
+    """S3 key of a task's OutputUri (https://s3.<region>.amazonaws.com/<bucket>/<key>)."""
+    marker = '/' + bucket + '/'
+    if marker in output_uri:
+        return output_uri.split(marker, 1)[1]
+    return output_uri.split('/')[-1]
+
+
+def _download(s3_client, bucket, key, path, delete=True):
+    """Copies an S3 object to `path` in chunks (written to a temp file, then renamed)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.part'
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        with open(tmp_path, 'wb') as output_file:
+            for chunk in iter(lambda: body.read(DOWNLOAD_CHUNK_BYTES), b''):
+                output_file.write(chunk)
+    finally:
+        body.close()
+    os.replace(tmp_path, path)
+    if delete:
+        s3_client.delete_object(Bucket=bucket, Key=key)
+    return os.path.getsize(path)
+
+
+async def run_tasks(requests, polly_client, s3_client, bucket, key_prefix=None, initial_delay=1.0, max_delay=30.0,
+                    backoff=2.0, timeout=900.0, delete_outputs=True, on_status=None):
+    """Runs every request as a Polly synthesis task; returns one result dict per request, in order.
+
+    Each result has 'task_id', 'status' ('completed', 'failed', 'error' or
+    'timeout'), 'path' and, for completed tasks, 'bytes'; failed tasks carry
+    Polly's 'reason'. Errors stay with their task: a start or download that
+    raises (e.g. a ThrottlingException) gives that task status 'error' and
+    the exception in 'error', and a status check that raises is retried with
+    the task's backoff (its last exception is in 'error' until one succeeds),
+    so every task that did start is still polled and downloaded.
+    `on_status(index, status)` is called after each status change or check.
+    """
+    loop = asyncio.get_running_loop()
+
+    def call(function, **kwargs):
+        return loop.run_in_executor(None, lambda: function(**kwargs))
+
+    def report(i):
+        if on_status is not None:
+            on_status(i, results[i]['status'])
+
+    started = await asyncio.gather(*[call(polly_client.start_speech_synthesis_task, **request.task_kwargs(bucket, key_prefix))
+                                     for request in requests], return_exceptions=True)
+    results = []
+    for request, response in zip(requests, started):
+        if isinstance(response, Exception):
+            logger.warning("Couldn't start a synthesis task for %s: %r", request.output_path, response)
+            results.append({'task_id': None, 'status': ERROR, 'path': request.output_path, 'error': repr(response)})
+        else:
+            results.append({'task_id': response['SynthesisTask']['TaskId'], 'status': response['SynthesisTask']['TaskStatus'],
+                            'path': request.output_path})
+    for i in range(len(results)):
+        report(i)
+    logger.info("Started %d of %d synthesis tasks.", sum(result['status'] != ERROR for result in results), len(results))
+
+    # index -> (time of next status check, current backoff delay)
+    now = time.monotonic()
+    pending = {i: (now + initial_delay, initial_delay) for i, result in enumerate(results) if result['status'] != ERROR}
+    deadline = now + timeout
+    downloads = []
+
+    async def finish(i, key):
+        try:
+            results[i]['bytes'] = await loop.run_in_executor(
+                None, _download, s3_client, bucket, key, results[i]['path'], delete_outputs)
+        except Exception as e:
+            logger.warning("Couldn't download the output of task %s: %r", results[i]['task_id'], e)
+            results[i]['status'], results[i]['error'] = ERROR, repr(e)
+            report(i)
+        else:
+            logger.info("Downloaded output of task %s to %s.", results[i]['task_id'], results[i]['path'])
+
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            for i in pending:
+                results[i]['status'] = 'timeout'
+                report(i)
+            break
+        next_check = min(check for check, _ in pending.values())
+        if next_check > now:
+            await asyncio.sleep(min(next_check, deadline) - now)
+            continue
+
+        due = [i for i, (check, _) in pending.items() if check <= now]
+        tasks = await asyncio.gather(*[call(polly_client.get_speech_synthesis_task, TaskId=results[i]['task_id']) for i in due],
+                                     return_exceptions=True)
+        now = time.monotonic()
+        for i, response in zip(due, tasks):
+            if isinstance(response, Exception):
+                logger.info("Couldn't check synthesis task %s, retrying: %r", results[i]['task_id'], response)
+                results[i]['error'] = repr(response)
+                delay = min(pending[i][1] * backoff, max_delay)
+                pending[i] = (now + delay, delay)
+                continue
+            results[i].pop('error', None)
+            task = response['SynthesisTask']
+            results[i]['status'] = task['TaskStatus']
+            report(i)
+            if task['TaskStatus'] == COMPLETED:
+                del pending[i]
+                downloads.append(asyncio.ensure_future(finish(i, output_key(task['OutputUri'], bucket))))
+            elif task['TaskStatus'] == FAILED:
+                del pending[i]
+                results[i]['reason'] = task.get('TaskStatusReason')
+                logger.warning("Synthesis task %s failed: %s", results[i]['task_id'], results[i]['reason'])
+            else:
+                delay = min(pending[i][1] * backoff, max_delay)
+                pending[i] = (now + delay, delay)
+
+    await asyncio.gather(*downloads)
+    return results
+
+
+def synthesize_tasks(requests, polly_client, s3_client, bucket, **options):
+    """Blocking wrapper around `run_tasks` for callers outside an event loop."""
+    return asyncio.run(run_tasks(requests, polly_client, s3_client, bucket, **options))
+
+
+def do_synthesis_task(text, polly_client, s3_client, bucket, engine='standard', voice='Joanna', audio_format='mp3',
+                      lang_code=None, include_visemes=False, wait_callback=None, timeout=50.0):
+    """Synthesizes plain text with a speech task (and a viseme task); returns (audio stream, visemes or None).
+
+    `wait_callback(task_type, status)` is called with 'speech' or 'viseme'
+    after each status check, as in `PollyWrapper.do_synthesis_task`.
+    Raises RuntimeError if a task could not be started, failed, or did not
+    finish within `timeout` seconds.
+    """
+    requests = [TaskRequest(text, None, engine, voice, audio_format, text_type='text', lang_code=lang_code)]
+    if include_visemes:
+        requests.append(TaskRequest(text, None, engine, voice, 'json', text_type='text', speech_mark_types=['viseme'],
+                                    lang_code=lang_code))
+    task_types = ['speech', 'viseme']
+    on_status = None if wait_callback is None else lambda i, status: wait_callback(task_types[i], status)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for task_type, request in zip(task_types, requests):
+            request.output_path = os.path.join(directory, task_type)
+        results = synthesize_tasks(requests, polly_client, s3_client, bucket, initial_delay=1.0, max_delay=5.0,
+                                   timeout=timeout, on_status=on_status)
+        for task_type, result in zip(task_types, results):
+            if result['status'] != COMPLETED:
+                raise RuntimeError("Couldn't synthesize %s: task %s ended %s (%s)" % (
+                    task_type, result['task_id'], result['status'], result.get('error') or result.get('reason')))
+        with open(results[0]['path'], 'rb') as speech_file:
+            audio_stream = io.BytesIO(speech_file.read())
+        visemes = None
+        if include_visemes:
+            with open(results[1]['path'], 'rb') as viseme_file:
+                visemes = [json.loads(line) for line in viseme_file.read().decode().split() if line]
+    return audio_stream, visemes
@@ -0,0 +1,215 @@
+"""Vectorized per-word pitch and volume aggregation.
+
+Given a recording's F0 contour (or loudness gradient) and the syllable count of
+every word in the bot response, these compute all per-word values in a few
+array operations instead of a Python loop over frames and words. The results
+are bit-for-bit identical to the original loop implementation: segment means
+are taken over same-length windows with `np.mean`, which sums each word's
+frames in exactly the order `np.average` did.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def percent_change_contour(f0):
+    """Percent change of every voiced frame from the mean voiced F0."""
+    f0 = np.asarray(f0)
+    voiced = f0[f0 > 0]
+    mean_f0 = np.mean(voiced)
+    return ((voiced - mean_f0) / ((voiced + mean_f0) / 2)) * 100
+
+
+def word_boundaries(n_frames, syllable_counts):
+    """Start/end frame of every word, spreading `n_frames` evenly over the syllables."""
+    syllable_counts = np.asarray(syllable_counts)
+    frames_per_syllable = n_frames / np.sum(syllable_counts)
+    lengths = (syllable_counts * frames_per_syllable).astype(int)
+    ends = np.cumsum(lengths)
+    return ends - lengths, ends
+
+
+def segment_means(values, starts, ends):
+    """Mean of `values[start:end]` for every segment (NaN for empty segments).
+
+    Segments are grouped by length so each group is one windowed `np.mean`.
+    """
+    values = np.asarray(values)
+    starts = np.asarray(starts)
+    lengths = np.asarray(ends) - starts
+    # keep float32 inputs (librosa loudness) in float32, as np.mean does
+    means = np.full(len(starts), np.nan, dtype=np.result_type(values.dtype, np.float16))
+    for length in np.unique(lengths):
+        if length <= 0:
+            continue
+        selected = lengths == length
+        means[selected] = np.mean(sliding_window_view(values, length)[starts[selected]], axis=1)
+    return means
+
+
+def word_pitch_values(f0, syllable_counts, entrain=True):
+    """Rounded mean percent F0 change for every word; negated when disentraining."""
+    return batch_word_pitch_values([f0], [syllable_counts], entrain)[0]
+
+
+def batch_word_pitch_values(f0_contours, syllable_counts, entrain=True):
+    """`word_pitch_values` for many recordings at once.
+
+    The percent-change contours of all recordings are stacked end to end and
+    every word of every recording is averaged in the same grouped pass.
+    """
+    contours = [percent_change_contour(f0) for f0 in f0_contours]
+    offsets = np.cumsum([0] + [len(contour) for contour in contours])
+    starts, ends, splits = [], [], [0]
+    for contour, counts, offset in zip(contours, syllable_counts, offsets):
+        word_starts, word_ends = word_boundaries(len(contour), counts)
+        starts.append(word_starts + offset)
+        ends.append(word_ends + offset)
+        splits.append(splits[-1] + len(word_starts))
+    means = segment_means(np.concatenate(contours), np.concatenate(starts), np.concatenate(ends))
+    values = np.round(means if entrain else -means, 0)
+    return [values[splits[i]:splits[i + 1]] for i in range(len(contours))]
+
+
+def volume_gradient(amplitude_db, total_syllables, entrain=True):
+    """Linear per-syllable loudness ramp between the two half-recording means."""
+    length = len(amplitude_db)
+    average_first_half = np.mean(np.abs(amplitude_db[:length // 2]))
+    average_second_half = np.mean(np.abs(amplitude_db[length // 2:]))
+    difference = average_second_half - average_first_half
+    if entrain:
+        return np.linspace(average_second_half - difference, average_second_half, total_syllables)
+    return np.linspace(average_first_half, average_first_half - difference, total_syllables)
+
+
+def normalize_db_values(db_values, target_min_db, target_max_db):
+    """Linearly maps loudness values onto [target_min_db, target_max_db]."""
+    db_min = np.min(db_values)
+    db_max = np.max(db_values)
+    normalized_db_values = (db_values - db_min) / (db_max - db_min)
+    normalized_db_values = (normalized_db_values * (target_max_db - target_min_db)) + target_min_db
+    return normalized_db_values
+
+
+def custom_db(amplitudes, prev_amplitudes):
+    """Vectorized `amplitude_to_custom_db`: dB change from the previous amplitude, never exactly 0."""
+    amplitudes = np.asarray(amplitudes)
+    prev_amplitudes = np.where(prev_amplitudes == 0, amplitudes, prev_amplitudes)
+    result = np.round(20 * np.log10(np.abs(amplitudes / prev_amplitudes) + 1e-9), 6)
+    return np.where(result == 0, np.float64(0.000001), result)
+
+
+def word_volume_values(gradient, syllable_counts, chained=True):
+    """dB volume change for every word along a per-syllable loudness gradient.
+
+    With `chained`, each word is compared to the previous word's mean (as the
+    combined conditions do). Otherwise the reference is the mean of the next
+    word's frames taken with the current word's syllable count, which is what
+    the single-feature volume conditions have always used.
+    """
+    syllable_counts = np.asarray(syllable_counts)
+    ends = np.cumsum(syllable_counts)
+    starts = ends - syllable_counts
+    means = segment_means(gradient, starts, ends)
+    if chained:
+        references = means[:-1]
+    else:
+        references = segment_means(gradient, ends[:-1], np.minimum(ends[:-1] + syllable_counts[:-1], len(gradient)))
+    return custom_db(means, np.concatenate([np.zeros(1, dtype=means.dtype), references]))
+
+
+def pitch_tag(value):
+    """SSML pitch attribute value, e.g. '+3.0%'."""
+    return ('+' + str(value) if value > 0 else str(value)) + '%'
+
+
+def volume_tag(value):
+    """SSML volume attribute value, e.g. '+1.250000dB'."""
+    return ('+' + '{:.6f}'.format(value) if value >= 0 else '{:.6f}'.format(value)) + 'dB'
+
+
+# SynthesizeSpeech limits: 6000 characters of SSML, of which at most 3000 are billed (text outside tags)
+MAX_SSML_CHARS = 6000
+MAX_BILLED_CHARS = 3000
+SENTENCE_ENDS = ('.', '!', '?')
+
+
+def prosody_element(word, pitch_value=None, volume_value=None):
+    """One word wrapped in its `<prosody>` tag."""
+    attributes = []
+    if pitch_value is not None:
+        attributes.append('pitch="' + pitch_tag(pitch_value) + '"')
+    if volume_value is not None:
+        attributes.append('volume="' + volume_tag(volume_value) + '"')
+    return '<prosody ' + ' '.join(attributes) + '>' + word + '</prosody>'
+
+
+def _elements(words, pitch_values, volume_values):
+    return [prosody_element(word,
+                            None if pitch_values is None else pitch_values[i],
+                            None if volume_values is None else volume_values[i])
+            for i, word in enumerate(words)]
+
+
+def build_ssml(words, pitch_values=None, volume_values=None):
+    """`<speak>` document with every word wrapped in its prosody tag."""
+    return '<speak>' + ''.join(_elements(words, pitch_values, volume_values)) + '</speak>'
+
+
+def sentence_ranges(words):
+    """(start, end) word index range of every sentence."""
+    ranges = []
+    start = 0
+    for i, word in enumerate(words):
+        if word.rstrip('"\')').endswith(SENTENCE_ENDS):
+            ranges.append((start, i + 1))
+            start = i + 1
+    if start < len(words):
+        ranges.append((start, len(words)))
+    return ranges
+
+
+def chunk_ranges(words, elements, max_chars=MAX_SSML_CHARS, max_billed_chars=MAX_BILLED_CHARS):
+    """Word ranges of SSML documents that each fit Polly's limits.
+
+    Whole sentences are packed greedily; a sentence too long on its own is split
+    between words, so every word keeps its own prosody tag.
+    """
+    budget = max_chars - len('<speak></speak>')
+
+    def fits(start, end):
+        return (sum(len(element) for element in elements[start:end]) <= budget
+                and sum(len(word) for word in words[start:end]) <= max_billed_chars)
+
+    units = []
+    for start, end in sentence_ranges(words):
+        if fits(start, end):
+            units.append((start, end))
+            continue
+        for i in range(start, end):
+            if not fits(i, i + 1):
+                raise ValueError('Word %d (%r) does not fit in one SynthesizeSpeech request.' % (i, words[i]))
+        units.extend((i, i + 1) for i in range(start, end))
+
+    ranges = []
+    for start, end in units:
+        if ranges and fits(ranges[-1][0], end):
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def build_plain_ssml_chunks(words, max_chars=MAX_SSML_CHARS, max_billed_chars=MAX_BILLED_CHARS):
+    """The words without prosody tags, split into `<speak>` documents at the same kind of boundaries."""
+    return ['<speak>' + ' '.join(words[start:end]) + '</speak>'
+            for start, end in chunk_ranges(words, [word + ' ' for word in words], max_chars, max_billed_chars)]
+
+
+def build_ssml_chunks(words, pitch_values=None, volume_values=None, max_chars=MAX_SSML_CHARS, max_billed_chars=MAX_BILLED_CHARS):
+    """`build_ssml`, split into as few `<speak>` documents as Polly's request limits allow.
+
+    A response that fits in one request gives exactly `[build_ssml(...)]`.
+    """
+    elements = _elements(words, pitch_values, volume_values)
+    return ['<speak>' + ''.join(elements[start:end]) + '</speak>'
+            for start, end in chunk_ranges(words, elements, max_chars, max_billed_chars)]
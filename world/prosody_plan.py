@@ -0,0 +1,110 @@
+"""Per-word prosody values of every entrainment condition, from one feature extraction.
+
+A `ProsodyPlan` is built once per recording (one F0 contour, one loudness
+envelope, the response's compiled text plan) and holds the per-word pitch and
+volume values of both directions. Any subset of the nine conditions then
+renders to SSML without touching the recording again, so pre-rendering every
+arm costs about as much as rendering one.
+
+The values reproduce the original per-condition code exactly, quirks included:
+
+- single-feature volume conditions normalize loudness to 55-65 dB and take each
+  word's change against the next word's reference; combined conditions use
+  25-100 dB and chain the references word by word;
+- combined conditions with disentrained pitch used to negate the waveform
+  (2*mean - x) before Harvest, which leaves F0 unchanged, so those arms carry
+  the entrained pitch values.
+"""
+from world import features as feature_store
+from world import prosody
+from world import text_plan
+from world.audio import as_asset
+
+PITCH_FEATURES = {'entrain-pitch': True, 'disentrain-pitch': False}
+VOLUME_FEATURES = {'entrain-volume': True, 'disentrain-volume': False}
+
+# the nine arms, as they are assigned to workers
+CONDITIONS = (
+    ('entrain-pitch', 'entrain-volume'),
+    ('entrain-pitch', 'disentrain-volume'),
+    ('entrain-pitch',),
+    ('disentrain-pitch', 'entrain-volume'),
+    ('disentrain-pitch', 'disentrain-volume'),
+    ('disentrain-pitch',),
+    ('entrain-volume',),
+    ('disentrain-volume',),
+    (),
+)
+
+SINGLE_VOLUME_RANGE = (55, 65)
+COMBINED_VOLUME_RANGE = (25, 100)
+
+
+def condition_name(features):
+    """File-name friendly name of a condition, e.g. 'entrain-pitch+disentrain-volume' ('plain' for none)."""
+    return '+'.join(features) or 'plain'
+
+
+def directions(features):
+    """(entrain pitch?, entrain volume?) of a feature list; None where the feature is absent.
+
+    When a list names both directions of a feature, entrain wins, as in the
+    original condition dispatch.
+    """
+    pitch = next((PITCH_FEATURES[name] for name in PITCH_FEATURES if name in features), None)
+    volume = next((VOLUME_FEATURES[name] for name in VOLUME_FEATURES if name in features), None)
+    return pitch, volume
+
+
+class ProsodyPlan:
+    """Per-word pitch (%) and volume (dB) values of every condition for one recording and response."""
+
+    def __init__(self, response, words, syllable_counts, f0, loudness_db):
+        self.response = response
+        self.words = words
+        self.syllable_counts = syllable_counts
+        self.f0 = f0
+        self.pitch = {entrain: prosody.word_pitch_values(f0, syllable_counts, entrain) for entrain in (True, False)}
+        self.single_volume = self._volume_values(loudness_db, SINGLE_VOLUME_RANGE, chained=False)
+        self.combined_volume = self._volume_values(loudness_db, COMBINED_VOLUME_RANGE, chained=True)
+
+    def _volume_values(self, loudness_db, db_range, chained):
+        normalized = prosody.normalize_db_values(loudness_db, *db_range)
+        total = sum(self.syllable_counts)
+        return {entrain: prosody.word_volume_values(prosody.volume_gradient(normalized, total, entrain), self.syllable_counts, chained)
+                for entrain in (True, False)}
+
+    @classmethod
+    def from_recording(cls, response, audio, frame_period=5.0, f0_profile=None):
+        """Extracts the recording's features once (through the feature store) and plans every condition."""
+        audio = as_asset(audio)
+        words, syllable_counts = text_plan.syllabify(response)
+        f0 = feature_store.extract_f0(audio.data, audio.samplerate, frame_period=frame_period, f0_floor=80.0, f0_ceil=270,
+                                      profile=f0_profile)
+        return cls(response, words, syllable_counts, f0, feature_store.loudness_db(audio))
+
+    def values(self, features):
+        """(words, pitch values or None, volume values or None) of a condition; None for an unknown feature list."""
+        entrain_pitch, entrain_volume = directions(features)
+        if entrain_pitch is not None and entrain_volume is not None:
+            # combined conditions: the 'disentrained' pitch was never actually flipped (see module docstring)
+            return self.words[:len(self.syllable_counts)], self.pitch[True], self.combined_volume[entrain_volume]
+        if entrain_pitch is not None:
+            return self.words, self.pitch[entrain_pitch], None
+        if entrain_volume is not None:
+            return self.words, None, self.single_volume[entrain_volume]
+        return None
+
+    def ssml(self, features):
+        """SSML chunks of one condition (see prosody.build_ssml_chunks); the plain response for no features."""
+        if not features:
+            return ['<speak>' + self.response + '</speak>']
+        planned = self.values(features)
+        if planned is None:
+            return None
+        words, pitch_values, volume_values = planned
+        return prosody.build_ssml_chunks(words, pitch_values, volume_values)
+
+    def render_ssml(self, conditions=CONDITIONS):
+        """{condition name: SSML chunks} of every requested condition."""
+        return {condition_name(features): self.ssml(features) for features in conditions}
@@ -0,0 +1,77 @@
+"""Local WORLD-vocoder resynthesis of the bot response.
+
+Instead of sending every worker's prosody SSML to Polly, the plain response is
+synthesized once, decomposed into WORLD parameters (Harvest F0, CheapTrick
+spectral envelope, D4C aperiodicity; cached in the feature store), and each
+worker's per-word pitch percentages and volume offsets are applied to those
+parameters before `pw.synthesize`. Entrainment is then a local, CPU-bound
+step that scales with cores rather than with Polly quotas.
+"""
+import numpy as np
+import pyworld as pw
+
+from world import features as feature_store
+from world import prosody
+
+
+def decompose(x, fs, frame_period=5.0, f0_floor=80.0, f0_ceil=270.0, store=None):
+    """WORLD parameters (f0, sp, ap) of a signal, served from the feature store when already computed."""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    store = store or feature_store.get_store()
+
+    def compute():
+        f0, t = pw.harvest(x, fs, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=frame_period)
+        return {'f0': f0, 'sp': pw.cheaptrick(x, f0, t, fs), 'ap': pw.d4c(x, f0, t, fs)}
+
+    key = feature_store.feature_key(x, fs, 'world', frame_period=float(frame_period), f0_floor=float(f0_floor), f0_ceil=float(f0_ceil))
+    features = store.get_or_compute(key, compute)
+    return features['f0'], features['sp'], features['ap']
+
+
+def word_frames(n_frames, f0, syllable_counts, spans_ms=None, frame_period=5.0):
+    """Start/end frame of every word in the plain voice.
+
+    From speech-mark spans (ms) when available; otherwise the words are spread
+    over the voiced stretch by syllable count, as for the worker recordings.
+    """
+    if spans_ms is not None:
+        starts, ends = spans_ms
+        starts = np.clip(np.round(np.asarray(starts) / frame_period).astype(int), 0, n_frames)
+        ends = np.clip(np.round(np.asarray(ends) / frame_period).astype(int), 0, n_frames)
+        return starts, np.maximum(ends, starts)
+    voiced = np.flatnonzero(f0 > 0)
+    first, last = (voiced[0], voiced[-1] + 1) if len(voiced) else (0, n_frames)
+    starts, ends = prosody.word_boundaries(last - first, syllable_counts)
+    starts, ends = starts + first, ends + first
+    # the first and last words own the leading and trailing silence
+    starts[0], ends[-1] = 0, n_frames
+    return starts, ends
+
+
+def apply_prosody(f0, sp, starts, ends, pitch_values=None, volume_values=None):
+    """Copies of f0/sp with every word's pitch scaled by its percentage and its power by its dB offset."""
+    f0 = f0.copy()
+    sp = sp.copy()
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if pitch_values is not None:
+            f0[start:end] *= 1 + np.nan_to_num(pitch_values[i]) / 100.0
+        if volume_values is not None:
+            sp[start:end] *= 10 ** (np.nan_to_num(volume_values[i]) / 10.0)
+    return f0, sp
+
+
+def resynthesize(x, fs, syllable_counts, pitch_values=None, volume_values=None, spans_ms=None, frame_period=5.0):
+    """The plain voice `x` re-rendered with per-word pitch (%) and volume (dB) offsets; float samples at `fs`."""
+    f0, sp, ap = decompose(x, fs, frame_period)
+    starts, ends = word_frames(len(f0), f0, syllable_counts, spans_ms, frame_period)
+    f0, sp = apply_prosody(f0, sp, starts, ends, pitch_values, volume_values)
+    y = pw.synthesize(f0, sp, ap, fs, frame_period)
+    # WORLD output is not normalised; only scale down if the volume offsets pushed it past full scale
+    peak = np.max(np.abs(y)) if len(y) else 0.0
+    return y / peak * 0.99 if peak > 0.99 else y
+
+
+def to_pcm(y, sample_width=2):
+    """Float samples in [-1, 1] as little-endian signed PCM bytes."""
+    scale = 2 ** (8 * sample_width - 1) - 1
+    return np.round(np.clip(y, -1, 1) * scale).astype('<i%d' % sample_width).tobytes()
@@ -0,0 +1,64 @@
+"""Per-word timing of synthesized speech from Polly speech marks.
+
+Polly's 'word' speech marks give the start time of every word it spoke. With
+the marks of the entrained synthesis and of the plain (unmodified) voice, the
+bot's F0 contour can be built without analysing the synthesized audio: each
+word's stretch of the plain voice's contour (extracted once per response and
+cached) is time-stretched onto the word's span in the entrained speech and
+shifted by the word's pitch percentage, as the `<prosody pitch>` tag did.
+"""
+import json
+
+import numpy as np
+
+
+def parse_marks(data, mark_type=None):
+    """Speech marks from Polly's JSON-lines output, optionally only those of one type."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    marks = [json.loads(line) for line in data.splitlines() if line.strip()]
+    if mark_type is not None:
+        marks = [mark for mark in marks if mark['type'] == mark_type]
+    return marks
+
+
+def join_marks(chunk_marks, chunk_durations_ms):
+    """Marks of consecutively concatenated chunks, with times shifted to the joined audio."""
+    marks = []
+    offset = 0.0
+    for chunk, duration in zip(chunk_marks, chunk_durations_ms):
+        marks.extend(dict(mark, time=mark['time'] + offset) for mark in chunk)
+        offset += duration
+    return marks
+
+
+def word_spans(word_marks, duration_ms):
+    """(start, end) time in ms of every word: from its mark to the next word's mark (or the end of the audio)."""
+    starts = np.array([mark['time'] for mark in word_marks], dtype=float)
+    ends = np.append(starts[1:], max(duration_ms, starts[-1] if len(starts) else 0.0))
+    return starts, ends
+
+
+def spans_to_frames(starts_ms, ends_ms, frame_period, n_frames):
+    starts = np.clip(np.round(starts_ms / frame_period).astype(int), 0, n_frames)
+    ends = np.clip(np.round(ends_ms / frame_period).astype(int), 0, n_frames)
+    return starts, np.maximum(ends, starts)
+
+
+def bot_contour(baseline_f0, baseline_spans, spans, pitch_values, frame_period, n_frames):
+    """Estimated F0 contour of the entrained synthesis from the plain voice's contour.
+
+    `baseline_spans` / `spans` are the (starts, ends) in ms of every word in the
+    plain and entrained speech (see `word_spans`); `pitch_values` are the
+    per-word `<prosody pitch>` percentages. Frames outside any word are unvoiced.
+    """
+    base_starts, base_ends = spans_to_frames(*baseline_spans, frame_period, len(baseline_f0))
+    starts, ends = spans_to_frames(*spans, frame_period, n_frames)
+    contour = np.zeros(n_frames)
+    for base_start, base_end, start, end, value in zip(base_starts, base_ends, starts, ends, pitch_values):
+        if end == start or base_end == base_start:
+            continue
+        # nearest-neighbour time stretch keeps unvoiced frames unvoiced
+        source = base_start + ((np.arange(end - start) + 0.5) * (base_end - base_start) / (end - start)).astype(int)
+        contour[start:end] = baseline_f0[source] * (1 + np.nan_to_num(value) / 100.0)
+    return contour
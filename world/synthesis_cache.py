@@ -0,0 +1,195 @@
+"""On-disk cache of synthesized speech, keyed by everything that determines the audio.
+
+Identical SSML (e.g. the plain `<speak>...</speak>` response every worker in the
+no-feature arm gets) is only sent to Polly once. Entries are evicted least
+recently used first once the cache grows past `max_bytes`, and a per-key file
+lock coalesces concurrent identical requests from different processes: the
+first one synthesizes, the others wait and then read its result. Each process
+tracks the cache size as it writes and only scans the directory when that
+estimate passes `max_bytes`, or every `RESCAN_EVERY` writes to pick up what
+other processes added.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+SYNTHESIS_CACHE_BYTES_ENV = 'PEF_SYNTHESIS_CACHE_BYTES'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# writes between full scans of the cache directory
+RESCAN_EVERY = 64
+
+
+def synthesis_key(ssml, voice, engine, audio_format, sample_rate=None):
+    """Hash of the SSML and every Polly parameter that changes the audio."""
+    params = [ssml, voice, engine, audio_format, None if sample_rate is None else int(sample_rate)]
+    return hashlib.sha256(json.dumps(params).encode('utf-8')).hexdigest()
+
+
+class SynthesisCache:
+    """Size-bounded LRU directory of synthesized audio, shared by every process using `root`."""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # counters for this process, shared by its threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        # estimated bytes on disk (None until the first scan) and writes since the last scan
+        self._size = None
+        self._writes = 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.audio')
+
+    def get(self, key):
+        """Returns the cached audio bytes for `key` (marking it recently used), or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as audio_file:
+                audio = audio_file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return audio
+
+    def put(self, key, audio):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        # write then rename, so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(audio)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._writes += 1
+            rescan = self._size is None or self._writes >= RESCAN_EVERY
+            if not rescan:
+                self._size += len(audio) - replaced
+        if rescan or self._size > self.max_bytes:
+            self.evict()
+
+    def get_or_synthesize(self, key, synthesize):
+        """Cached audio for `key`; on a miss, `synthesize()` is called once across all processes.
+
+        `synthesize` returns the audio bytes, or None (which is not cached).
+        """
+        audio = self.get(key)
+        if audio is not None:
+            with self._lock:
+                self.hits += 1
+            return audio
+
+        lock_path = self._path(key) + '.lock'
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # another process may have synthesized it while we waited for the lock
+                audio = self.get(key)
+                if audio is not None:
+                    with self._lock:
+                        self.coalesced += 1
+                        self.hits += 1
+                    return audio
+                with self._lock:
+                    self.misses += 1
+                audio = synthesize()
+                if audio is not None:
+                    self.put(key, audio)
+                return audio
+            finally:
+                # the entry (if any) is in place before the lock file goes, so late waiters still hit;
+                # a failed synthesize() leaves no lock file behind either
+                try:
+                    os.unlink(lock_path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def entries(self):
+        """(mtime, size, path) of every cached file."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.audio'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in `max_bytes`."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._size = total
+            self._writes = 0
+            self.evictions += evicted
+
+    def counters(self):
+        """Hit/miss counters of this process and its running size estimate; cheap, does not touch the disk."""
+        with self._lock:
+            hits, misses, coalesced, evictions, size = self.hits, self.misses, self.coalesced, self.evictions, self._size
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'coalesced': coalesced,
+            'evictions': evictions,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'tracked_bytes': size,
+        }
+
+    def stats(self):
+        """`counters()` plus the current size of the shared cache, from a scan of every shard."""
+        entries = self.entries()
+        stats = self.counters()
+        del stats['tracked_bytes']
+        stats.update({
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        })
+        return stats
+
+
+_caches = {}
+
+
+def get_cache(root, max_bytes=None):
+    """Returns the (per-process, shared) cache for `root`."""
+    if root not in _caches:
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(SYNTHESIS_CACHE_BYTES_ENV, DEFAULT_MAX_BYTES))
+        _caches[root] = SynthesisCache(root, max_bytes)
+    return _caches[root]
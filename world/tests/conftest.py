@@ -0,0 +1,5 @@
+"""Offline tests of the analysis package; run with `python -m pytest world/tests` from the repository root."""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
@@ -0,0 +1,44 @@
+import numpy as np
+import soundfile as sf
+
+from world.audio import AudioAsset, as_asset
+
+
+def write_tone(path, fs=16000, seconds=0.5, channels=1):
+    t = np.arange(int(fs * seconds)) / fs
+    x = 0.25 * np.sin(2 * np.pi * 220 * t)
+    sf.write(str(path), np.column_stack([x] * channels) if channels > 1 else x, fs, subtype='PCM_16')
+    return str(path)
+
+
+def test_a_recording_is_decoded_once_and_keeps_its_bytes(tmp_path):
+    path = write_tone(tmp_path / 'tone.wav')
+    audio = AudioAsset.from_file(path)
+    data, fs = sf.read(path)
+    np.testing.assert_array_equal(audio.data, data)
+    assert (audio.samplerate, audio.frames, audio.duration, audio.path) == (fs, len(data), 0.5, path)
+    with open(path, 'rb') as handle:
+        assert audio.file_obj().read() == handle.read()
+    assert as_asset(audio) is audio and as_asset(path).raw == audio.raw
+
+
+def test_pcm_is_wrapped_into_a_wav_that_decodes_to_the_same_samples():
+    from world.audio import pcm_to_wav
+
+    samples = (np.sin(np.arange(1600) / 5) * 20000).astype('<i2')
+    audio = AudioAsset(pcm_to_wav(samples.tobytes(), 16000))
+    assert (audio.samplerate, audio.frames) == (16000, 1600)
+    np.testing.assert_array_equal(np.round(audio.data * 32768).astype('<i2'), samples)
+
+
+def test_pcm_chunks_are_joined_with_short_fades():
+    from world.audio import join_pcm
+
+    chunks = [np.full(800, 10000, dtype='<i2').tobytes(), np.full(800, -10000, dtype='<i2').tobytes()]
+    joined = np.frombuffer(join_pcm(chunks, 16000), dtype='<i2')
+    assert len(joined) == 1600
+    fade = int(0.005 * 16000)
+    assert joined[0] == 10000 and joined[-1] == -10000
+    assert abs(joined[800 - 1]) < 100 and abs(joined[800]) < 100
+    assert np.all(np.diff(joined[800 - fade:800].astype(int)) <= 0)
+    assert join_pcm([chunks[0]], 16000) == chunks[0]
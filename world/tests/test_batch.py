@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+
+import soundfile as sf
+
+from world import batch
+from world.benchmarks.corpus import utterance
+
+
+def options(save_location, **overrides):
+    options = {'save_location': str(save_location), 'env': 'production', 'output_env': 'production-reanalysis',
+               'processes': 1, 'polly_tps': 4.0, 'features': [], 'features_override': False, 'all_conditions': False,
+               'skip_synthesis': True, 'stub_synthesizer': False, 'stub_latency': 0.0, 'stub_throttle_rate': 0.0,
+               'f0_profile': 'fast', 'bot_contour': None, 'synthesis_engine': None, 'plot': False, 'limit': None,
+               'report_every': 10}
+    options.update(overrides)
+    return options
+
+
+def write_recording(directory, session, seconds=1.0):
+    x, _ = utterance(seconds, 16000)
+    sf.write(os.path.join(directory, session + batch.RECORDING_SUFFIX), x, 16000)
+
+
+def test_stored_features_prefers_state_over_jobs_over_config_files(tmp_path):
+    directory = tmp_path / 'production'
+    directory.mkdir()
+    (directory / ('w1_a1' + batch.CONDITION_SUFFIX)).write_text("['entrain-pitch']\n")
+    (directory / ('w2_a2' + batch.CONDITION_SUFFIX)).write_text("['entrain-pitch']\n")
+    (directory / ('w3_a3' + batch.CONDITION_SUFFIX)).write_text("[]\n")
+    with sqlite3.connect(str(directory / 'jobs.sqlite3')) as conn:
+        conn.execute('CREATE TABLE jobs (job_id TEXT, worker_id TEXT, ass_id TEXT, payload TEXT)')
+        conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?)',
+                     ('w2_a2', 'w2', 'a2', json.dumps({'entrainment_features': ['disentrain-volume']})))
+        conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?)',
+                     ('w3_a3', 'w3', 'a3', json.dumps({'entrainment_features': ['disentrain-volume']})))
+    with sqlite3.connect(str(directory / 'state.sqlite3')) as conn:
+        conn.execute('CREATE TABLE assignments (worker_id TEXT, ass_id TEXT, entrainment_features TEXT)')
+        conn.execute('INSERT INTO assignments VALUES (?, ?, ?)', ('w3', 'a3', json.dumps(['entrain-volume'])))
+
+    stored = batch.stored_features(str(tmp_path), 'production')
+    assert stored['w1_a1'] == ('w1', 'a1', ['entrain-pitch'])
+    assert stored['w2_a2'] == ('w2', 'a2', ['disentrain-volume'])
+    assert stored['w3_a3'] == ('w3', 'a3', ['entrain-volume'])
+
+
+def test_audio_duration_of_an_empty_recording_is_zero(tmp_path):
+    empty = tmp_path / 'empty.wav'
+    empty.write_bytes(b'')
+    assert batch.audio_duration(str(empty)) == 0.0
+
+
+def test_run_fails_sessions_without_a_condition_or_readable_audio_and_goes_on(tmp_path):
+    directory = tmp_path / 'production'
+    directory.mkdir()
+    write_recording(str(directory), 'w1_a1')
+    write_recording(str(directory), 'w2_a2')
+    (directory / ('w3_a3' + batch.RECORDING_SUFFIX)).write_bytes(b'')
+    (directory / ('w1_a1' + batch.CONDITION_SUFFIX)).write_text("['entrain-pitch']\n")
+    (directory / ('w3_a3' + batch.CONDITION_SUFFIX)).write_text("['entrain-volume']\n")
+
+    summary = batch.run(options(tmp_path))
+    assert (summary['done'], summary['failed']) == (1, 2)
+    records = batch.read_manifest(str(tmp_path / 'production-reanalysis' / batch.MANIFEST_NAME))
+    assert records['w1_a1']['status'] == batch.DONE and records['w1_a1']['features'] == ['entrain-pitch']
+    assert records['w2_a2']['status'] == batch.FAILED and 'no stored' in records['w2_a2']['error']
+    assert records['w3_a3']['status'] == batch.FAILED and records['w3_a3']['audio_seconds'] == 0.0
+
+    # resuming retries only the failed sessions
+    assert batch.run(options(tmp_path))['sessions'] == 2
+
+
+def crash_on_w2(session, worker_id, ass_id, recording, features, options):
+    if session == 'w2_a2':
+        os._exit(1)
+    return dict(batch.failed_record(session, list(features), None), status=batch.DONE)
+
+
+def test_a_crashed_worker_process_fails_its_sessions_without_aborting_the_run(tmp_path, monkeypatch):
+    directory = tmp_path / 'production'
+    directory.mkdir()
+    for session in ('w1_a1', 'w2_a2'):
+        write_recording(str(directory), session, 0.2)
+        (directory / (session + batch.CONDITION_SUFFIX)).write_text("[]\n")
+    monkeypatch.setattr(batch, 'process_session', crash_on_w2)
+
+    summary = batch.run(options(tmp_path))
+    assert summary['sessions'] == 2 and summary['failed'] >= 1
+    records = batch.read_manifest(str(tmp_path / 'production-reanalysis' / batch.MANIFEST_NAME))
+    assert records['w2_a2']['status'] == batch.FAILED
+
+
+def test_batch_processes_split_the_polly_budget_and_the_cpus(tmp_path, monkeypatch):
+    from world import f0, polly_service
+    from world.local_polly import LocalPollyClient
+
+    monkeypatch.setattr(f0, '_pool_processes', None)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    try:
+        batch.init_worker(options(tmp_path, processes=4, polly_tps=6.0))
+        polly_service.configure(client=LocalPollyClient())
+        service = polly_service.get_service()
+        assert service.bucket.rate == 1.5 and service.default_priority == polly_service.BATCH
+        assert f0._pool_processes == 2
+    finally:
+        polly_service._service_options.clear()
+        polly_service.configure()
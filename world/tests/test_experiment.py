@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pytest
+
+from world import experiment, polly_service, prosody, text_plan
+from world import features as feature_store
+from world.local_polly import LocalPollyClient
+from world.prosody_plan import CONDITIONS, ProsodyPlan, condition_name
+
+
+def test_pcm_speech_is_saved_as_wav_with_its_transcript(tmp_path):
+    os.makedirs(str(tmp_path / 'env'))
+    pcm = (np.sin(np.arange(3200) / 7) * 10000).astype('<i2').tobytes()
+    audio = experiment.save_speech_file(pcm, str(tmp_path), 'env', 'W1', 'A1', '<speak>hi</speak>', 'pcm')
+    assert audio.path == str(tmp_path / 'env' / 'W1_A1_synthesized.wav')
+    assert (audio.samplerate, audio.frames) == (experiment.SYNTHESIS_SAMPLE_RATE, 3200)
+    with open(audio.path, 'rb') as wav_file:
+        assert wav_file.read() == audio.raw
+    assert not os.path.exists(str(tmp_path / 'env' / 'W1_A1_synthesized.mp3'))
+    with open(str(tmp_path / 'env' / 'W1_A1_synthesized_transcript.txt'), encoding='utf-8') as transcript:
+        assert transcript.read() == '<speak>hi</speak>'
+
+
+@pytest.fixture
+def local_polly():
+    client = LocalPollyClient(seed=0)
+    polly_service.configure(client=client, rate=1000.0)
+    try:
+        yield client
+    finally:
+        polly_service._service_options.clear()
+        polly_service.configure()
+
+
+def test_chunked_responses_are_synthesized_and_joined_with_their_marks(tmp_path, local_polly):
+    os.makedirs(str(tmp_path / 'env'))
+    words = ' '.join('Sentence number %d is short.' % i for i in range(12)).split(' ')
+    chunks = prosody.build_ssml_chunks(words, [2.0] * len(words), max_chars=400)
+    assert len(chunks) > 1
+    audio, marks = experiment.synthesize_speech_with_marks(chunks, str(tmp_path), 'env', 'W1', 'A1',
+                                                           speech_mark_types=experiment.SPEECH_MARK_TYPES)
+    parts = [local_polly.synthesize_speech(Text=chunk, TextType='ssml', OutputFormat='pcm', SampleRate='16000',
+                                           VoiceId=experiment.SYNTHESIS_VOICE)['AudioStream'].read() for chunk in chunks]
+    assert audio.frames == sum(len(part) for part in parts) // 2
+    word_marks = [mark for mark in marks if mark['type'] == 'word']
+    assert [mark['value'] for mark in word_marks] == words
+    times = [mark['time'] for mark in word_marks]
+    assert times == sorted(times) and times[-1] < 1000.0 * audio.duration
+
+    # a second synthesis of the same chunks is served from the cache
+    calls = local_polly.calls
+    experiment.synthesize_speech_with_marks(chunks, str(tmp_path), 'env', 'W2', 'A2', speech_mark_types=experiment.SPEECH_MARK_TYPES)
+    assert local_polly.calls == calls
+
+
+def test_chunking_needs_pcm(tmp_path):
+    with pytest.raises(ValueError):
+        experiment.synthesize_speech_with_marks(['<speak>a.</speak>', '<speak>b.</speak>'], str(tmp_path), 'env', 'W1', 'A1',
+                                                audio_format='mp3')
+
+
+def test_the_speech_mark_contour_follows_the_synthesized_pitch(tmp_path, local_polly):
+    os.makedirs(str(tmp_path / 'env'))
+    words = 'I appreciate your comprehensive weather summary today.'.split(' ')
+    pitch_values = np.array([0.0, 10.0, -10.0, 20.0, 0.0, -20.0, 5.0])
+    synthesized, marks = experiment.render_speech(words, str(tmp_path), 'env', 'W1', 'A1', pitch_values,
+                                                  speech_mark_types=experiment.SPEECH_MARK_TYPES)
+    estimated = experiment.estimate_bot_f0(words, pitch_values, synthesized, marks, str(tmp_path), 'env', 5.0)
+    extracted = feature_store.extract_f0(synthesized.data, synthesized.samplerate)
+    assert len(estimated) == len(extracted)
+    voiced = (estimated > 0) & (extracted > 0)
+    assert voiced.sum() > 0.5 * (extracted > 0).sum()
+    assert np.median(np.abs(estimated[voiced] - extracted[voiced]) / extracted[voiced]) < 0.05
+    # marks that do not line up with the words give no estimate
+    assert experiment.estimate_bot_f0(words[:-1], pitch_values, synthesized, marks, str(tmp_path), 'env', 5.0) is None
+
+
+def test_the_world_engine_resynthesizes_the_cached_plain_voice(tmp_path, local_polly):
+    os.makedirs(str(tmp_path / 'env'))
+    words = 'Do you find these changes affect your routines?'.split(' ')
+    pitch_values = np.full(len(words), 15.0)
+    experiment.plain_voice(words, str(tmp_path), 'env')
+    calls = local_polly.calls
+    synthesized, marks = experiment.render_speech(words, str(tmp_path), 'env', 'W1', 'A1', pitch_values, synthesis_engine='world')
+    assert local_polly.calls == calls and marks is None
+    assert synthesized.path.endswith('W1_A1_synthesized.wav') and synthesized.samplerate == experiment.SYNTHESIS_SAMPLE_RATE
+    with open(str(tmp_path / 'env' / 'W1_A1_synthesized_transcript.txt'), encoding='utf-8') as transcript:
+        assert transcript.read() == prosody.build_ssml(words, pitch_values)
+    with pytest.raises(ValueError):
+        experiment.render_speech(words, str(tmp_path), 'env', 'W1', 'A1', pitch_values, synthesis_engine='other')
+
+
+def test_every_condition_is_rendered_in_one_batch(tmp_path, local_polly):
+    os.makedirs(str(tmp_path / 'env'))
+    response = experiment.generate_response()
+    words, syllable_counts = text_plan.syllabify(response)
+    rng = np.random.default_rng(0)
+    f0 = np.where(rng.random(1200) < 0.8, rng.uniform(100, 200, 1200), 0.0)
+    plan = ProsodyPlan(response, words, syllable_counts, f0, rng.normal(-30, 5, 500))
+    rendered = experiment.render_conditions(plan, 'W1', 'A1', str(tmp_path), 'env')
+    assert sorted(rendered) == sorted(condition_name(features) for features in CONDITIONS)
+    for name, audio in rendered.items():
+        assert audio.path.endswith('W1_A1_%s_synthesized.wav' % name) and audio.frames > 0
+    # one Polly call per distinct SSML document
+    assert local_polly.calls == len({chunk for chunks in plan.render_ssml().values() for chunk in chunks})
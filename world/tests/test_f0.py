@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from world import f0
+
+
+def voiced_with_pauses(seconds, fs=8000, seed=0):
+    """A gliding harmonic tone broken by 150 ms pauses every second."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * fs)) / fs
+    hz = 140 + 30 * np.sin(2 * np.pi * 0.4 * t)
+    phase = 2 * np.pi * np.cumsum(hz) / fs
+    x = 0.3 * np.sin(phase) + 0.1 * np.sin(2 * phase)
+    x[(t % 1.0) > 0.85] = 0.0
+    return x + 1e-4 * rng.standard_normal(len(x))
+
+
+def convolved_energy_db(x, fs, frame_period, n_frames):
+    """The original windowed-energy computation, one full convolution."""
+    hop = fs * frame_period / 1000.0
+    window = max(1, int(round(hop)))
+    starts = np.clip(np.round(np.arange(n_frames) * hop).astype(int) - window // 2, 0, max(0, len(x) - window))
+    power = np.convolve(np.square(x), np.ones(window) / window, mode='valid')
+    return 10 * np.log10(power[np.minimum(starts, len(power) - 1)] + 1e-12)
+
+
+@pytest.mark.parametrize('fs,frame_period', [(8000, 5.0), (44100, 5.0), (16000, 1.0)])
+def test_frame_energy_matches_the_convolution(fs, frame_period):
+    x = voiced_with_pauses(3.0, fs)
+    n_frames = f0.frame_count(len(x), fs, frame_period)
+    np.testing.assert_allclose(f0.frame_energy_db(x, fs, frame_period, n_frames),
+                               convolved_energy_db(x, fs, frame_period, n_frames), atol=1e-3)
+
+
+def test_frame_energy_of_a_signal_shorter_than_one_window():
+    x = np.full(10, 0.5)
+    np.testing.assert_allclose(f0.frame_energy_db(x, 8000, 5.0, 3), convolved_energy_db(x, 8000, 5.0, 3))
+
+
+def test_chunks_are_cut_in_pauses():
+    x = voiced_with_pauses(8.0)
+    extractor = f0.ChunkedExtractor(f0.PROFILES['accurate'], chunk_seconds=2.0)
+    n_frames = f0.frame_count(len(x), 8000, 5.0)
+    cuts = extractor.cut_frames(x, 8000, 5.0, n_frames)
+    assert cuts[0] == 0 and cuts[-1] == n_frames and len(cuts) > 2
+    for cut in cuts[1:-1]:
+        assert (cut * 0.005) % 1.0 > 0.85
+
+
+def test_chunked_extraction_has_the_whole_file_frame_grid():
+    x = voiced_with_pauses(8.0)
+    whole = f0.get_extractor('accurate').extract(x, 8000)
+    chunked = f0.ChunkedExtractor(f0.PROFILES['accurate'], chunk_seconds=2.0, min_seconds=4.0, processes=2).extract(x, 8000)
+    assert len(chunked) == len(whole)
+    assert np.mean((chunked > 0) == (whole > 0)) > 0.98
+    voiced = (chunked > 0) & (whole > 0)
+    assert np.median(np.abs(chunked[voiced] - whole[voiced])) < 1.0
+
+
+def test_chunk_pools_split_the_cpus_between_worker_processes(monkeypatch):
+    monkeypatch.setattr(f0, '_pool_processes', None)
+    monkeypatch.setattr(f0.os, 'cpu_count', lambda: 8)
+    f0.configure_pool(workers=3)
+    assert f0._pool_processes == 2
+    f0.configure_pool(workers=16)
+    assert f0._pool_processes == 1
+    f0.configure_pool(6, workers=3)
+    assert f0._pool_processes == 6
+
+
+@pytest.mark.parametrize('profile', sorted(f0.PROFILES))
+def test_every_profile_is_on_the_full_rate_harvest_grid(profile):
+    fs = 44100
+    x = voiced_with_pauses(2.0, fs)
+    reference = f0.get_extractor('accurate').extract(x, fs)
+    contour = f0.get_extractor(profile).extract(x, fs)
+    assert len(contour) == len(reference) == f0.frame_count(len(x), fs, 5.0)
+    voiced = (contour > 0) & (reference > 0)
+    assert voiced.sum() > 0.6 * (reference > 0).sum()
+    assert np.median(np.abs(contour[voiced] - reference[voiced]) / reference[voiced]) < 0.02
+
+
+def test_profiles_are_looked_up_by_name():
+    assert f0.get_extractor(None) is f0.PROFILES[f0.DEFAULT_PROFILE]
+    chunked = f0.get_extractor('chunked-fast')
+    assert isinstance(chunked, f0.ChunkedExtractor) and chunked.base is f0.PROFILES['fast']
+    assert f0.get_extractor('chunked-fast') is chunked
+    with pytest.raises(ValueError):
+        f0.get_extractor('chunked-unknown')
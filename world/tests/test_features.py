@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pyworld as pw
+
+from world import features as feature_store
+from world.features import FeatureStore, feature_key
+
+
+def tone(seconds=0.5, fs=16000, hz=150.0):
+    t = np.arange(int(seconds * fs)) / fs
+    return 0.3 * np.sin(2 * np.pi * hz * t)
+
+
+def test_keys_depend_on_samples_rate_and_parameters():
+    x = tone()
+    key = feature_key(x, 16000, 'harvest', frame_period=5.0)
+    assert key == feature_key(x.copy(), 16000, 'harvest', frame_period=5.0)
+    assert key != feature_key(x, 8000, 'harvest', frame_period=5.0)
+    assert key != feature_key(x, 16000, 'harvest', frame_period=10.0)
+    assert key != feature_key(x.astype(np.float32), 16000, 'harvest', frame_period=5.0)
+    y = x.copy()
+    y[100] += 1e-6
+    assert key != feature_key(y, 16000, 'harvest', frame_period=5.0)
+
+
+def test_features_are_computed_once_and_read_back_from_disk(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'f0': np.arange(5.0)}
+
+    first = store.get_or_compute('ab' * 20, compute)
+    assert store.get_or_compute('ab' * 20, compute) is first
+    assert os.path.exists(os.path.join(str(tmp_path), 'ab', 'ab' * 20 + '.npz'))
+    # a fresh process (empty LRU) reads the stored file
+    np.testing.assert_array_equal(FeatureStore(str(tmp_path)).get_or_compute('ab' * 20, compute)['f0'], np.arange(5.0))
+    assert len(calls) == 1
+    assert not [name for name in os.listdir(os.path.join(str(tmp_path), 'ab')) if name.endswith('.tmp')]
+
+
+def test_the_lru_is_bounded_and_a_memory_store_forgets():
+    store = FeatureStore(cache_size=2)
+    for key in 'abc':
+        store.put(key, {'x': np.zeros(1)})
+    assert store.get('a') is None and store.get('c') is not None
+
+
+def test_extract_f0_matches_harvest_and_hits_the_store(tmp_path, monkeypatch):
+    store = FeatureStore(str(tmp_path))
+    x = tone()
+    expected = pw.harvest(x, 16000, f0_floor=80.0, f0_ceil=270.0, frame_period=5.0)[0]
+    np.testing.assert_array_equal(feature_store.extract_f0(x, 16000, store=store), expected)
+    monkeypatch.setattr(pw, 'harvest', None)
+    np.testing.assert_array_equal(feature_store.extract_f0(x, 16000, store=FeatureStore(str(tmp_path))), expected)
@@ -0,0 +1,20 @@
+import glob
+import os
+import tempfile
+
+from world.benchmarks import hot_paths
+
+
+def test_run_measures_the_selected_benchmarks_and_cleans_up(capsys):
+    pattern = os.path.join(tempfile.gettempdir(), 'pef-bench-*')
+    before = set(glob.glob(pattern))
+    document = hot_paths.run(['write_correlation_data', 'syllabify'], repeats=1, durations=[1.0], sample_rates=[16000],
+                             profiles=['fastest'])
+    assert sorted(document['results']) == ['syllabify', 'write_correlation_data/1s']
+    assert set(glob.glob(pattern)) == before
+
+
+def test_compare_flags_only_slowdowns_past_the_tolerance():
+    baseline = {'results': {'a': {'median': 1.0}, 'b': {'median': 1.0}, 'gone': {'median': 1.0}}}
+    results = {'results': {'a': {'median': 1.2}, 'b': {'median': 1.5}, 'new': {'median': 9.0}}}
+    assert hot_paths.compare(results, baseline, tolerance=0.25) == {'b': 1.5}
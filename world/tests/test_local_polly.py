@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+from botocore.exceptions import ClientError
+
+from world import experiment
+from world.local_polly import LocalPollyClient
+
+SSML = ('<speak><prosody pitch="+0%" volume="+0dB">hello</prosody> <prosody pitch="+20%" volume="+6dB">there</prosody> '
+        '<break time="300ms"/><prosody pitch="-10%">friend.</prosody></speak>')
+
+
+def synthesize(client, **kwargs):
+    request = dict(Text=SSML, TextType='ssml', OutputFormat='pcm', SampleRate='16000', VoiceId='Joanna')
+    request.update(kwargs)
+    return client.synthesize_speech(**request)
+
+
+def test_pcm_audio_lines_up_with_the_word_marks():
+    client = LocalPollyClient(seed=0)
+    pcm = synthesize(client)['AudioStream'].read()
+    marks = [json.loads(line) for line in
+             synthesize(client, OutputFormat='json', SpeechMarkTypes=['word', 'sentence'])['AudioStream'].read().decode().splitlines()]
+    words = [mark for mark in marks if mark['type'] == 'word']
+    assert [mark['value'] for mark in words] == ['hello', 'there', 'friend.']
+    assert [SSML.encode()[mark['start']:mark['end']].decode() for mark in words] == ['hello', 'there', 'friend.']
+    assert [mark['type'] for mark in marks].count('sentence') == 1
+    duration_ms = 1000.0 * len(pcm) / 2 / 16000
+    assert words[0]['time'] < words[1]['time'] < words[2]['time'] < duration_ms
+    # the break adds its pause before the last word
+    assert words[2]['time'] - words[1]['time'] >= 300
+
+
+def test_volume_offsets_change_the_rendered_energy():
+    client = LocalPollyClient(seed=0)
+    loud = synthesize(client, Text='<speak><prosody volume="+6dB">hello there</prosody></speak>')['AudioStream'].read()
+    soft = synthesize(client, Text='<speak><prosody volume="-6dB">hello there</prosody></speak>')['AudioStream'].read()
+    rms = [np.sqrt(np.mean(np.frombuffer(pcm, '<i2').astype(float) ** 2)) for pcm in (loud, soft)]
+    assert rms[0] > 2 * rms[1]
+
+
+def test_calls_above_max_tps_are_throttled():
+    client = LocalPollyClient(max_tps=2, seed=0)
+    synthesize(client)
+    synthesize(client)
+    with pytest.raises(ClientError) as error:
+        synthesize(client)
+    assert error.value.response['Error']['Code'] == 'ThrottlingException'
+    assert (client.calls, client.throttled) == (3, 1)
+
+
+def test_only_pcm_and_speech_marks_are_rendered():
+    with pytest.raises(ClientError) as error:
+        synthesize(LocalPollyClient(), OutputFormat='mp3')
+    assert error.value.response['Error']['Code'] == 'ValidationException'
+
+
+def test_stub_audio_has_its_own_synthesis_cache():
+    assert experiment.STUB_SYNTHESIS_CACHE_DIR != experiment.SYNTHESIS_CACHE_DIR
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from world import loudness
+
+
+def signal(seconds=2.0, fs=16000, seed=0):
+    rng = np.random.default_rng(seed)
+    envelope = np.linspace(0.01, 0.5, int(seconds * fs))
+    return envelope * rng.standard_normal(len(envelope))
+
+
+def test_frames_are_the_rms_of_25ms_windows_every_10ms():
+    fs = 16000
+    x = signal(fs=fs)
+    db = loudness.frame_rms_db(x, fs)
+    expected = [10 * np.log10(np.mean(np.square(x[start:start + 400]))) for start in range(0, len(x) - 399, 160)]
+    np.testing.assert_allclose(db, np.maximum(expected, np.max(expected) - loudness.TOP_DB), atol=1e-6)
+
+
+def test_stereo_is_mixed_down_and_short_signals_have_no_frames():
+    x = signal()
+    np.testing.assert_array_equal(loudness.frame_rms_db(np.column_stack([x, x]), 16000), loudness.frame_rms_db(x, 16000))
+    assert len(loudness.frame_rms_db(x[:100], 16000)) == 0
+
+
+def test_silence_is_floored_and_clipped_to_the_dynamic_range():
+    x = np.concatenate([np.zeros(16000), 0.5 * np.ones(16000)])
+    db = loudness.frame_rms_db(x, 16000)
+    assert db.min() == pytest.approx(db.max() - loudness.TOP_DB)
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 160, 401, 10000])
+def test_the_streaming_meter_matches_the_whole_signal(block_size):
+    x = signal(fs=44100)
+    meter = loudness.LoudnessMeter(44100)
+    for start in range(0, len(x), block_size):
+        meter.update(x[start:start + block_size])
+    assert meter.samples == len(x)
+    np.testing.assert_allclose(meter.db(), loudness.frame_rms_db(x, 44100), atol=1e-9)
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from world import plotting
+
+
+def test_contours_round_trip_at_centihertz_resolution(tmp_path):
+    path = plotting.contours_path(str(tmp_path), '', 'W1', 'A1')
+    bot = np.array([0.0, 120.123, 130.5, 0.0])
+    human = np.array([180.004, 0.0, 175.25])
+    plotting.write_contours(path, bot, human, 5.0)
+    read_bot, read_human, frame_period = plotting.read_contours(path)
+    np.testing.assert_allclose(read_bot, bot, atol=0.005)
+    np.testing.assert_allclose(read_human, human, atol=0.005)
+    assert frame_period == 5.0
+
+
+def test_only_sessions_without_a_current_figure_are_plotted(tmp_path):
+    for worker in ('W1', 'W2'):
+        plotting.write_contours(plotting.contours_path(str(tmp_path), '', worker, 'A1'), np.full(50, 120.0), np.full(60, 150.0), 5.0)
+    assert plotting.plot_all(str(tmp_path), processes=1) == 2
+    assert os.path.exists(str(tmp_path / ('W1_A1' + plotting.FIGURE_SUFFIX)))
+    assert plotting.pending(str(tmp_path)) == []
+    assert plotting.plot_all(str(tmp_path), processes=1) == 0
+    # newer contours make the figure stale again
+    path = plotting.contours_path(str(tmp_path), '', 'W2', 'A1')
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    assert plotting.pending(str(tmp_path)) == [path]
+
+
+def test_the_analysis_does_not_import_matplotlib():
+    code = 'import sys, world.experiment; print("matplotlib" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    assert output.stdout.strip() == 'False', output.stderr
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from world import polly_service
+from world.local_polly import LocalPollyClient
+from world.polly_service import BATCH, LIVE, PollyService, PriorityGate, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_the_bucket_allows_a_burst_then_the_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(polly_service, 'time', clock)
+    bucket = TokenBucket(rate=4, capacity=2)
+    for _ in range(2):
+        bucket.acquire()
+    assert clock.now == 0.0
+    for _ in range(8):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_waiting_live_requests_are_admitted_before_batch_requests():
+    gate = PriorityGate(1)
+    gate.acquire(LIVE)
+    admitted = []
+
+    def request(priority, name):
+        gate.acquire(priority)
+        admitted.append(name)
+        gate.release()
+
+    threads = []
+    for priority, name in [(BATCH, 'batch-1'), (BATCH, 'batch-2'), (LIVE, 'live')]:
+        threads.append(threading.Thread(target=request, args=(priority, name)))
+        threads[-1].start()
+        while gate.waiting() < len(threads):
+            time.sleep(0.001)
+    gate.release()
+    for thread in threads:
+        thread.join()
+    assert admitted == ['live', 'batch-1', 'batch-2']
+    assert gate.active == 0
+
+
+def test_the_service_synthesizes_and_caches_voice_metadata():
+    client = LocalPollyClient()
+    service = PollyService(client, rate=100)
+    audio = service.synthesize('<speak>hello</speak>', 'standard', 'Joanna', 'pcm', sample_rate='16000')
+    assert len(audio) > 0 and len(audio) % 2 == 0
+    marks = service.speech_marks('<speak>hello there</speak>', 'standard', 'Joanna', ['word'])
+    assert marks.decode().count('"word"') == 2
+    fetches = []
+    describe_voices = client.describe_voices
+    client.describe_voices = lambda **kwargs: fetches.append(1) or describe_voices(**kwargs)
+    assert 'Joanna' in service.get_voices('standard', 'en-US').values()
+    service.get_voices('standard', 'en-US')
+    assert len(fetches) == 1
+
+
+def test_the_process_service_is_rebuilt_when_configured():
+    try:
+        polly_service.configure(client=LocalPollyClient(), rate=3.0)
+        service = polly_service.get_service()
+        assert polly_service.get_service() is service and service.bucket.rate == 3.0
+        polly_service.configure(rate=5.0)
+        assert polly_service.get_service() is not service and polly_service.get_service().bucket.rate == 5.0
+    finally:
+        polly_service._service_options.clear()
+        polly_service.configure()
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+from world import polly_tasks
+from world.local_polly import LocalPollyClient, LocalS3Client
+from world.polly_tasks import TaskRequest
+
+FAST = dict(initial_delay=0.01, max_delay=0.05, timeout=10.0)
+
+
+def requests(tmp_path, n=3):
+    return [TaskRequest('<speak>request number %d, spoken slowly.</speak>' % i, str(tmp_path / ('out%d.pcm' % i)),
+                        sample_rate=16000) for i in range(n)]
+
+
+def test_outputs_are_streamed_to_their_files_and_removed_from_s3(tmp_path):
+    s3 = LocalS3Client()
+    polly = LocalPollyClient(s3=s3, task_latency=0.05)
+    statuses = []
+    results = polly_tasks.synthesize_tasks(requests(tmp_path), polly, s3, 'bucket', on_status=lambda i, s: statuses.append(s), **FAST)
+    assert [result['status'] for result in results] == [polly_tasks.COMPLETED] * 3
+    for request, result in zip(requests(tmp_path), results):
+        expected = LocalPollyClient().synthesize_speech(**dict(request.task_kwargs('bucket'), OutputS3BucketName=None))
+        with open(result['path'], 'rb') as output:
+            assert output.read() == expected['AudioStream'].read()
+        assert result['bytes'] == os.path.getsize(result['path'])
+    assert s3.objects == {}
+    assert 'inProgress' in statuses
+
+
+def test_a_throttled_start_only_fails_its_own_task(tmp_path):
+    s3 = LocalS3Client()
+    polly = LocalPollyClient(s3=s3, max_tps=2)
+    results = polly_tasks.synthesize_tasks(requests(tmp_path), polly, s3, 'bucket', initial_delay=1.1, max_delay=1.1, timeout=10.0)
+    statuses = sorted(result['status'] for result in results)
+    assert statuses == [polly_tasks.COMPLETED, polly_tasks.COMPLETED, polly_tasks.ERROR]
+    failed = next(result for result in results if result['status'] == polly_tasks.ERROR)
+    assert 'ThrottlingException' in failed['error'] and failed['task_id'] is None
+    # the tasks that did start were not orphaned
+    assert s3.objects == {}
+
+
+def test_throttled_status_checks_are_retried(tmp_path):
+    s3 = LocalS3Client()
+    polly = LocalPollyClient(s3=s3, throttle_rate=0.3, seed=3)
+    polly_requests = requests(tmp_path, 2)
+    started = []
+    # let the starts through, then throttle the status checks at random
+    rate, polly.throttle_rate = polly.throttle_rate, 0.0
+    original = polly.start_speech_synthesis_task
+
+    def start(**kwargs):
+        response = original(**kwargs)
+        started.append(response)
+        if len(started) == len(polly_requests):
+            polly.throttle_rate = rate
+        return response
+
+    polly.start_speech_synthesis_task = start
+    results = polly_tasks.synthesize_tasks(polly_requests, polly, s3, 'bucket', **FAST)
+    assert [result['status'] for result in results] == [polly_tasks.COMPLETED] * 2
+    assert polly.throttled > 0 and all('error' not in result for result in results)
+
+
+def test_tasks_that_do_not_finish_in_time_time_out(tmp_path):
+    s3 = LocalS3Client()
+    polly = LocalPollyClient(s3=s3, task_latency=60)
+    results = polly_tasks.synthesize_tasks(requests(tmp_path, 1), polly, s3, 'bucket', initial_delay=0.01, timeout=0.1)
+    assert results[0]['status'] == 'timeout'
+
+
+def test_do_synthesis_task_runs_speech_and_viseme_tasks():
+    s3 = LocalS3Client()
+    seen = []
+    audio, visemes = polly_tasks.do_synthesis_task('hello there', LocalPollyClient(s3=s3, task_latency=0.05), s3, 'bucket',
+                                                   audio_format='pcm', include_visemes=True,
+                                                   wait_callback=lambda task_type, status: seen.append(task_type))
+    assert len(audio.read()) > 0
+    assert visemes == []
+    assert set(seen) == {'speech', 'viseme'}
+    assert s3.objects == {}
+
+
+def test_do_synthesis_task_raises_when_a_task_does_not_complete():
+    s3 = LocalS3Client()
+    with pytest.raises(RuntimeError):
+        polly_tasks.do_synthesis_task('hello', LocalPollyClient(s3=s3, task_latency=60), s3, 'bucket', audio_format='pcm',
+                                      timeout=0.1)
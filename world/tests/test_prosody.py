@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from world import prosody
+
+
+def loop_pitch_values(f0, syllable_counts, entrain):
+    """The original per-word loop over the percent-change contour."""
+    f0_no_zeroes = [datapoint for datapoint in f0 if datapoint > 0]
+    mean_f0 = np.mean(f0_no_zeroes)
+    f0_diff_sequence = [x - mean_f0 for x in f0_no_zeroes]
+    f0_mean_sequence = [(x + mean_f0) / 2 for x in f0_no_zeroes]
+    f0_percent_change_sequence = [(x / f0_mean_sequence[i]) * 100 for i, x in enumerate(f0_diff_sequence)]
+    datapoints_per_syllable = len(f0_percent_change_sequence) / sum(syllable_counts)
+    values = []
+    start_index = 0
+    for syllables in syllable_counts:
+        end_index = start_index + int(syllables * datapoints_per_syllable)
+        avg_percent_diff = np.average(f0_percent_change_sequence[start_index:end_index])
+        values.append(round(avg_percent_diff if entrain else -avg_percent_diff, 0))
+        start_index = end_index
+    return values
+
+
+def amplitude_to_custom_db(amplitude, prev_amplitude):
+    if prev_amplitude == 0:
+        prev_amplitude = amplitude
+    result = round(20 * np.log10(abs(amplitude / prev_amplitude) + 1e-9), 6)
+    return 0.000001 if result == 0 else result
+
+
+def loop_volume_values(gradient, syllable_counts, chained):
+    """The original per-word loops: the combined conditions' (chained) and the single-feature conditions'."""
+    values = []
+    prev_mean_amplitude = 0
+    for syllables in syllable_counts:
+        mean_amplitude = np.mean(gradient[:syllables])
+        values.append(amplitude_to_custom_db(mean_amplitude, prev_mean_amplitude))
+        gradient = gradient[syllables:]
+        prev_mean_amplitude = mean_amplitude if chained else np.mean(gradient[:syllables])
+    return values
+
+
+def case(seed, n_frames=1500, n_words=25):
+    rng = np.random.default_rng(seed)
+    f0 = np.where(rng.random(n_frames) < 0.7, rng.uniform(90, 260, n_frames), 0.0)
+    return f0, list(rng.integers(1, 5, n_words))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('entrain', [True, False])
+def test_pitch_values_are_bit_identical_to_the_loop(seed, entrain):
+    f0, syllable_counts = case(seed)
+    np.testing.assert_array_equal(prosody.word_pitch_values(f0, syllable_counts, entrain),
+                                  loop_pitch_values(f0, syllable_counts, entrain))
+
+
+def test_batched_pitch_values_match_one_recording_at_a_time():
+    cases = [case(seed, n_frames=800 + 200 * seed, n_words=10 + seed) for seed in range(4)]
+    batched = prosody.batch_word_pitch_values([f0 for f0, _ in cases], [counts for _, counts in cases])
+    for (f0, counts), values in zip(cases, batched):
+        np.testing.assert_array_equal(values, prosody.word_pitch_values(f0, counts))
+
+
+# the loop takes the mean of an empty slice after the last word
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('chained', [True, False])
+@pytest.mark.parametrize('entrain', [True, False])
+def test_volume_values_are_bit_identical_to_the_loop(seed, chained, entrain):
+    rng = np.random.default_rng(seed)
+    _, syllable_counts = case(seed)
+    loudness = prosody.normalize_db_values(rng.normal(-30, 8, 400), 25, 100) if chained else \
+        prosody.normalize_db_values(rng.normal(-30, 8, 400), 55, 65)
+    gradient = prosody.volume_gradient(loudness, sum(syllable_counts), entrain)
+    np.testing.assert_array_equal(prosody.word_volume_values(gradient, syllable_counts, chained),
+                                  loop_volume_values(gradient, syllable_counts, chained))
+
+
+def long_response(n_sentences=60):
+    return ' '.join('Sentence number %d has a handful of words in it.' % i for i in range(n_sentences)).split(' ')
+
+
+def test_a_short_response_is_one_document():
+    words = 'Hello there, how are you?'.split(' ')
+    assert prosody.build_ssml_chunks(words, [1, 2, 3, 4, 5]) == [prosody.build_ssml(words, [1, 2, 3, 4, 5])]
+
+
+def test_long_responses_are_split_at_sentences_within_the_limits():
+    words = long_response()
+    pitch_values = np.arange(len(words)) % 7 - 3.0
+    volume_values = np.linspace(-2, 2, len(words))
+    chunks = prosody.build_ssml_chunks(words, pitch_values, volume_values, max_chars=1500, max_billed_chars=400)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1500 for chunk in chunks)
+    whole = prosody.build_ssml(words, pitch_values, volume_values)
+    assert '<speak>' + ''.join(chunk[len('<speak>'):-len('</speak>')] for chunk in chunks) + '</speak>' == whole
+    assert all(chunk.endswith('.</prosody></speak>') for chunk in chunks)
+
+
+def test_a_sentence_longer_than_a_request_is_split_between_words():
+    words = ['word'] * 50 + ['end.']
+    ranges = prosody.chunk_ranges(words, [word + ' ' for word in words], max_chars=100)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(words) and len(ranges) > 1
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    with pytest.raises(ValueError):
+        prosody.chunk_ranges(['x' * 200], ['x' * 200], max_chars=100)
+
+
+def test_plain_chunks_keep_the_words_in_order():
+    words = long_response()
+    chunks = prosody.build_plain_ssml_chunks(words, max_chars=600)
+    assert len(chunks) > 1
+    assert ' '.join(chunk[len('<speak>'):-len('</speak>')] for chunk in chunks) == ' '.join(words)
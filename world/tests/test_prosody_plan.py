@@ -0,0 +1,38 @@
+import numpy as np
+
+from world import prosody, text_plan
+from world.prosody_plan import CONDITIONS, ProsodyPlan, condition_name
+
+RESPONSE = 'That sounds like a lovely idea. Tell me more about it!'
+
+
+def plan():
+    rng = np.random.default_rng(0)
+    f0 = np.where(rng.random(800) < 0.8, 120 + 30 * np.sin(np.linspace(0, 9, 800)), 0.0)
+    words, syllable_counts = text_plan.syllabify(RESPONSE)
+    return ProsodyPlan(RESPONSE, words, syllable_counts, f0, np.linspace(-40, -10, 300) + rng.normal(0, 3, 300))
+
+
+def test_pitch_values_reproduce_the_original_conditions():
+    p = plan()
+    entrained, disentrained = (prosody.word_pitch_values(p.f0, p.syllable_counts, entrain) for entrain in (True, False))
+    assert not np.array_equal(entrained, disentrained)
+    for features in CONDITIONS:
+        values = p.values(features)
+        if values is None or values[1] is None:
+            continue
+        # combined arms always carried the entrained pitch: the original negated the waveform, which leaves F0 unchanged
+        combined = len(features) == 2
+        expected = entrained if 'entrain-pitch' in features or combined else disentrained
+        np.testing.assert_array_equal(values[1], expected, err_msg=condition_name(features))
+
+
+def test_combined_arms_differ_only_in_volume():
+    p = plan()
+    for volume in ('entrain-volume', 'disentrain-volume'):
+        assert p.ssml(('entrain-pitch', volume)) == p.ssml(('disentrain-pitch', volume))
+    assert p.ssml(('entrain-pitch', 'entrain-volume')) != p.ssml(('entrain-pitch', 'disentrain-volume'))
+
+
+def test_no_features_is_the_plain_response():
+    assert plan().ssml(()) == ['<speak>' + RESPONSE + '</speak>']
@@ -0,0 +1,52 @@
+import numpy as np
+import pyworld as pw
+
+from world import resynthesis
+from world.features import FeatureStore
+
+
+def voice(seconds=1.0, fs=16000, hz=130.0):
+    t = np.arange(int(seconds * fs)) / fs
+    phase = 2 * np.pi * hz * t
+    return 0.3 * sum(np.sin(k * phase) / k for k in range(1, 6))
+
+
+def test_words_are_placed_from_spans_or_spread_over_the_voiced_stretch():
+    starts, ends = resynthesis.word_frames(100, np.zeros(100), [1, 1], (np.array([0.0, 200.0]), np.array([200.0, 600.0])))
+    np.testing.assert_array_equal(starts, [0, 40])
+    np.testing.assert_array_equal(ends, [40, 100])
+    f0 = np.concatenate([np.zeros(10), np.full(80, 120.0), np.zeros(10)])
+    starts, ends = resynthesis.word_frames(100, f0, [1, 3])
+    np.testing.assert_array_equal(starts, [0, 30])
+    np.testing.assert_array_equal(ends, [30, 100])
+
+
+def test_prosody_scales_each_words_pitch_and_power():
+    f0, sp = np.full(10, 100.0), np.ones((10, 3))
+    scaled_f0, scaled_sp = resynthesis.apply_prosody(f0, sp, [0, 5], [5, 10], [10.0, -20.0], [0.0, 10.0])
+    np.testing.assert_allclose(scaled_f0, [110.0] * 5 + [80.0] * 5)
+    np.testing.assert_allclose(scaled_sp[:5], 1.0)
+    np.testing.assert_allclose(scaled_sp[5:], 10.0)
+    assert f0[0] == 100.0 and sp[9, 0] == 1.0
+
+
+def test_resynthesis_raises_the_pitch_and_reuses_the_decomposition(tmp_path, monkeypatch):
+    from world import features as feature_store
+
+    monkeypatch.setattr(feature_store, 'get_store', lambda root=None, store=FeatureStore(str(tmp_path)): store)
+    fs = 16000
+    x = voice()
+    y = resynthesis.resynthesize(x, fs, [1, 1], pitch_values=[20.0, 20.0])
+    # WORLD renders whole frames
+    assert abs(len(y) - len(x)) <= 0.005 * fs * 2 and np.max(np.abs(y)) <= 0.99
+    before = pw.harvest(x, fs, frame_period=5.0)[0]
+    after = pw.harvest(y, fs, frame_period=5.0)[0][:len(before)]
+    voiced = (before > 0) & (after > 0)
+    assert abs(np.median(after[voiced] / before[voiced]) - 1.2) < 0.03
+    monkeypatch.setattr(pw, 'harvest', None)
+    resynthesis.resynthesize(x, fs, [1, 1], volume_values=[-6.0, 0.0])
+
+
+def test_float_samples_are_clipped_into_16_bit_pcm():
+    pcm = np.frombuffer(resynthesis.to_pcm(np.array([0.0, 0.5, -1.5, 2.0])), dtype='<i2')
+    np.testing.assert_array_equal(pcm, [0, 16384, -32767, 32767])
@@ -0,0 +1,40 @@
+import numpy as np
+
+from world import speech_marks
+
+MARKS = (b'{"time":0,"type":"sentence","start":7,"end":18,"value":"Hello there"}\n'
+         b'{"time":6,"type":"word","start":7,"end":12,"value":"Hello"}\n'
+         b'{"time":373,"type":"word","start":13,"end":18,"value":"there"}\n')
+
+
+def test_marks_are_parsed_and_filtered():
+    assert [mark['type'] for mark in speech_marks.parse_marks(MARKS)] == ['sentence', 'word', 'word']
+    assert [mark['value'] for mark in speech_marks.parse_marks(MARKS.decode(), 'word')] == ['Hello', 'there']
+
+
+def test_joined_marks_are_shifted_by_the_preceding_chunks():
+    words = speech_marks.parse_marks(MARKS, 'word')
+    joined = speech_marks.join_marks([words, words], [800.0, 800.0])
+    assert [mark['time'] for mark in joined] == [6, 373, 806, 1173]
+    starts, ends = speech_marks.word_spans(joined, 1600.0)
+    np.testing.assert_array_equal(starts, [6, 373, 806, 1173])
+    np.testing.assert_array_equal(ends, [373, 806, 1173, 1600])
+
+
+def test_the_bot_contour_stretches_and_shifts_each_word():
+    baseline = np.concatenate([np.full(10, 100.0), np.zeros(2), np.full(10, 200.0)])
+    baseline_spans = (np.array([0.0, 60.0]), np.array([60.0, 110.0]))
+    # the entrained speech says the first word twice as slowly, and raises the second by 10%
+    spans = (np.array([0.0, 120.0]), np.array([120.0, 170.0]))
+    contour = speech_marks.bot_contour(baseline, baseline_spans, spans, [0.0, 10.0], 5.0, 40)
+    np.testing.assert_array_equal(contour[:20], 100.0)
+    np.testing.assert_array_equal(contour[20:24], 0.0)
+    np.testing.assert_allclose(contour[24:34], 220.0)
+    np.testing.assert_array_equal(contour[34:], 0.0)
+
+
+def test_identical_spans_and_no_pitch_change_give_the_baseline_back():
+    rng = np.random.default_rng(0)
+    baseline = np.where(rng.random(200) < 0.8, rng.uniform(100, 200, 200), 0.0)
+    spans = (np.arange(0, 1000, 100.0), np.arange(100, 1001, 100.0))
+    np.testing.assert_array_equal(speech_marks.bot_contour(baseline, spans, spans, np.zeros(10), 5.0, 200), baseline)
@@ -0,0 +1,90 @@
+import os
+import threading
+
+import pytest
+
+from world import synthesis_cache
+from world.synthesis_cache import SynthesisCache, synthesis_key
+
+
+def test_keys_cover_every_parameter_that_changes_the_audio():
+    key = synthesis_key('<speak>hi</speak>', 'Joanna', 'standard', 'pcm', 16000)
+    assert key == synthesis_key('<speak>hi</speak>', 'Joanna', 'standard', 'pcm', 16000.0)
+    assert len({key, synthesis_key('<speak>hi</speak>', 'Matthew', 'standard', 'pcm', 16000),
+                synthesis_key('<speak>hi</speak>', 'Joanna', 'neural', 'pcm', 16000),
+                synthesis_key('<speak>hi</speak>', 'Joanna', 'standard', 'mp3', 16000),
+                synthesis_key('<speak>hi</speak>', 'Joanna', 'standard', 'pcm', 8000)}) == 5
+
+
+def test_a_miss_synthesizes_once_and_then_hits(tmp_path):
+    cache = SynthesisCache(str(tmp_path))
+    calls = []
+
+    def synthesize():
+        calls.append(1)
+        return b'audio'
+
+    assert cache.get_or_synthesize('k' * 64, synthesize) == b'audio'
+    assert cache.get_or_synthesize('k' * 64, synthesize) == b'audio'
+    assert cache.get_or_synthesize('n' * 64, lambda: None) is None
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['bytes']) == (1, 2, 1, 5)
+
+
+def test_eviction_drops_the_least_recently_used_entries(tmp_path):
+    cache = SynthesisCache(str(tmp_path), max_bytes=250)
+    for i in range(3):
+        cache.put('%02d' % i + 'x' * 62, b'a' * 100)
+    assert cache.get('00' + 'x' * 62) is None
+    assert cache.evictions == 1 and cache.stats()['bytes'] == 200
+
+
+def test_puts_under_the_limit_do_not_scan_the_directory(tmp_path, monkeypatch):
+    cache = SynthesisCache(str(tmp_path), max_bytes=10 ** 6)
+    scans = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, 'entries', lambda: scans.append(1) or entries())
+    writes = synthesis_cache.RESCAN_EVERY * 2 - 2
+    for i in range(writes):
+        cache.put('%04d' % i + 'x' * 60, b'a' * 10)
+    # the first write, then one rescan every RESCAN_EVERY writes
+    assert len(scans) == 2
+    # rewriting an entry does not grow the estimate
+    cache.put('0000' + 'x' * 60, b'b' * 10)
+    assert len(scans) == 2 and cache._size == writes * 10
+
+
+def test_counters_are_exact_under_concurrent_hits(tmp_path):
+    cache = SynthesisCache(str(tmp_path))
+    cache.put('k' * 64, b'audio')
+
+    def lookups():
+        for _ in range(200):
+            cache.get_or_synthesize('k' * 64, lambda: None)
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()['hits'] == 1600
+
+
+def test_a_failed_synthesis_leaves_no_lock_file(tmp_path):
+    cache = SynthesisCache(str(tmp_path))
+
+    def synthesize():
+        raise RuntimeError('throttled')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_synthesize('k' * 64, synthesize)
+    assert [name for _, _, names in os.walk(str(tmp_path)) for name in names] == []
+
+
+def test_counters_do_not_scan_the_directory(tmp_path, monkeypatch):
+    cache = SynthesisCache(str(tmp_path))
+    cache.get_or_synthesize('k' * 64, lambda: b'audio')
+    monkeypatch.setattr(cache, 'entries', lambda: 1 / 0)
+    counters = cache.counters()
+    assert (counters['hits'], counters['misses'], counters['tracked_bytes']) == (0, 1, 5)
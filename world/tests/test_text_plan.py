@@ -0,0 +1,38 @@
+import re
+
+import numpy as np
+from pysyllables import get_syllable_count
+
+from world import text_plan
+
+
+def original_counts(response):
+    """The per-condition syllable counting the compiled plans replace."""
+    split_response = response.split(' ')
+    stripped_split_response = [re.sub(r'\W+', '', word) for word in split_response if word]
+    return [get_syllable_count(w) if get_syllable_count(w) is not None else get_syllable_count(split_response[i])
+            for i, w in enumerate(stripped_split_response)]
+
+
+def test_counts_match_the_original_for_known_words():
+    response = ("I appreciate your comprehensive weather summary. It's interesting to hear the changes "
+                "from last week to this week. Do you find these changes affect your daily routines?")
+    words, counts = text_plan.syllabify(response)
+    assert words == response.split(' ')
+    assert counts == original_counts(response)
+
+
+def test_unknown_words_fall_back_to_the_heuristic():
+    words, counts = text_plan.syllabify('Zorblaxian quoggle 42 hello')
+    assert len(counts) == 4 and all(count >= 1 for count in counts)
+    assert text_plan.heuristic_syllables('quoggle') == 2
+    assert text_plan.heuristic_syllables('make') == 1 and text_plan.heuristic_syllables('xyz') == 1
+
+
+def test_plans_are_compiled_once_and_read_only():
+    text = 'A response compiled once.'
+    plan = text_plan.compile_response(text)
+    assert text_plan.compile_response(text) is plan
+    assert [p.text for p in text_plan.compile_responses([text, 'Another one.'])] == [text, 'Another one.']
+    assert not plan.syllable_counts.flags.writeable
+    assert isinstance(plan.syllable_counts, np.ndarray)
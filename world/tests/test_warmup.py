@@ -0,0 +1,21 @@
+import json
+import os
+import subprocess
+import sys
+
+from world import warmup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_warm_up_runs_every_step_once_per_profile():
+    timings = warmup.warm_up((None, 'chunked-fast'))
+    assert {'import', 'decode', 'f0 accurate', 'f0 fast', 'loudness', 'compile response', 'prosody plan', 'ssml'} == set(timings)
+    assert all(seconds >= 0 for seconds in timings.values())
+
+
+def test_preload_freezes_the_heap_without_creating_fork_unsafe_state():
+    code = ('import gc, json; from world import warmup, f0, polly_service; warmup.preload(); '
+            'print(json.dumps([gc.get_freeze_count() > 0, f0._pool is None, polly_service._service is None]))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT)
+    assert json.loads(output.stdout.strip().splitlines()[-1]) == [True, True, True], output.stderr
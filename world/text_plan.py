@@ -0,0 +1,65 @@
+"""Compiled bot responses: tokens, stripped forms and syllable counts, computed once per text.
+
+The analysis needs each response word and its syllable count. That only
+depends on the response text, so a response is compiled once (and cached)
+instead of being re-split, re-stripped and looked up again for every worker
+and every condition. `compile_responses` compiles a whole bank of responses
+at startup.
+
+Syllable counts come from pysyllables, memoized per word. Words it does not
+know (names, numbers, typos) fall back to a vowel-group heuristic instead of
+None, so an unusual response can no longer crash the analysis.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from pysyllables import get_syllable_count
+
+VOWEL_GROUPS = re.compile(r'[aeiouy]+')
+NON_WORD = re.compile(r'\W+')
+
+ResponsePlan = namedtuple('ResponsePlan', ['text', 'tokens', 'stripped', 'syllable_counts'])
+
+
+def heuristic_syllables(word):
+    """Rough syllable count: vowel groups, less a silent final 'e'; at least 1."""
+    word = word.lower()
+    count = len(VOWEL_GROUPS.findall(word))
+    if count > 1 and word.endswith('e') and not word.endswith(('le', 'ee')):
+        count -= 1
+    return max(1, count)
+
+
+@lru_cache(maxsize=None)
+def syllable_count(word, fallback_word=None):
+    """Syllables of a (stripped) word: pysyllables, then `fallback_word` (the unstripped token), then the heuristic."""
+    count = get_syllable_count(word)
+    if count is None and fallback_word is not None:
+        count = get_syllable_count(fallback_word)
+    if count is None:
+        count = heuristic_syllables(fallback_word if not word and fallback_word else word)
+    return count
+
+
+@lru_cache(maxsize=1024)
+def compile_response(text):
+    """Splits a response into tokens and counts the syllables of every non-empty one."""
+    tokens = tuple(text.split(' '))
+    stripped = tuple(NON_WORD.sub('', token) for token in tokens if token)
+    # as before, the unstripped fallback is looked up by position in the full token list
+    counts = np.array([syllable_count(word, tokens[i]) for i, word in enumerate(stripped)], dtype=int)
+    counts.setflags(write=False)
+    return ResponsePlan(text, tokens, stripped, counts)
+
+
+def compile_responses(texts):
+    """Compiles a bank of responses (e.g. at startup); returns their plans in order."""
+    return [compile_response(text) for text in texts]
+
+
+def syllabify(response):
+    """(words, syllable counts) of a response, from its compiled plan."""
+    plan = compile_response(response)
+    return list(plan.tokens), list(plan.syllable_counts)
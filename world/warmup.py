@@ -0,0 +1,81 @@
+"""Imports and warms the analysis stack once in a parent process, before it forks its workers.
+
+`preload` imports world.experiment (pyworld, scipy, pysyllables, the Polly
+service modules), runs every lazily initialised path once on a short
+synthetic tone — WAV decoding, Harvest and the other configured F0
+estimators at the common sample rates, loudness, the compiled response and
+its prosody plan — and then calls `gc.freeze()`. Forked workers inherit all
+of it copy-on-write: nothing is imported twice, the first job is as fast as
+the rest, and the frozen objects are never touched by the collector, so
+their pages stay shared.
+
+Nothing that is unsafe to fork is created here: no boto3 clients (see
+polly_service.get_service) and no process pools (chunked profiles are warmed
+through their base estimator).
+"""
+import gc
+import time
+
+import numpy as np
+
+WARMUP_SAMPLE_RATES = (16000, 44100)
+WARMUP_SECONDS = 0.5
+
+
+def synthetic_tone(seconds=WARMUP_SECONDS, fs=16000, f0_hz=150.0):
+    """A few harmonics of a slowly gliding tone, enough for every estimator to find voicing."""
+    t = np.arange(int(seconds * fs)) / fs
+    phase = 2 * np.pi * np.cumsum(f0_hz * (1 + 0.1 * t / seconds)) / fs
+    return 0.3 * sum(np.sin(k * phase) / k for k in range(1, 6))
+
+
+def warm_up(profiles=(None,)):
+    """Imports the analysis stack and runs each lazily initialised path once; returns {step: seconds}."""
+    timings = {}
+
+    def step(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return result
+
+    def import_stack():
+        import boto3
+        import botocore.config
+        from world import experiment
+        return experiment
+
+    from world import f0, loudness
+    from world.audio import AudioAsset, pcm_to_wav
+    from world.prosody_plan import ProsodyPlan
+
+    experiment = step('import', import_stack)
+    for fs in WARMUP_SAMPLE_RATES:
+        x = synthetic_tone(fs=fs)
+        asset = step('decode', AudioAsset, pcm_to_wav((x * 32767).astype('<i2').tobytes(), fs))
+        for profile in profiles:
+            profile = profile or f0.DEFAULT_PROFILE
+            if profile.startswith(f0.CHUNKED_PREFIX):
+                profile = profile[len(f0.CHUNKED_PREFIX):]
+            step('f0 ' + profile, f0.get_extractor(profile).extract, asset.data, fs)
+        loudness_db = step('loudness', loudness.frame_rms_db, asset.data, fs)
+
+    contour = f0.get_extractor(None).extract(asset.data, asset.samplerate)
+    response = experiment.generate_response()
+    words, syllable_counts = step('compile response', experiment.text_plan.syllabify, response)
+    plan = step('prosody plan', ProsodyPlan, response, words, syllable_counts, contour, loudness_db)
+    step('ssml', plan.render_ssml)
+    return timings
+
+
+def freeze():
+    """Collects, then moves every surviving object out of the collector's reach (see gc.freeze)."""
+    gc.collect()
+    gc.freeze()
+
+
+def preload(profiles=(None,)):
+    """`warm_up`, then `freeze`; call it in the parent right before forking. Returns the warm-up timings."""
+    timings = warm_up(profiles)
+    freeze()
+    return timings